@@ -90,6 +90,30 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Rekomendacje książek: 'locmem' (osobny cache w każdym procesie) albo 'file'
+# (wspólny katalog dla wszystkich workerów)
+
+RECOMMENDATION_CACHE_BACKEND = os.environ.get('RECOMMENDATION_CACHE_BACKEND', 'locmem')
+RECOMMENDATION_CACHE_TIMEOUT = int(os.environ.get('RECOMMENDATION_CACHE_TIMEOUT', 3600))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('RECOMMENDATION_CACHE_DIR', str(BASE_DIR / 'cache' / 'recommendations')),
+        'TIMEOUT': RECOMMENDATION_CACHE_TIMEOUT,
+    } if RECOMMENDATION_CACHE_BACKEND == 'file' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations',
+        'TIMEOUT': RECOMMENDATION_CACHE_TIMEOUT,
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -171,6 +195,24 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Artefakty modeli ML (indeksy, macierze) zapisywane przez zadania wsadowe
+ML_ARTIFACTS_DIR = os.environ.get('ML_ARTIFACTS_DIR', str(BASE_DIR / 'ml_artifacts'))
+
+# Ważenie opisu i słów kluczowych w wektorach książek: 'tf' lub 'tfidf' (model korpusowy)
+BOOK_VECTOR_WEIGHTING = os.environ.get('BOOK_VECTOR_WEIGHTING', 'tf')
+
+# Metoda podobieństw serwowana przez API: 'aspects' (ważone aspekty) lub 'lsa'
+# (osadzenia TruncatedSVD); obie mogą być policzone obok siebie (pole `version`)
+BOOK_SIMILARITY_METHOD = os.environ.get('BOOK_SIMILARITY_METHOD', 'aspects')
+LSA_COMPONENTS = int(os.environ.get('LSA_COMPONENTS', 128))
+
+# Budowa indeksu kandydatów (dekoduje wszystkie BookVector) przy starcie workera;
+# domyślnie indeks powstaje leniwie przy pierwszym żądaniu, które go potrzebuje
+SIMILARITY_WARM_UP_CANDIDATE_INDEX = os.environ.get('SIMILARITY_WARM_UP_CANDIDATE_INDEX', 'false').lower() == 'true'
+
+# Liczba czynników ukrytych rekomendacji z faktoryzacji macierzy ocen
+MF_FACTORS = int(os.environ.get('MF_FACTORS', 64))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -13,7 +13,7 @@ from rest_framework_simplejwt.views import (
 from ml_api import views_lists
 import json
 
-from ml_api.views import book_recommendations, similarity_stats, recalculate_similarities
+from ml_api.views import book_recommendations, batch_book_recommendations, similarity_stats, recalculate_similarities
 from ml_api import views_preferences, views_recommendations
 
 def api_root(request):
@@ -383,6 +383,7 @@ urlpatterns = [
     # SIMILARITY ENDPOINTS
     path('api/books/<int:book_id>/recommendations/', book_recommendations, name='book_recommendations'),
     path('api/books/<int:book_id>/similar/', book_recommendations, name='similar_books'),
+    path('api/books/similar/batch/', batch_book_recommendations, name='batch_similar_books'),
     path('api/similarities/stats/', similarity_stats, name='similarity_stats'),
     path('api/similarities/recalculate/', recalculate_similarities, name='recalculate_all_similarities'),
     path('api/similarities/recalculate/<int:book_id>/', recalculate_similarities, name='recalculate_book_similarities'),
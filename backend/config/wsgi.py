@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Rozgrzej serwis podobieństw raz przy starcie workera - tylko wczytanie
+# istniejących danych (słownik cech, modele, indeks ANN, magazyn sąsiadów)
+from ml_api.services.similarity_service import get_similarity_service  # noqa: E402
+
+try:
+    get_similarity_service().warm_up()
+except Exception as e:
+    # Worker i tak wystartuje - zasoby załadują się leniwie przy pierwszym żądaniu
+    print(f"⚠️  Similarity service warm-up failed: {e}")
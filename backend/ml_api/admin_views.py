@@ -101,9 +101,9 @@ def admin_dashboard(request):
         
         # Similarity stats
         similarity_stats = {
-            'book_similarities': BookSimilarity.objects.count(),
+            'book_similarities': BookSimilarity.live().count(),
             'user_similarities': UserSimilarity.objects.count(),
-            'avg_book_similarity': BookSimilarity.objects.aggregate(
+            'avg_book_similarity': BookSimilarity.live().aggregate(
                 avg=Avg('cosine_similarity')
             )['avg'] or 0
         }
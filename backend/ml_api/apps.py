@@ -7,3 +7,4 @@ class MlApiConfig(AppConfig):
 
     def ready(self):
         import ml_api.signals_gamification  # Import signals
+        import ml_api.signals_similarity  # Unieważnianie cache rekomendacji
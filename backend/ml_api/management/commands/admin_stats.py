@@ -42,7 +42,7 @@ class Command(BaseCommand):
         self.stdout.write(f'   Average rating: {avg_rating:.2f}/10')
         
         # Similarities
-        book_sims = BookSimilarity.objects.count()
+        book_sims = BookSimilarity.live().count()
         
         self.stdout.write(f'\nSIMILARITIES:')
         self.stdout.write(f'   Book similarities: {book_sims}')
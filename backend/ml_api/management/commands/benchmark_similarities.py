@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import time
+import platform
+from contextlib import contextmanager
+
+import numpy as np
+import scipy
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ml_api.services.similarity_service import BookSimilarityService
+from ml_api.services.similarity_engine import SparseSimilarityEngine
+from ml_api.services.similarity_writer import SimilarityWriter
+from ml_api.services.synthetic_catalog import generate_catalog
+from ml_api.services.tfidf_model import CorpusTfidfModel
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Etapy krótsze niż ten próg (sekundy) nie są porównywane z bazą - szum pomiaru
+MIN_COMPARABLE_SECONDS = 0.05
+
+# Liczba par powyżej progu rośnie kwadratowo (5k książek to już ~8M par) -
+# powyżej tego rozmiaru etap pair_scoring jest domyślnie pomijany
+DEFAULT_PAIR_SCORING_MAX_BOOKS = 5000
+
+
+def peak_rss_mb():
+    """Szczytowe zużycie pamięci procesu (RSS) w MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux podaje KB, macOS bajty
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the book similarity pipeline on synthetic catalogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000',
+            help='Comma separated catalog sizes (default: 1000,10000)',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=20,
+            help='Neighbours kept per book in the top-K stage (default: 20)',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=1000,
+            help='Rows per block in the sparse engine (default: 1000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Worker processes for block scoring (default: 1)',
+        )
+        parser.add_argument(
+            '--min-similarity',
+            type=float,
+            default=None,
+            help='Similarity threshold (default: the service threshold)',
+        )
+        parser.add_argument(
+            '--writer',
+            choices=['bulk', 'copy'],
+            default='bulk',
+            help='Write method benchmarked in the write stage (default: bulk)',
+        )
+        parser.add_argument(
+            '--write-batch-size',
+            type=int,
+            default=5000,
+            help='Rows per write round trip (default: 5000)',
+        )
+        parser.add_argument(
+            '--skip-pair-scoring',
+            action='store_true',
+            help='Skip the threshold (all pairs above the threshold) scoring stage',
+        )
+        parser.add_argument(
+            '--pair-scoring-max-books',
+            type=int,
+            default=DEFAULT_PAIR_SCORING_MAX_BOOKS,
+            help=f'Skip the threshold scoring stage for larger catalogs (default: {DEFAULT_PAIR_SCORING_MAX_BOOKS})',
+        )
+        parser.add_argument(
+            '--skip-write',
+            action='store_true',
+            help='Skip the database write stage',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed of the synthetic catalog (default: 42)',
+        )
+        parser.add_argument(
+            '--output',
+            help='JSON report path (default: ML_ARTIFACTS_DIR/benchmarks/similarity_<timestamp>.json)',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Previous JSON report - fail when a stage is slower by more than --tolerance',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed slowdown against --baseline as a fraction (default: 0.2)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers')
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'parameters': {
+                key: options[key] for key in (
+                    'top_k', 'block_size', 'workers', 'min_similarity', 'writer',
+                    'write_batch_size', 'skip_pair_scoring', 'pair_scoring_max_books', 'skip_write', 'seed'
+                )
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'scipy': scipy.__version__,
+                'platform': platform.platform(),
+                'text_weighting': settings.BOOK_VECTOR_WEIGHTING,
+            },
+            'runs': [],
+        }
+
+        # Rosnące rozmiary - szczytowy RSS kolejnego przebiegu nie jest zawyżany przez poprzedni
+        for size in sorted(sizes):
+            self.stdout.write(f"🏁 Benchmarking {size} books...")
+            run = self.benchmark_catalog(size, options)
+            report['runs'].append(run)
+            self.print_run(run)
+
+        output = options['output'] or os.path.join(
+            settings.ML_ARTIFACTS_DIR, 'benchmarks',
+            f"similarity_{timezone.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f"📄 Report written to {output}"))
+
+        if options['baseline']:
+            self.compare_with_baseline(report, options['baseline'], options['tolerance'])
+
+    @contextmanager
+    def stage(self, stages, name):
+        """Zmierz czas etapu i szczytowy RSS po jego zakończeniu"""
+        result = {}
+        started = time.perf_counter()
+        yield result
+        # Etap może sam podać zmierzony czas (np. tylko zapis, bez liczenia bloków)
+        result['seconds'] = round(result.pop('seconds', time.perf_counter() - started), 4)
+        result['peak_rss_mb'] = peak_rss_mb()
+        stages[name] = result
+
+    def benchmark_catalog(self, size, options):
+        service = BookSimilarityService()
+        if options['min_similarity'] is not None:
+            service.min_similarity_threshold = options['min_similarity']
+        # Stop words poza pomiarem - ładowane raz na proces
+        service._ensure_nltk_data()
+
+        stages = {}
+
+        with self.stage(stages, 'generate') as result:
+            books = generate_catalog(size, seed=options['seed'])
+            result['books'] = len(books)
+
+        with self.stage(stages, 'extraction') as result:
+            all_features = service.extract_features_batch(books)
+            result['description_words'] = sum(len(features['description_words']) for features in all_features)
+
+        with self.stage(stages, 'vectorization') as result:
+            text_vectors = [None] * len(books)
+            if service.text_weighting == 'tfidf':
+                # Model korpusowy dopasowany w pamięci (bez zapisu na dysk)
+                service._tfidf_model = CorpusTfidfModel().fit({
+                    'description': [features['description_words'] for features in all_features],
+                    'keyword': [features['keywords'] for features in all_features],
+                })
+                text_vectors = service.tfidf_text_vectors(all_features)
+
+            vectors = [
+                service.create_book_vector(book, features=features, text_vectors=text_vector)
+                for book, features, text_vector in zip(books, all_features, text_vectors)
+            ]
+
+            engine = SparseSimilarityEngine(
+                service.category_weights,
+                min_similarity=service.min_similarity_threshold,
+                block_size=options['block_size']
+            )
+            matrices = engine.build_matrices(vectors)
+            result['features'] = int(matrices['combined'].shape[1])
+            result['nonzeros'] = int(matrices['combined'].nnz)
+
+        book_ids = [book.id for book in books]
+        del vectors, all_features
+
+        if options['skip_pair_scoring']:
+            pass
+        elif size > options['pair_scoring_max_books']:
+            self.stdout.write(f"   pair_scoring skipped ({size} books > --pair-scoring-max-books)")
+        else:
+            with self.stage(stages, 'pair_scoring') as result:
+                result['pairs'] = sum(
+                    len(batch['book1_id'])
+                    for batch in engine.iter_similarity_batches(matrices, book_ids, workers=options['workers'])
+                )
+
+        engine.top_k = options['top_k']
+        with self.stage(stages, 'top_k') as result:
+            # Strumieniowo - partie są tylko liczone, nie trzymane w pamięci
+            result['pairs'] = sum(
+                len(batch['book1_id'])
+                for batch in engine.iter_similarity_batches(matrices, book_ids, workers=options['workers'])
+            )
+
+        if not options['skip_write']:
+            with self.stage(stages, 'write') as result:
+                # Synthetic IDs nie istnieją w `books` - zapis jest wycofywany
+                # (klucze obce są sprawdzane dopiero przy commit)
+                with transaction.atomic():
+                    writer = SimilarityWriter(
+                        method=options['writer'],
+                        batch_size=options['write_batch_size'],
+                        generation=service._next_generation()
+                    )
+                    # Partie liczone ponownie strumieniowo - mierzony jest tylko zapis
+                    write_seconds = 0.0
+                    for batch in engine.iter_similarity_batches(matrices, book_ids, workers=options['workers']):
+                        started = time.perf_counter()
+                        writer.write_batch(batch)
+                        write_seconds += time.perf_counter() - started
+                    transaction.set_rollback(True)
+                result['seconds'] = write_seconds
+                stats = writer.report()
+                result.update(method=stats['method'], rows=stats['rows'], rows_per_second=stats['rows_per_second'])
+
+        return {
+            'books': size,
+            'total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': stages,
+        }
+
+    def print_run(self, run):
+        for name, stage in run['stages'].items():
+            extra = ', '.join(
+                f"{key}={value}" for key, value in stage.items()
+                if key not in ('seconds', 'peak_rss_mb')
+            )
+            self.stdout.write(
+                f"   {name:<14} {stage['seconds']:>9.3f}s  peak {stage['peak_rss_mb']} MB"
+                + (f"  ({extra})" if extra else '')
+            )
+        self.stdout.write(f"   {'total':<14} {run['total_seconds']:>9.3f}s")
+
+    def compare_with_baseline(self, report, baseline_path, tolerance):
+        """Porównaj czasy etapów z poprzednim raportem (ten sam rozmiar katalogu)"""
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+        baseline_runs = {run['books']: run for run in baseline.get('runs', [])}
+        regressions = []
+
+        for run in report['runs']:
+            previous = baseline_runs.get(run['books'])
+            if previous is None:
+                continue
+
+            for name, stage in run['stages'].items():
+                before = previous['stages'].get(name, {}).get('seconds')
+                if before is None or before < MIN_COMPARABLE_SECONDS:
+                    continue
+
+                change = stage['seconds'] / before - 1
+                marker = '⚠️ ' if change > tolerance else '  '
+                self.stdout.write(
+                    f"{marker}{run['books']:>7} books {name:<14} {before:.3f}s -> {stage['seconds']:.3f}s ({change:+.0%})"
+                )
+                if change > tolerance:
+                    regressions.append(f"{name} @ {run['books']} books ({change:+.0%})")
+
+        if regressions:
+            raise CommandError(f"Performance regressions against {baseline_path}: {'; '.join(regressions)}")
+
+        self.stdout.write(self.style.SUCCESS("✅ No regressions against the baseline"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from ml_api.services.item_cf_service import get_item_cf_service
+
+
+class Command(BaseCommand):
+    help = 'Calculate item-item (book-book) similarities from reviews for item-based collaborative filtering'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=None,
+            help='Neighbours kept per book (default: 50)',
+        )
+        parser.add_argument(
+            '--min-common',
+            type=int,
+            default=None,
+            help='Minimum users who rated both books (default: 2)',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=1000,
+            help='Books per block of the sparse products (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        service = get_item_cf_service()
+        model = service.fit(
+            top_k=options['top_k'],
+            min_common=options['min_common'],
+            block_size=options['block_size'],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Item-item model {model.model_id}: {len(model)} books, {model.neighbours.nnz} neighbour pairs"
+            )
+        )
@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from django.conf import settings
 from django.db import models
 from ml_api.services.similarity_service import BookSimilarityService
 from ml_api.models import Book, BookSimilarity
@@ -23,11 +24,98 @@ class Command(BaseCommand):
             default=50,
             help='Batch size for processing (default: 50)',
         )
+        parser.add_argument(
+            '--vectorize',
+            action='store_true',
+            help='Only (re)build BookVector rows for the whole catalog',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild vectors even when the book fingerprint has not changed',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Recalculate similarities only for books whose data changed since the last run',
+        )
+        parser.add_argument(
+            '--build-ann',
+            action='store_true',
+            help='Build the ANN (LSH) index used by the on-demand similar-books fallback',
+        )
+        parser.add_argument(
+            '--fit-tfidf',
+            action='store_true',
+            help='Refit the corpus TF-IDF model (BOOK_VECTOR_WEIGHTING=tfidf) and revectorize',
+        )
+        parser.add_argument(
+            '--export-store',
+            action='store_true',
+            help='Only export stored similarities to the memory-mapped neighbour store',
+        )
+        parser.add_argument(
+            '--engine',
+            choices=['pairwise', 'sparse', 'lsa'],
+            default='pairwise',
+            help='Similarity engine for --all: pairwise (book by book), sparse (matrix based) '
+                 'or lsa (TruncatedSVD embeddings, stored with a separate version)',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=1000,
+            help='Rows per matrix block for the sparse engine (default: 1000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Worker processes for the sparse engine (implies --engine sparse when > 1)',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue the last interrupted --all run from its checkpoint '
+                 '(runs of --engine lsa and of the aspect engines are resumed separately)',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            help='Keep only the K best neighbours of each book instead of every pair above the threshold',
+        )
+        parser.add_argument(
+            '--min-similarity',
+            type=float,
+            help='Minimum similarity to store (floor for --top-k, default: 0.05)',
+        )
+        parser.add_argument(
+            '--candidates',
+            action='store_true',
+            help='Pairwise engine: score only books sharing a category, author or keyword (inverted index)',
+        )
+        parser.add_argument(
+            '--writer',
+            choices=['bulk', 'copy'],
+            default='bulk',
+            help='How results are written: bulk (bulk_create) or copy (PostgreSQL COPY FROM STDIN)',
+        )
+        parser.add_argument(
+            '--write-batch-size',
+            type=int,
+            default=5000,
+            help='Rows per write batch (default: 5000)',
+        )
         parser.add_argument(
             '--clean',
             action='store_true',
             help='Clean existing similarities before calculation',
         )
+        parser.add_argument(
+            '--compare-methods',
+            action='store_true',
+            help='Compare neighbour lists of the aspect and LSA methods (stored versions)',
+        )
         parser.add_argument(
             '--stats',
             action='store_true',
@@ -37,9 +125,12 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         service = BookSimilarityService()
         
+        if options['min_similarity'] is not None:
+            service.min_similarity_threshold = options['min_similarity']
+        
         if options['clean']:
             self.stdout.write("🧹 Cleaning existing similarities...")
-            deleted_count = BookSimilarity.objects.all().delete()[0]
+            deleted_count = service.clean_similarities()
             self.stdout.write(
                 self.style.SUCCESS(f"Deleted {deleted_count} similarity records")
             )
@@ -48,10 +139,70 @@ class Command(BaseCommand):
             self.show_statistics()
             return
         
-        if options['all']:
+        if options['compare_methods']:
+            comparison = service.compare_similarity_methods()
+            self.stdout.write(
+                f"🆚 Aspects vs LSA: {comparison['books_compared']} books, mean top-{comparison['limit']} "
+                f"overlap {comparison['mean_overlap']:.1%}"
+            )
+            return
+        
+        if options['fit_tfidf']:
+            if service.text_weighting != 'tfidf':
+                self.stdout.write(
+                    self.style.WARNING("BOOK_VECTOR_WEIGHTING is not 'tfidf' - the model will not be used")
+                )
+            service.get_tfidf_model(refit=True)
+            if not (options['all'] or options['resume'] or options['incremental']):
+                service.vectorize_catalog()
+                return
+        
+        if options['export_store']:
+            service.export_neighbour_store()
+            return
+        
+        if options['vectorize'] and not options['all']:
+            self.stdout.write("🧮 Vectorizing catalog...")
+            changed_ids = service.vectorize_catalog(force=options['force'])
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Vectorized {len(changed_ids)} books")
+            )
+            if options['build_ann']:
+                service.build_ann_index()
+            return
+        
+        if options['build_ann'] and not (options['all'] or options['resume'] or options['incremental']):
+            service.vectorize_catalog()
+            service.build_ann_index()
+            return
+        
+        if options['force']:
+            service.vectorize_catalog(force=True)
+        
+        if options['incremental']:
+            self.stdout.write("🔁 Updating similarities for changed books...")
+            total_similarities = service.calculate_incremental_similarities(
+                block_size=options['block_size'],
+                top_k=options['top_k'],
+                write_method=options['writer'],
+                write_batch_size=options['write_batch_size']
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Created {total_similarities} similarity records")
+            )
+            
+        elif options['all'] or options['resume']:
             self.stdout.write("🚀 Calculating similarities for ALL books...")
             total_similarities = service.calculate_all_similarities(
-                batch_size=options['batch_size']
+                batch_size=options['batch_size'],
+                engine=options['engine'],
+                block_size=options['block_size'],
+                top_k=options['top_k'],
+                write_method=options['writer'],
+                write_batch_size=options['write_batch_size'],
+                use_candidates=options['candidates'],
+                workers=options['workers'],
+                resume=options['resume']
             )
             self.stdout.write(
                 self.style.SUCCESS(f"✅ Created {total_similarities} similarity records")
@@ -64,7 +215,8 @@ class Command(BaseCommand):
                 self.stdout.write(f"📊 Calculating similarities for: {book.title}")
                 
                 similarities_count = service.calculate_similarities_for_book(
-                    book, batch_size=options['batch_size']
+                    book, batch_size=options['batch_size'], top_k=options['top_k'],
+                    use_candidates=options['candidates']
                 )
                 
                 self.stdout.write(
@@ -80,8 +232,11 @@ class Command(BaseCommand):
                 self.style.WARNING("Please specify --all or --book ID or --stats")
             )
             
+        if options['build_ann'] and (options['all'] or options['resume'] or options['incremental']):
+            service.build_ann_index()
+        
         # Pokaż statystyki na końcu
-        if options['all'] or options['book']:
+        if options['all'] or options['resume'] or options['book'] or options['incremental']:
             self.show_statistics()
     
     def show_statistics(self):
@@ -91,43 +246,44 @@ class Command(BaseCommand):
         self.stdout.write("=" * 50)
         
         # Podstawowe statystyki
+        # Opublikowana generacja serwowanej metody (BOOK_SIMILARITY_METHOD)
+        live = BookSimilarity.live()
         total_books = Book.objects.count()
-        total_similarities = BookSimilarity.objects.count()
-        
-        # Średnie podobieństwo
-        avg_similarity = BookSimilarity.objects.aggregate(
-            avg=models.Avg('cosine_similarity')
-        )['avg'] or 0
-        
-        # Najwyższe podobieństwo
-        max_similarity = BookSimilarity.objects.aggregate(
+        live_stats = live.aggregate(
+            count=models.Count('id'),
+            avg=models.Avg('cosine_similarity'),
             max=models.Max('cosine_similarity')
-        )['max'] or 0
-        
-        # Książki z największą liczbą podobieństw
-        books_with_most_similarities = Book.objects.annotate(
-            similarity_count=models.Count('similarities_as_book1') + models.Count('similarities_as_book2')
-        ).order_by('-similarity_count')[:5]
+        )
+        total_similarities = live_stats['count']
+        avg_similarity = live_stats['avg'] or 0
+        max_similarity = live_stats['max'] or 0
         
         self.stdout.write(f"📚 Total books: {total_books}")
+        self.stdout.write(f"🧭 Served method: {settings.BOOK_SIMILARITY_METHOD}")
         self.stdout.write(f"🔗 Total similarities: {total_similarities}")
         self.stdout.write(f"📈 Average similarity: {avg_similarity:.4f}")
         self.stdout.write(f"🔝 Maximum similarity: {max_similarity:.4f}")
         
+        # Wyniki każdej metody mają własną wartość `version`
+        for method, version in BookSimilarity.METHOD_VERSIONS.items():
+            method_stats = BookSimilarity.live(method).aggregate(
+                count=models.Count('id'), avg=models.Avg('cosine_similarity')
+            )
+            self.stdout.write(
+                f"🧪 {method} (version {version}): {method_stats['count']} live similarities, "
+                f"average {method_stats['avg'] or 0:.4f}"
+            )
+        
         if total_books > 0:
             coverage = (total_similarities / (total_books * (total_books - 1) / 2)) * 100
             self.stdout.write(f"📊 Similarity coverage: {coverage:.2f}%")
         
         self.stdout.write("\n🏆 TOP 5 BOOKS WITH MOST SIMILARITIES:")
-        for i, book in enumerate(books_with_most_similarities, 1):
-            similarity_count = (
-                book.similarities_as_book1.count() + 
-                book.similarities_as_book2.count()
-            )
+        for i, (book, similarity_count) in enumerate(BookSimilarity.most_connected_books(limit=5), 1):
             self.stdout.write(f"   {i}. {book.title[:40]:40} ({similarity_count} similarities)")
         
         # Próbka najwyższych podobieństw
-        top_similarities = BookSimilarity.objects.order_by('-cosine_similarity')[:5]
+        top_similarities = live.select_related('book1', 'book2').order_by('-cosine_similarity')[:5]
         self.stdout.write("\n⭐ TOP 5 HIGHEST SIMILARITIES:")
         for i, sim in enumerate(top_similarities, 1):
             self.stdout.write(
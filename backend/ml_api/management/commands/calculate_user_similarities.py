@@ -17,13 +17,27 @@ class Command(BaseCommand):
             type=str,
             help='Calculate similarities for specific username',
         )
+        parser.add_argument(
+            '--metric',
+            choices=['pearson', 'cosine'],
+            default=None,
+            help='Rating similarity: pearson on common books (default) or mean-centered cosine',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=500,
+            help='Users per block of the sparse rating matrix products (default: 500)',
+        )
     
     def handle(self, *args, **options):
         service = get_user_similarity_service()
         
         if options['all']:
             self.stdout.write("Calculating similarities for ALL users...")
-            total = service.calculate_all_similarities()
+            total = service.calculate_all_similarities(
+                metric=options['metric'], block_size=options['block_size']
+            )
             self.stdout.write(
                 self.style.SUCCESS(f"Created {total} similarity records")
             )
@@ -33,7 +47,7 @@ class Command(BaseCommand):
             try:
                 user = User.objects.get(username=username)
                 self.stdout.write(f"Calculating for: {username}")
-                count = service.calculate_similarities_for_user(user)
+                count = service.calculate_similarities_for_user(user, metric=options['metric'])
                 self.stdout.write(
                     self.style.SUCCESS(f"Created {count} similarities")
                 )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from ml_api.services.mf_service import get_mf_service
+
+
+class Command(BaseCommand):
+    help = 'Fit matrix factorization (truncated SVD) of the user x book rating matrix'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--factors',
+            type=int,
+            default=None,
+            help='Number of latent factors (default: MF_FACTORS setting)',
+        )
+        parser.add_argument(
+            '--keep-versions',
+            type=int,
+            default=None,
+            help='Model versions kept on disk (default: 2)',
+        )
+
+    def handle(self, *args, **options):
+        service = get_mf_service()
+        if options['keep_versions'] is not None:
+            service.keep_versions = options['keep_versions']
+
+        try:
+            model = service.fit(n_factors=options['factors'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"MF model {model.version}: {len(model.user_ids)} users x {len(model)} books, {model.n_factors} factors"
+            )
+        )
@@ -1,11 +1,14 @@
 from django.db import models
 from decimal import Decimal
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Coalesce
+from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 from django.utils import timezone
 import uuid
+from collections import Counter
 from datetime import timedelta
 import json
 from django.contrib.auth import get_user_model
@@ -88,14 +91,18 @@ class Book(models.Model):
     
     @property
     def average_rating(self):
-        """Wylicz średnią ocenę na bieżąco"""
+        """Wylicz średnią ocenę na bieżąco (albo weź z adnotacji `rating_avg`)"""
+        if hasattr(self, 'rating_avg'):
+            return round(self.rating_avg or 0, 2)
         from django.db.models import Avg
         result = self.reviews.aggregate(avg_rating=Avg('rating'))
         return round(result['avg_rating'] or 0, 2)
     
     @property
     def ratings_count(self):
-        """Wylicz liczbę ocen na bieżąco"""
+        """Wylicz liczbę ocen na bieżąco (albo weź z adnotacji `rating_count`)"""
+        if hasattr(self, 'rating_count'):
+            return self.rating_count
         return self.reviews.count()
     
     @property
@@ -245,26 +252,50 @@ class BookSimilarity(models.Model):
     # Metadane obliczenia
     calculated_at = models.DateTimeField(auto_now=True)
     version = models.IntegerField(default=1)  # Wersja algorytmu
+    # Generacja wyników - widoczna jest tylko ta wskazana w SimilarityGeneration
+    generation = models.IntegerField(default=0)
+    
+    # Metoda liczenia -> wartość `version` i klucz wskaźnika generacji
+    METHOD_VERSIONS = {
+        'aspects': 1,  # Ważone aspekty (kategorie, słowa kluczowe, autorzy, opis)
+        'lsa': 2,      # Osadzenia LSA (TruncatedSVD)
+    }
+    GENERATION_KEYS = {
+        'aspects': 'books',
+        'lsa': 'books-lsa',
+    }
     
     class Meta:
         db_table = 'book_similarities'
-        unique_together = ['book1', 'book2']
+        unique_together = ['book1', 'book2', 'generation', 'version']
         indexes = [
-            models.Index(fields=['book1', 'cosine_similarity']),
-            models.Index(fields=['book2', 'cosine_similarity']),
+            models.Index(fields=['generation', 'book1', 'cosine_similarity']),
+            models.Index(fields=['generation', 'book2', 'cosine_similarity']),
             models.Index(fields=['cosine_similarity']),
         ]
     
     def __str__(self):
         return f"{self.book1.title} ↔ {self.book2.title}: {self.cosine_similarity:.3f}"
     
+    @classmethod
+    def live(cls, method=None):
+        """
+        Podobieństwa z aktywnej generacji metody (domyślnie BOOK_SIMILARITY_METHOD)
+        - jedno zapytanie z podzapytaniem
+        """
+        method = method or settings.BOOK_SIMILARITY_METHOD
+        return cls.objects.filter(
+            generation=SimilarityGeneration.active_subquery(cls.GENERATION_KEYS[method]),
+            version=cls.METHOD_VERSIONS[method]
+        )
+    
     @classmethod
     def get_similar_books(cls, book, limit=10, min_similarity=0.1):
         """
         Znajdź podobne książki dla danej książki
         """
         # Zapytanie uwzględniające obie strony relacji
-        similar = cls.objects.filter(
+        similar = cls.live().filter(
             models.Q(book1=book) | models.Q(book2=book),
             cosine_similarity__gte=min_similarity
         ).select_related('book1', 'book2').order_by('-cosine_similarity')[:limit]
@@ -285,6 +316,168 @@ class BookSimilarity(models.Model):
             })
         
         return results
+    
+    @classmethod
+    def most_connected_books(cls, limit=10, method=None):
+        """
+        Książki z największą liczbą opublikowanych podobieństw: [(książka, liczba)]
+        """
+        live = cls.live(method).order_by()
+        counts = Counter()
+        for field in ('book1_id', 'book2_id'):
+            counts.update(dict(live.values_list(field).annotate(count=models.Count('id'))))
+        
+        top = counts.most_common(limit)
+        books = Book.objects.in_bulk([book_id for book_id, _ in top])
+        return [(books[book_id], count) for book_id, count in top if book_id in books]
+
+class SimilarityGeneration(models.Model):
+    """
+    Wskaźnik aktywnej generacji podobieństw.
+    
+    Pełne przeliczenie zapisuje wyniki pod nowym numerem generacji,
+    a po zakończeniu przestawia wskaźnik jedną aktualizacją - czytający
+    zawsze widzą kompletny zestaw. Stare generacje są potem usuwane.
+    
+    `cache_version` unieważnia cache rekomendacji - rośnie po każdym
+    przeliczeniu i po zmianie danych książki.
+    """
+    key = models.CharField(max_length=50, unique=True, default='books')
+    active = models.IntegerField(default=0)
+    cache_version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'similarity_generations'
+    
+    def __str__(self):
+        return f"{self.key}: generation {self.active}"
+    
+    @classmethod
+    def active_subquery(cls, key='books'):
+        """
+        Numer aktywnej generacji jako wyrażenie SQL (0, gdy brak wskaźnika)
+        """
+        return Coalesce(
+            models.Subquery(cls.objects.filter(key=key).values('active')[:1]),
+            models.Value(0)
+        )
+    
+    @classmethod
+    def get_active(cls, key='books'):
+        return cls.objects.filter(key=key).values_list('active', flat=True).first() or 0
+    
+    @classmethod
+    def activate(cls, generation, key='books'):
+        """
+        Przestaw wskaźnik na podaną generację
+        """
+        cls.objects.update_or_create(key=key, defaults={'active': generation})
+        # Cache rekomendacji ma jedną wersję (wskaźnik 'books') dla wszystkich metod
+        cls.bump_cache_version()
+    
+    @classmethod
+    def get_cache_version(cls, key='books'):
+        return cls.objects.filter(key=key).values_list('cache_version', flat=True).first() or 0
+    
+    @classmethod
+    def bump_cache_version(cls, key='books'):
+        """
+        Unieważnij zapisane w cache rekomendacje (nowa wersja kluczy)
+        """
+        updated = cls.objects.filter(key=key).update(cache_version=models.F('cache_version') + 1)
+        if not updated:
+            cls.objects.get_or_create(key=key, defaults={'cache_version': 1})
+
+
+class SimilarityRun(models.Model):
+    """
+    Postęp pełnego przeliczenia podobieństw (checkpointy do wznowienia)
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed')
+    ]
+    
+    engine = models.CharField(max_length=20)
+    generation = models.IntegerField()  # Generacja, do której zapisuje przebieg
+    parameters = models.JSONField(default=dict)  # top_k, block_size, próg...
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    
+    # Jednostki to bloki wierszy (sparse) albo książki (pairwise)
+    total_units = models.IntegerField(default=0)
+    completed_units = models.IntegerField(default=0)
+    last_book_id = models.IntegerField(blank=True, null=True)  # Ostatnia ukończona książka (pairwise)
+    
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'similarity_runs'
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"{self.engine} run (generation {self.generation}): {self.completed_units}/{self.total_units} {self.status}"
+    
+    # Silniki zapisujące wyniki danej metody (wskaźnik generacji w BookSimilarity.GENERATION_KEYS)
+    METHOD_ENGINES = {
+        'aspects': ('pairwise', 'sparse'),
+        'lsa': ('lsa',),
+    }
+    
+    # Przebieg 'running' bez checkpointu od tak dawna uznajemy za porzucony
+    STALE_AFTER = timedelta(hours=1)
+    
+    @classmethod
+    def for_method(cls, method='aspects'):
+        return cls.objects.filter(engine__in=cls.METHOD_ENGINES[method])
+    
+    @classmethod
+    def get_resumable(cls, method='aspects'):
+        """
+        Ostatni nieukończony przebieg metody, którego generacja nie została opublikowana
+        """
+        run = cls.for_method(method).exclude(status='completed').first()
+        active = SimilarityGeneration.get_active(BookSimilarity.GENERATION_KEYS[method])
+        if run and run.generation > active:
+            return run
+        return None
+    
+    @classmethod
+    def in_progress(cls, method='aspects'):
+        """
+        Przebiegi metody 'running' z checkpointem nowszym niż STALE_AFTER
+        """
+        return cls.for_method(method).filter(
+            status='running', updated_at__gte=timezone.now() - cls.STALE_AFTER
+        )
+    
+    @classmethod
+    def abandoned(cls, method='aspects'):
+        """
+        Przebiegi metody, które nie zostaną już dokończone: nieudane albo
+        'running' bez checkpointu od STALE_AFTER (przebiegi innych metod
+        i innych workerów w toku nie są brane pod uwagę)
+        """
+        return cls.for_method(method).filter(
+            models.Q(status='failed') |
+            models.Q(status='running', updated_at__lt=timezone.now() - cls.STALE_AFTER)
+        )
+
+
+class VectorFeature(models.Model):
+    """
+    Globalny słownik cech wektorów książek (nazwa -> ID w formacie binarnym)
+    """
+    name = models.CharField(max_length=255, unique=True)  # np. 'cat_fantasy', 'kw_dragon'
+    
+    class Meta:
+        db_table = 'vector_features'
+    
+    def __str__(self):
+        return self.name
+
 
 class BookVector(models.Model):
     """
@@ -296,7 +489,7 @@ class BookVector(models.Model):
         related_name='vector'
     )
     
-    # Wektory jako JSON
+    # Wektory jako JSON (stary format - nowe wektory są zapisywane w `packed`)
     category_vector = models.JSONField(default=dict)  # {category_id: weight}
     keyword_vector = models.JSONField(default=dict)   # {keyword: tfidf_score}
     author_vector = models.JSONField(default=dict)    # {author_id: weight}
@@ -305,6 +498,15 @@ class BookVector(models.Model):
     # Kombinowany wektor (znormalizowany)
     combined_vector = models.JSONField(default=dict)
     
+    # Wszystkie aspekty spakowane: int32 ID cech z VectorFeature + float32 wagi
+    # (format w ml_api.services.vector_codec); combined liczony przy odczycie
+    packed = models.BinaryField(blank=True, null=True)
+    
+    # Odcisk (SHA-256) danych wejściowych: tytuł, opis, słowa kluczowe, autorzy, kategorie
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
+    # Odcisk, dla którego ostatnio przeliczono podobieństwa tej książki
+    similarity_fingerprint = models.CharField(max_length=64, blank=True, default='')
+    
     # Metadane
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
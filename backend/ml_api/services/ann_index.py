@@ -0,0 +1,139 @@
+"""
+Przybliżone wyszukiwanie najbliższych sąsiadów (ANN) dla podobnych książek.
+
+Random-projection LSH nad `combined_vector` z BookVector: każda tablica
+haszująca to `n_bits` losowych hiperpłaszczyzn, a kod książki to znaki rzutów
+na nie. Książki o dużym podobieństwie kosinusowym z dużym prawdopodobieństwem
+trafiają do tego samego kubełka. Wektor losowy każdej cechy jest wyprowadzany
+z hasza jej nazwy, więc nowe książki (z nieznanymi cechami) można rzutować bez
+przechowywania macierzy projekcji.
+
+Indeks jest zapisywany do pliku .npz i wczytywany raz na proces.
+"""
+import os
+import zlib
+import numpy as np
+
+from ml_api.services.similarity_engine import build_aspect_matrix, l2_normalize_rows
+
+
+class RandomProjectionLSH:
+    """
+    Indeks LSH (losowe rzuty) z wielokrotnym próbkowaniem sąsiednich kubełków
+    """
+
+    FEATURE_CHUNK = 10000
+
+    def __init__(self, n_bits=10, n_tables=16, seed=42):
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+        self.seed = seed
+        self.book_ids = np.empty(0, dtype=np.int64)
+        self.codes = np.empty((0, n_tables), dtype=np.uint32)
+        self._sorted_codes = None
+        self._order = None
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def fit(self, book_ids, combined_vectors):
+        """
+        Zbuduj indeks z ID książek i ich słowników `combined_vector`
+        """
+        matrix, vocabulary = build_aspect_matrix(combined_vectors)
+        matrix = l2_normalize_rows(matrix).tocsc()
+
+        features = sorted(vocabulary, key=vocabulary.get)
+        projections = np.zeros((matrix.shape[0], self.n_bits * self.n_tables), dtype=np.float64)
+
+        # Rzuty liczone porcjami cech, żeby nie trzymać całej macierzy projekcji
+        for start in range(0, len(features), self.FEATURE_CHUNK):
+            chunk = features[start:start + self.FEATURE_CHUNK]
+            projections += matrix[:, start:start + len(chunk)] @ self._feature_planes(chunk)
+
+        self.book_ids = np.asarray(book_ids, dtype=np.int64)
+        self.codes = self._codes(projections)
+        self._build_lookup()
+        return self
+
+    def query(self, combined_vector, limit=500, exclude_id=None):
+        """
+        ID kandydatów z tych samych i sąsiednich (odległość Hamminga 1)
+        kubełków, posortowane malejąco po liczbie kolizji
+        """
+        if not combined_vector or len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        features = list(combined_vector)
+        weights = np.asarray([combined_vector[feature] for feature in features], dtype=np.float64)
+        projection = weights @ self._feature_planes(features)
+        codes = self._codes(projection.reshape(1, -1))[0]
+
+        flips = np.concatenate([[0], 1 << np.arange(self.n_bits)]).astype(np.uint32)
+        hits = []
+
+        for table in range(self.n_tables):
+            probes = codes[table] ^ flips
+            sorted_codes = self._sorted_codes[table]
+            lo = np.searchsorted(sorted_codes, probes, side='left')
+            hi = np.searchsorted(sorted_codes, probes, side='right')
+            for start, end in zip(lo, hi):
+                if end > start:
+                    hits.append(self._order[table][start:end])
+
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+
+        rows, collisions = np.unique(np.concatenate(hits), return_counts=True)
+        ids = self.book_ids[rows]
+
+        if exclude_id is not None:
+            keep = ids != exclude_id
+            ids, collisions = ids[keep], collisions[keep]
+
+        order = np.argsort(-collisions, kind='stable')[:limit]
+        return ids[order]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(
+            path,
+            book_ids=self.book_ids,
+            codes=self.codes,
+            params=np.asarray([self.n_bits, self.n_tables, self.seed], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            n_bits, n_tables, seed = (int(value) for value in data['params'])
+            index = cls(n_bits=n_bits, n_tables=n_tables, seed=seed)
+            index.book_ids = data['book_ids']
+            index.codes = data['codes']
+        index._build_lookup()
+        return index
+
+    def _feature_planes(self, features):
+        """
+        Deterministyczne wektory gaussowskie cech (cechy x wszystkie bity)
+        """
+        total_bits = self.n_bits * self.n_tables
+        planes = np.empty((len(features), total_bits), dtype=np.float64)
+
+        for row, feature in enumerate(features):
+            rng = np.random.default_rng([self.seed, zlib.crc32(feature.encode('utf-8'))])
+            planes[row] = rng.standard_normal(total_bits)
+
+        return planes
+
+    def _codes(self, projections):
+        """
+        Zamień rzuty (książki x wszystkie bity) na kody kubełków (książki x tablice)
+        """
+        bits = (np.asarray(projections) > 0).reshape(-1, self.n_tables, self.n_bits)
+        weights = (1 << np.arange(self.n_bits)).astype(np.uint32)
+        return (bits * weights).sum(axis=2).astype(np.uint32)
+
+    def _build_lookup(self):
+        self._order = [np.argsort(self.codes[:, table], kind='stable') for table in range(self.n_tables)]
+        self._sorted_codes = [self.codes[order, table] for table, order in enumerate(self._order)]
@@ -0,0 +1,96 @@
+"""
+Indeks odwrócony cech książek (cecha -> lista ID książek) do generowania kandydatów.
+
+Zamiast porównywać książkę z całym katalogiem, porównujemy ją tylko z książkami,
+które mają z nią co najmniej jedną wspólną kategorię, autora lub słowo kluczowe.
+Bardzo częste cechy (np. ogromne kategorie) są pomijane - ich listy są dłuższe
+niż limit i nie zawężają wyboru.
+"""
+from collections import defaultdict
+import numpy as np
+
+INDEXED_ASPECTS = ('category', 'author', 'keyword')
+
+
+class FeatureInvertedIndex:
+    """
+    Indeks odwrócony nad wektorami z BookVector
+    """
+
+    def __init__(self, aspects=INDEXED_ASPECTS, max_posting_fraction=0.05, min_posting_cap=50):
+        self.aspects = aspects
+        # Cecha jest pomijana, gdy ma więcej książek niż
+        # max(min_posting_cap, max_posting_fraction * liczba książek)
+        self.max_posting_fraction = max_posting_fraction
+        self.min_posting_cap = min_posting_cap
+        self.postings = {}
+        self.book_count = 0
+        self.capped_features = 0
+
+    @property
+    def posting_cap(self):
+        return max(self.min_posting_cap, int(self.max_posting_fraction * self.book_count))
+
+    def build(self, book_ids, vectors):
+        """
+        Zbuduj indeks z listy ID i odpowiadających im słowników wektorów
+        """
+        postings = defaultdict(list)
+
+        for book_id, vector in zip(book_ids, vectors):
+            for feature in self._features(vector):
+                postings[feature].append(book_id)
+
+        self.book_count = len(book_ids)
+        cap = self.posting_cap
+
+        self.postings = {}
+        self.capped_features = 0
+        for feature, ids in postings.items():
+            if len(ids) > cap:
+                self.capped_features += 1
+                continue
+            self.postings[feature] = np.asarray(ids, dtype=np.int64)
+
+        return self
+
+    def candidates(self, vector, exclude_id=None, limit=None):
+        """
+        ID książek mających wspólną cechę z wektorem, posortowane malejąco
+        po liczbie wspólnych cech (opcjonalnie tylko `limit` najlepszych)
+        """
+        lists = [
+            self.postings[feature]
+            for feature in self._features(vector)
+            if feature in self.postings
+        ]
+
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+
+        ids, shared = np.unique(np.concatenate(lists), return_counts=True)
+
+        if exclude_id is not None:
+            keep = ids != exclude_id
+            ids, shared = ids[keep], shared[keep]
+
+        order = np.argsort(-shared, kind='stable')
+        if limit is not None:
+            order = order[:limit]
+
+        return ids[order]
+
+    def stats(self):
+        sizes = [len(ids) for ids in self.postings.values()]
+        return {
+            'books': self.book_count,
+            'features': len(self.postings),
+            'capped_features': self.capped_features,
+            'posting_cap': self.posting_cap,
+            'avg_posting_size': round(float(np.mean(sizes)), 2) if sizes else 0.0,
+        }
+
+    def _features(self, vector):
+        for aspect in self.aspects:
+            for key in vector.get(f'{aspect}_vector', {}):
+                yield f'{aspect}:{key}'
@@ -0,0 +1,171 @@
+"""
+Item-item collaborative filtering: podobieństwo książek z ocen użytkowników.
+
+Podobieństwo to skorygowany kosinus (adjusted cosine, Sarwar i in.) - oceny
+są centrowane średnią użytkownika, a sumy liczone tylko po użytkownikach,
+którzy ocenili obie książki (C - wycentrowane oceny, B - maska ocen):
+
+    sim(i, j) = (Cᵀ·C)[i, j] / sqrt((C²)ᵀ·B)[i, j] / sqrt(Bᵀ·C²)[i, j]
+
+Dla każdej książki zostaje K najlepszych dodatnich sąsiadów (macierz CSR
+książki x książki, float32). Wynik kandydatów użytkownika to jeden iloczyn
+rzadkiego wektora jego ocen z tą macierzą. Zapis na dysk: .npz.
+Moduł nie zależy od Django.
+"""
+import os
+import hashlib
+import numpy as np
+from scipy import sparse
+
+
+class ItemSimilarityModel:
+    """
+    K najbliższych sąsiadów każdej książki według współocen
+    """
+
+    def __init__(self, top_k=50, min_common=2):
+        self.top_k = top_k
+        self.min_common = min_common  # Minimum użytkowników oceniających obie książki
+        self.book_ids = np.empty(0, dtype=np.int64)  # posortowane rosnąco
+        self.neighbours = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.model_id = ''
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def _compute_model_id(self):
+        digest = hashlib.sha256()
+        for array in (self.book_ids, self.neighbours.indptr, self.neighbours.indices, self.neighbours.data):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        self.model_id = digest.hexdigest()[:16]
+
+    def fit(self, ratings, block_size=1000):
+        """
+        Dopasuj model do `RatingMatrix` (użytkownicy x książki), blokami książek
+        """
+        centered = ratings.mean_centered().T.tocsr()     # książki x użytkownicy
+        mask = ratings.mask().T.tocsr()
+        squared = centered.multiply(centered).tocsr()
+        centered_T, mask_T, squared_T = centered.T.tocsr(), mask.T.tocsr(), squared.T.tocsr()
+
+        total = centered.shape[0]
+        rows, cols, values = [], [], []
+
+        for start in range(0, total, block_size):
+            end = min(start + block_size, total)
+
+            common = (mask[start:end] @ mask_T).tocoo()
+            local, col = common.row.astype(np.int64), common.col.astype(np.int64)
+            keep = (common.data >= self.min_common) & (col != local + start)
+            local, col = local[keep], col[keep]
+            if len(local) == 0:
+                continue
+
+            def pick(matrix):
+                matrix = matrix.tocsr()
+                matrix.sort_indices()  # odczyt par z nieposortowanego CSR jest bardzo wolny
+                return np.asarray(matrix[local, col]).ravel()
+
+            numerator = pick(centered[start:end] @ centered_T)
+            denominator = np.sqrt(pick(squared[start:end] @ mask_T) * pick(mask[start:end] @ squared_T))
+            valid = denominator > 1e-12
+            similarity = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=valid)
+
+            positive = similarity > 0
+            local, col, similarity = local[positive], col[positive], similarity[positive]
+
+            # K najlepszych w wierszu: sortowanie po (wiersz, -podobieństwo), potem ranga w wierszu
+            order = np.lexsort((-similarity, local))
+            local, col, similarity = local[order], col[order], similarity[order]
+            first = np.searchsorted(local, local, side='left')
+            top = np.arange(len(local)) - first < self.top_k
+
+            rows.append(local[top] + start)
+            cols.append(col[top])
+            values.append(similarity[top])
+
+        self.book_ids = ratings.book_ids.copy()
+        self.neighbours = sparse.csr_matrix(
+            (
+                np.concatenate(values).astype(np.float32) if values else np.empty(0, dtype=np.float32),
+                (np.concatenate(rows) if rows else np.empty(0, dtype=np.int64),
+                 np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)),
+            ),
+            shape=(total, total),
+        )
+        self._compute_model_id()
+        return self
+
+    def rows(self, book_ids):
+        """
+        Indeksy wierszy znanych książek i maska, które z `book_ids` są w modelu
+        """
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        rows = np.clip(np.searchsorted(self.book_ids, book_ids), 0, max(len(self.book_ids) - 1, 0))
+        known = (self.book_ids[rows] == book_ids) if len(self.book_ids) else np.zeros(len(book_ids), dtype=bool)
+        return rows[known], known
+
+    def score(self, book_ids, weights, exclude_ids=(), limit=10):
+        """
+        Ranking kandydatów: wagi ocenionych książek (wektor rzadki) x macierz sąsiadów.
+        Zwraca (ID książek, wyniki) malejąco; ocenione i `exclude_ids` są pomijane.
+        """
+        rows, known = self.rows(book_ids)
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        vector = sparse.csr_matrix(
+            (np.asarray(weights, dtype=np.float64)[known], (np.zeros(len(rows), dtype=np.int64), rows)),
+            shape=(1, len(self.book_ids)),
+        )
+        scores = (vector @ self.neighbours).toarray().ravel()
+
+        excluded, _ = self.rows(np.concatenate([np.asarray(book_ids, dtype=np.int64),
+                                                np.asarray(list(exclude_ids), dtype=np.int64)]))
+        scores[excluded] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        return self.book_ids[candidates], scores[candidates]
+
+    def similar(self, book_id, limit=10):
+        """
+        Sąsiedzi książki (ID, podobieństwa) albo None, jeśli jej nie ma w modelu
+        """
+        rows, _ = self.rows([book_id])
+        if len(rows) == 0:
+            return None
+        row = self.neighbours.getrow(int(rows[0]))
+        order = np.argsort(-row.data, kind='stable')[:limit]
+        return self.book_ids[row.indices[order]], row.data[order]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Zapis do pliku tymczasowego i podmiana - workery nie czytają połowy pliku
+        temporary = f"{path}.tmp"
+        with open(temporary, 'wb') as f:
+            np.savez(
+                f,
+                book_ids=self.book_ids,
+                indptr=self.neighbours.indptr,
+                indices=self.neighbours.indices,
+                data=self.neighbours.data,
+                top_k=np.asarray(self.top_k),
+                min_common=np.asarray(self.min_common),
+            )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            model = cls(top_k=int(data['top_k']), min_common=int(data['min_common']))
+            model.book_ids = data['book_ids']
+            total = len(model.book_ids)
+            model.neighbours = sparse.csr_matrix(
+                (data['data'], data['indices'], data['indptr']), shape=(total, total)
+            )
+        model._compute_model_id()
+        return model
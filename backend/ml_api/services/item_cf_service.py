@@ -0,0 +1,115 @@
+import os
+import time
+import numpy as np
+from django.conf import settings
+
+from ..models import BookReview
+from .item_cf_model import ItemSimilarityModel
+from .rating_matrix import RatingMatrix
+from .user_similarity_service import load_recommended_books
+
+
+class ItemCollaborativeService:
+    """
+    Item-based collaborative filtering: book-book co-rating similarity is
+    fitted offline from BookReview and stored on disk; serving is one review
+    query plus a sparse vector x matrix product
+    """
+
+    def __init__(self):
+        self.top_k = 50             # Neighbours kept per book
+        self.min_common = 2         # Minimum users who rated both books
+        self.liked_rating = 7       # Only books rated 7+ drive recommendations
+        self.model_path = os.path.join(settings.ML_ARTIFACTS_DIR, 'book_item_cf.npz')
+        self._model = None
+        self._model_mtime = None
+
+    def fit(self, top_k=None, min_common=None, block_size=1000):
+        """
+        Fit item-item similarities from all reviews and save the model
+        """
+        print("CALCULATING ITEM-ITEM SIMILARITIES")
+        print("=" * 50)
+
+        started = time.time()
+        reviews = np.array(
+            list(BookReview.objects.values_list('user_id', 'book_id', 'rating')),
+            dtype=np.int64
+        ).reshape(-1, 3)
+        ratings = RatingMatrix.from_triples(reviews[:, 0], reviews[:, 1], reviews[:, 2])
+        print(f"👥 {len(ratings)} users x 📚 {len(ratings.book_ids)} books, {len(reviews)} reviews")
+
+        model = ItemSimilarityModel(
+            top_k=top_k or self.top_k, min_common=min_common or self.min_common
+        ).fit(ratings, block_size=block_size)
+        model.save(self.model_path)
+
+        self._model = model
+        self._model_mtime = os.path.getmtime(self.model_path)
+
+        print("=" * 50)
+        print(f"✅ ITEM-ITEM MODEL {model.model_id} COMPLETED in {time.time() - started:.1f}s")
+        print(f"🔗 Neighbour pairs: {model.neighbours.nnz}")
+        return model
+
+    def get_model(self):
+        """
+        Model from disk (None before the first fit); reloaded when the
+        file was replaced by a newer fit
+        """
+        try:
+            mtime = os.path.getmtime(self.model_path)
+        except OSError:
+            return self._model
+
+        if mtime != self._model_mtime:
+            self._model = ItemSimilarityModel.load(self.model_path)
+            self._model_mtime = mtime
+            print(f"🧭 Item-item model loaded: {len(self._model)} books")
+        return self._model
+
+    def get_recommendations(self, user, limit=10):
+        """
+        Score books for a user from the neighbours of the books they liked
+        """
+        model = self.get_model()
+        if model is None:
+            return []
+
+        reviews = np.array(
+            list(BookReview.objects.filter(user=user).values_list('book_id', 'rating')),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        liked = reviews[:, 1] >= self.liked_rating
+        if not liked.any():
+            return []
+
+        # Liked books weighted by rating; every reviewed book is excluded
+        book_ids, scores = model.score(
+            reviews[liked, 0], reviews[liked, 1] / 10.0,
+            exclude_ids=reviews[:, 0], limit=limit
+        )
+
+        books = load_recommended_books(book_ids.tolist())
+
+        return [
+            {
+                'book': books[book_id],
+                'recommendation_score': float(score),
+                'recommendation_type': 'item_based_filtering',
+                'reason': 'Similar to books you rated highly'
+            }
+            for book_id, score in zip(book_ids.tolist(), scores.tolist())
+            if book_id in books
+        ]
+
+
+# Singleton instance
+_item_cf_service = None
+
+def get_item_cf_service():
+    """Get singleton instance"""
+    global _item_cf_service
+    if _item_cf_service is None:
+        _item_cf_service = ItemCollaborativeService()
+    return _item_cf_service
@@ -0,0 +1,170 @@
+"""
+Gęste osadzenia LSA książek (TruncatedSVD na macierzy cech TF-IDF).
+
+Model dopasowuje SVD do łącznej macierzy cech książek (aspekty z wagami,
+kolumny przeważone przez IDF) i przechowuje dla każdej książki wektor
+float32 o stałej długości (~128), znormalizowany L2 - kosinus to zwykły
+iloczyn skalarny. Osadzenia trzymane są w jednej ciągłej tablicy
+(książki x wymiary), więc wyszukanie sąsiadów to jedno mnożenie
+macierz-wektor. Zapis na dysk: .npz. Moduł nie zależy od Django.
+"""
+import os
+import hashlib
+import numpy as np
+from scipy import sparse
+
+
+def column_idf(matrix):
+    """
+    Wygładzone IDF kolumn (jak w sklearn): log((1 + n) / (1 + df)) + 1
+    """
+    n_rows = matrix.shape[0]
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    return (np.log((1.0 + n_rows) / (1.0 + df)) + 1.0).astype(np.float64)
+
+
+def normalize_dense_rows(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(embeddings / norms, dtype=np.float32)
+
+
+class LsaEmbeddingModel:
+    """
+    Osadzenia książek z TruncatedSVD i wyszukiwanie najbliższych sąsiadów
+    """
+
+    def __init__(self, n_components=128, use_idf=True, random_state=42):
+        self.n_components = n_components
+        self.use_idf = use_idf  # False, gdy opis i słowa kluczowe są już TF-IDF
+        self.random_state = random_state
+        self.book_ids = np.empty(0, dtype=np.int64)     # posortowane rosnąco
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.components = np.empty((0, 0), dtype=np.float32)
+        self.idf = np.empty(0, dtype=np.float64)
+        self.model_id = ''
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def _compute_model_id(self):
+        digest = hashlib.sha256()
+        digest.update(self.book_ids.tobytes())
+        digest.update(self.components.tobytes())
+        self.model_id = digest.hexdigest()[:16]
+
+    def fit(self, book_ids, matrix):
+        """
+        Dopasuj SVD; `matrix` to macierz CSR (książki x cechy) w kolejności `book_ids`
+        """
+        # sklearn jest potrzebny tylko przy dopasowaniu - nie przy imporcie modułu
+        from sklearn.decomposition import TruncatedSVD
+
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        order = np.argsort(book_ids, kind='stable')
+        matrix = sparse.csr_matrix(matrix)[order]
+
+        self.idf = column_idf(matrix) if self.use_idf else np.ones(matrix.shape[1])
+        weighted = matrix @ sparse.diags(self.idf)
+
+        # TruncatedSVD wymaga n_components < liczby cech
+        n_components = max(1, min(self.n_components, weighted.shape[1] - 1, weighted.shape[0] - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        embeddings = svd.fit_transform(weighted)
+
+        self.book_ids = book_ids[order]
+        self.components = np.ascontiguousarray(svd.components_, dtype=np.float32)
+        self.embeddings = normalize_dense_rows(embeddings)
+        self._compute_model_id()
+        return self
+
+    def transform(self, matrix):
+        """
+        Osadzenia nowych wierszy (np. książek dodanych po dopasowaniu)
+        """
+        weighted = sparse.csr_matrix(matrix) @ sparse.diags(self.idf)
+        return normalize_dense_rows(weighted @ self.components.T)
+
+    def row(self, book_id):
+        row = int(np.searchsorted(self.book_ids, book_id))
+        if row < len(self.book_ids) and self.book_ids[row] == book_id:
+            return row
+        return None
+
+    def similar_to_embedding(self, embedding, limit=10, min_similarity=0.1, exclude_id=None):
+        """
+        (ID sąsiadów, kosinusy) malejąco - jedno mnożenie macierz-wektor
+        """
+        scores = self.embeddings @ np.asarray(embedding, dtype=np.float32)
+        if exclude_id is not None:
+            row = self.row(exclude_id)
+            if row is not None:
+                scores[row] = -np.inf
+
+        candidates = np.flatnonzero(scores >= min_similarity)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        return self.book_ids[candidates], scores[candidates]
+
+    def similar(self, book_id, limit=10, min_similarity=0.1):
+        """
+        Sąsiedzi książki z modelu albo None, jeśli jej nie ma w modelu
+        """
+        row = self.row(book_id)
+        if row is None:
+            return None
+        return self.similar_to_embedding(
+            self.embeddings[row], limit=limit, min_similarity=min_similarity, exclude_id=book_id
+        )
+
+    def iter_top_k_blocks(self, top_k, min_similarity=0.1, block_size=256, start_row=0):
+        """
+        K najlepszych sąsiadów blok po bloku: (start, end, wiersze, kolumny, kosinusy).
+        Indeksy dotyczą wierszy modelu (kolejność `book_ids`); pary w wierszu
+        są posortowane malejąco.
+        """
+        total = len(self.book_ids)
+        k = min(top_k, max(total - 1, 1))
+
+        for start in range(start_row, total, block_size):
+            end = min(start + block_size, total)
+            scores = self.embeddings[start:end] @ self.embeddings.T
+            local = np.arange(end - start)
+            scores[local, local + start] = -np.inf
+
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+            keep = best_scores >= min_similarity
+            rows = np.repeat(np.arange(start, end, dtype=np.int64), keep.sum(axis=1))
+
+            yield start, end, rows, best[keep].astype(np.int64), best_scores[keep].astype(np.float64)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(
+            path,
+            book_ids=self.book_ids,
+            embeddings=self.embeddings,
+            components=self.components,
+            idf=self.idf,
+            use_idf=np.asarray(self.use_idf),
+        )
+
+    @classmethod
+    def load(cls, path):
+        model = cls()
+        with np.load(path) as data:
+            model.book_ids = data['book_ids']
+            model.embeddings = np.ascontiguousarray(data['embeddings'])
+            model.components = data['components']
+            model.idf = data['idf']
+            model.use_idf = bool(data['use_idf'])
+        model.n_components = model.components.shape[0]
+        model._compute_model_id()
+        return model
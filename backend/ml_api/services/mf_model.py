@@ -0,0 +1,203 @@
+"""
+Rekomendacje z faktoryzacji macierzy ocen (truncated SVD, scipy.sparse).
+
+Macierz użytkownik x książka jest centrowana średnią użytkownika i
+rozkładana na k czynników: R ≈ U·S·Vᵀ. Zapisujemy czynniki
+użytkowników U·√S i książek V·√S (float32), więc wynik książki dla
+użytkownika to iloczyn skalarny, a ranking całego katalogu - jedno
+mnożenie macierz-wektor i argpartition.
+
+Nowi użytkownicy (lub ci, którzy ocenili coś po dopasowaniu) są
+rzutowani na przestrzeń czynników (fold-in): u = r_c·V·√S·S⁻¹.
+
+Artefakt jest wersjonowany - każde dopasowanie to nowy katalog
+`<root>/<wersja>/` z plikami .npy, a plik `<root>/CURRENT` wskazuje
+aktywną wersję (podmiana przez os.replace). Moduł nie zależy od Django.
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from scipy.sparse.linalg import svds
+
+MODEL_ARRAYS = ('user_ids', 'book_ids', 'user_factors', 'item_factors', 'user_means', 'singular_values')
+CURRENT_FILE = 'CURRENT'
+
+
+class MatrixFactorizationModel:
+    """
+    Czynniki ukryte użytkowników i książek
+    """
+
+    def __init__(self, n_factors=64, random_state=42):
+        self.n_factors = n_factors
+        self.random_state = random_state
+        self.user_ids = np.empty(0, dtype=np.int64)       # posortowane rosnąco
+        self.book_ids = np.empty(0, dtype=np.int64)       # posortowane rosnąco
+        self.user_factors = np.empty((0, 0), dtype=np.float32)
+        self.item_factors = np.empty((0, 0), dtype=np.float32)
+        self.user_means = np.empty(0, dtype=np.float32)
+        self.singular_values = np.empty(0, dtype=np.float32)
+        self.version = ''
+        self.meta = {}
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def fit(self, ratings):
+        """
+        Dopasuj czynniki do `RatingMatrix` (użytkownicy x książki)
+        """
+        if min(ratings.matrix.shape) < 2:
+            raise ValueError("Matrix factorization needs at least 2 users and 2 books with ratings")
+
+        centered = ratings.mean_centered()
+        counts = np.diff(ratings.matrix.indptr)
+        sums = np.asarray(ratings.matrix.sum(axis=1)).ravel()
+
+        # svds wymaga k < min(wymiary)
+        k = max(1, min(self.n_factors, min(centered.shape) - 1))
+        rng = np.random.default_rng(self.random_state)
+        v0 = rng.standard_normal(min(centered.shape))
+        u, s, vt = svds(centered.astype(np.float64), k=k, v0=v0)
+
+        # svds zwraca wartości rosnąco
+        order = np.argsort(-s)
+        u, s, vt = u[:, order], s[order], vt[order]
+        root = np.sqrt(s)
+
+        self.n_factors = k
+        self.user_ids = ratings.user_ids.copy()
+        self.book_ids = ratings.book_ids.copy()
+        self.user_factors = np.ascontiguousarray(u * root, dtype=np.float32)
+        self.item_factors = np.ascontiguousarray(vt.T * root, dtype=np.float32)
+        self.user_means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0).astype(np.float32)
+        self.singular_values = s.astype(np.float32)
+        self.meta = {'users': len(self.user_ids), 'books': len(self.book_ids), 'ratings': int(ratings.matrix.nnz)}
+        return self
+
+    def _row(self, ids, value):
+        row = int(np.searchsorted(ids, value))
+        if row < len(ids) and ids[row] == value:
+            return row
+        return None
+
+    def fold_in(self, book_ids, ratings):
+        """
+        Wektor czynników użytkownika z jego ocen (książki spoza modelu pomijane)
+        """
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        rows = np.searchsorted(self.book_ids, book_ids)
+        rows = np.clip(rows, 0, max(len(self.book_ids) - 1, 0))
+        known = self.book_ids[rows] == book_ids if len(self.book_ids) else np.zeros(len(book_ids), dtype=bool)
+        if not known.any():
+            return None
+
+        centered = ratings[known] - ratings[known].mean()
+        projection = centered @ self.item_factors[rows[known]].astype(np.float64)
+        return (projection / np.maximum(self.singular_values, 1e-12)).astype(np.float32)
+
+    def user_vector(self, user_id, book_ids=None, ratings=None):
+        """
+        Zapisany wektor użytkownika; bez niego - fold-in z podanych ocen
+        """
+        row = self._row(self.user_ids, user_id)
+        if row is not None:
+            return self.user_factors[row]
+        if book_ids is not None and len(book_ids):
+            return self.fold_in(book_ids, ratings)
+        return None
+
+    def recommend(self, user_vector, exclude_ids=(), limit=10):
+        """
+        (ID książek, wyniki) malejąco - cały katalog jednym iloczynem
+        """
+        scores = self.item_factors @ np.asarray(user_vector, dtype=np.float32)
+
+        exclude_ids = np.asarray(list(exclude_ids), dtype=np.int64)
+        if len(exclude_ids) and len(self.book_ids):
+            rows = np.clip(np.searchsorted(self.book_ids, exclude_ids), 0, len(self.book_ids) - 1)
+            scores[rows[self.book_ids[rows] == exclude_ids]] = -np.inf
+
+        candidates = np.flatnonzero(np.isfinite(scores))
+        limit = min(limit, len(candidates))
+        if limit == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        return self.book_ids[candidates], scores[candidates]
+
+    def _compute_version(self, fitted_at):
+        digest = hashlib.sha256()
+        digest.update(self.book_ids.tobytes())
+        digest.update(self.item_factors.tobytes())
+        return f"{fitted_at}-{digest.hexdigest()[:8]}"
+
+    def save(self, root, fitted_at, keep_versions=2):
+        """
+        Zapisz nową wersję w `root` i ustaw ją jako aktywną; starsze niż
+        `keep_versions` ostatnich są usuwane. Zwraca nazwę wersji.
+        """
+        self.version = self._compute_version(fitted_at)
+        self.meta.update(version=self.version, n_factors=self.n_factors, fitted_at=fitted_at)
+
+        path = os.path.join(root, self.version)
+        staging = f'{path}.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        for name in MODEL_ARRAYS:
+            np.save(os.path.join(staging, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(staging, path)
+
+        pointer = os.path.join(root, f'{CURRENT_FILE}.tmp')
+        with open(pointer, 'w') as f:
+            f.write(self.version)
+        os.replace(pointer, os.path.join(root, CURRENT_FILE))
+
+        # Otwarte mapowania w workerach nadal wskazują na stare pliki (inode)
+        versions = sorted(
+            name for name in os.listdir(root)
+            if os.path.isdir(os.path.join(root, name)) and not name.endswith('.tmp')
+        )
+        for name in versions[:-keep_versions] if keep_versions > 0 else []:
+            if name != self.version:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+        return self.version
+
+    @staticmethod
+    def current_version(root):
+        try:
+            with open(os.path.join(root, CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    @classmethod
+    def load(cls, root, version=None):
+        """
+        Wczytaj wersję (domyślnie aktywną) - tablice mapowane w pamięć
+        """
+        version = version or cls.current_version(root)
+        if version is None:
+            return None
+
+        path = os.path.join(root, version)
+        model = cls()
+        for name in MODEL_ARRAYS:
+            setattr(model, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+        with open(os.path.join(path, 'meta.json')) as f:
+            model.meta = json.load(f)
+
+        model.version = version
+        model.n_factors = model.item_factors.shape[1]
+        return model
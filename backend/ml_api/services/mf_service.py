@@ -0,0 +1,109 @@
+import os
+import time
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import BookReview
+from .mf_model import MatrixFactorizationModel
+from .rating_matrix import RatingMatrix
+from .user_similarity_service import load_recommended_books
+
+
+class MatrixFactorizationService:
+    """
+    Collaborative recommendations from latent factors of the user x book
+    rating matrix; factors are fitted offline and stored as a versioned
+    artifact, serving scores the whole catalog with one dot product
+    """
+
+    def __init__(self):
+        self.n_factors = settings.MF_FACTORS
+        self.keep_versions = 2
+        self.model_root = os.path.join(settings.ML_ARTIFACTS_DIR, 'mf')
+        self._model = None
+
+    def fit(self, n_factors=None):
+        """
+        Fit factors from all reviews and publish them as a new version
+        """
+        print("FITTING MATRIX FACTORIZATION")
+        print("=" * 50)
+
+        started = time.time()
+        reviews = np.array(
+            list(BookReview.objects.values_list('user_id', 'book_id', 'rating')),
+            dtype=np.int64
+        ).reshape(-1, 3)
+        ratings = RatingMatrix.from_triples(reviews[:, 0], reviews[:, 1], reviews[:, 2])
+        print(f"👥 {len(ratings)} users x 📚 {len(ratings.book_ids)} books, {len(reviews)} reviews")
+
+        model = MatrixFactorizationModel(n_factors=n_factors or self.n_factors).fit(ratings)
+        version = model.save(
+            self.model_root,
+            fitted_at=timezone.now().strftime('%Y%m%dT%H%M%S'),
+            keep_versions=self.keep_versions
+        )
+
+        self._model = MatrixFactorizationModel.load(self.model_root, version)
+
+        print("=" * 50)
+        print(f"✅ MODEL {version} COMPLETED in {time.time() - started:.1f}s ({model.n_factors} factors)")
+        return self._model
+
+    def get_model(self):
+        """
+        Active model version (None before the first fit); a version
+        published by another process is picked up on the next call
+        """
+        version = MatrixFactorizationModel.current_version(self.model_root)
+        if version is None:
+            return self._model
+        if self._model is None or self._model.version != version:
+            self._model = MatrixFactorizationModel.load(self.model_root, version)
+            print(f"🧭 MF model {version} loaded: {len(self._model)} books")
+        return self._model
+
+    def get_recommendations(self, user, limit=10):
+        """
+        Top books for a user by predicted preference; users who were not in
+        the fit are folded in from their current reviews
+        """
+        model = self.get_model()
+        if model is None:
+            return []
+
+        reviews = np.array(
+            list(BookReview.objects.filter(user=user).values_list('book_id', 'rating')),
+            dtype=np.int64
+        ).reshape(-1, 2)
+
+        user_vector = model.user_vector(user.id, reviews[:, 0], reviews[:, 1])
+        if user_vector is None:
+            return []
+
+        book_ids, scores = model.recommend(user_vector, exclude_ids=reviews[:, 0], limit=limit)
+
+        books = load_recommended_books(book_ids.tolist())
+
+        return [
+            {
+                'book': books[book_id],
+                'recommendation_score': float(score),
+                'recommendation_type': 'matrix_factorization',
+                'reason': 'Matches the taste profile learned from your ratings'
+            }
+            for book_id, score in zip(book_ids.tolist(), scores.tolist())
+            if book_id in books
+        ]
+
+
+# Singleton instance
+_mf_service = None
+
+def get_mf_service():
+    """Get singleton instance"""
+    global _mf_service
+    if _mf_service is None:
+        _mf_service = MatrixFactorizationService()
+    return _mf_service
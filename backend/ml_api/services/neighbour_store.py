@@ -0,0 +1,191 @@
+"""
+Binarny magazyn sąsiadów książek (CSR) czytany przez numpy.memmap.
+
+Zadanie liczenia podobieństw eksportuje tabelę `book_similarities` do katalogu
+z plikami .npy:
+
+    book_ids.npy    - posortowane ID książek (wiersze CSR)
+    offsets.npy     - int64, len(book_ids) + 1; sąsiedzi wiersza i to
+                      neighbours[offsets[i]:offsets[i + 1]]
+    neighbours.npy  - int64, ID sąsiadów (malejąco po podobieństwie)
+    scores.npy      - float32, (liczba krawędzi x 5) w kolejności SIMILARITY_FIELDS
+
+Workery API otwierają pliki w trybie mmap - dane są współdzielone przez
+cache stron systemu, a lista sąsiadów nie wymaga zapytań do bazy.
+
+Przeliczenie pojedynczej książki nie unieważnia całego magazynu - jej ID
+(i ID sąsiadów, których listy się zmieniły) trafiają do `stale.npy`;
+dla tych książek `similar` zwraca None i odpowiada baza danych.
+"""
+import os
+import shutil
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from ml_api.services.similarity_engine import SIMILARITY_FIELDS
+
+STORE_FILES = ('book_ids', 'offsets', 'neighbours', 'scores')
+STALE_FILE = 'stale.npy'
+
+
+class NeighbourStore:
+    """
+    Tylko-do-odczytu widok magazynu sąsiadów (pliki mapowane w pamięć)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in STORE_FILES
+        }
+        self.book_ids = arrays['book_ids']
+        self.offsets = arrays['offsets']
+        self.neighbours = arrays['neighbours']
+        self.scores = arrays['scores']
+        self._stale_ids = np.empty(0, dtype=np.int64)
+        self._stale_mtime = None
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def __contains__(self, book_id):
+        return self._row(book_id) is not None
+
+    def similar(self, book_id, limit=10, min_similarity=0.1):
+        """
+        Zwróć (ID sąsiadów, wyniki float32 [n x 5]) posortowane malejąco
+        po `cosine_similarity` albo None, jeśli książki nie ma w magazynie
+        """
+        row = self._row(book_id)
+        if row is None or self.is_stale(book_id):
+            return None
+
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        cosine = self.scores[start:end, 0]
+
+        # Wyniki są posortowane malejąco - wystarczy policzyć prefiks >= progu
+        count = min(int(np.count_nonzero(cosine >= min_similarity)), limit)
+
+        return (
+            np.array(self.neighbours[start:start + count]),
+            np.array(self.scores[start:start + count]),
+        )
+
+    def neighbour_ids(self, book_id):
+        """
+        Wszyscy zapisani sąsiedzi książki (pary są symetryczne - to także
+        książki, na których listach ona jest)
+        """
+        row = self._row(book_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        return np.array(self.neighbours[int(self.offsets[row]):int(self.offsets[row + 1])])
+
+    def is_stale(self, book_id):
+        """
+        Czy lista książki była zmieniona po eksporcie (plik odczytywany
+        ponownie po zmianie mtime)
+        """
+        try:
+            mtime = os.stat(os.path.join(self.path, STALE_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+        if mtime != self._stale_mtime:
+            self._stale_ids = np.load(os.path.join(self.path, STALE_FILE))
+            self._stale_mtime = mtime
+
+        index = int(np.searchsorted(self._stale_ids, book_id))
+        return index < len(self._stale_ids) and self._stale_ids[index] == book_id
+
+    @classmethod
+    def mark_stale(cls, path, book_ids):
+        """
+        Dopisz książki do listy nieaktualnych (blokada pliku między procesami)
+        """
+        if not os.path.isdir(path):
+            return
+
+        with open(os.path.join(path, 'stale.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            stale_path = os.path.join(path, STALE_FILE)
+            current = np.load(stale_path) if os.path.exists(stale_path) else np.empty(0, dtype=np.int64)
+            stale = np.union1d(current, np.asarray(list(book_ids), dtype=np.int64))
+
+            temporary = os.path.join(path, 'stale.tmp.npy')
+            np.save(temporary, stale)
+            os.replace(temporary, stale_path)
+
+    def stats(self):
+        stale_path = os.path.join(self.path, STALE_FILE)
+        return {
+            'books': len(self.book_ids),
+            'edges': len(self.neighbours),
+            'stale': len(np.load(stale_path)) if os.path.exists(stale_path) else 0,
+            'bytes': sum(
+                os.path.getsize(os.path.join(self.path, f'{name}.npy'))
+                for name in STORE_FILES
+            ),
+        }
+
+    def _row(self, book_id):
+        row = int(np.searchsorted(self.book_ids, book_id))
+        if row < len(self.book_ids) and self.book_ids[row] == book_id:
+            return row
+        return None
+
+    @classmethod
+    def write(cls, path, book_ids, book1_ids, book2_ids, scores):
+        """
+        Zapisz magazyn z par (book1_id, book2_id) i macierzy wyników
+        (pary x SIMILARITY_FIELDS). Każda para trafia do list obu książek.
+
+        Pliki są zapisywane do katalogu tymczasowego, który potem zastępuje
+        poprzednią wersję.
+        """
+        book_ids = np.unique(np.asarray(book_ids, dtype=np.int64))
+        book1_ids = np.asarray(book1_ids, dtype=np.int64)
+        book2_ids = np.asarray(book2_ids, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1, len(SIMILARITY_FIELDS))
+
+        sources = np.concatenate([book1_ids, book2_ids])
+        targets = np.concatenate([book2_ids, book1_ids])
+        scores = np.concatenate([scores, scores])
+
+        # Grupuj po książce źródłowej, w grupie malejąco po kosinusie
+        order = np.lexsort((-scores[:, 0], sources))
+        sources, targets, scores = sources[order], targets[order], scores[order]
+
+        rows = np.searchsorted(book_ids, sources)
+        offsets = np.zeros(len(book_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(book_ids)), out=offsets[1:])
+
+        staging = f'{path}.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        for name, values in (
+            ('book_ids', book_ids),
+            ('offsets', offsets),
+            ('neighbours', targets),
+            ('scores', np.ascontiguousarray(scores)),
+        ):
+            np.save(os.path.join(staging, f'{name}.npy'), values)
+
+        # Otwarte mapowania w workerach nadal wskazują na stare pliki (inode),
+        # więc można je bezpiecznie usunąć
+        previous = f'{path}.old'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, previous)
+        os.rename(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+        return cls(path)
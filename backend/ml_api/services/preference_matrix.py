@@ -0,0 +1,117 @@
+"""
+Profile preferencji wszystkich użytkowników jako macierze - podobieństwo
+preferencji dla wielu par naraz.
+
+Tak samo jak `UserSimilarityService.calculate_preference_similarity`:
+    0.6 * kosinus wag kategorii
+  + 0.3 * Jaccard ulubionych autorów
+  + 0.1 * Jaccard ulubionych wydawców
+
+Kategorie to macierz wag (użytkownicy x kategorie, wiersze znormalizowane
+L2), autorzy i wydawcy - macierze binarne; wszystkie rzadkie (CSR). Część
+wspólna zbiorów to iloczyn A·Aᵀ, suma: |A| + |B| - |A ∩ B|. Pusty profil
+(lub jego brak) daje zerowy wiersz, czyli podobieństwo 0.
+
+Wyniki bloku też są rzadkie - pamięć zależy od liczby par z czymś wspólnym,
+a nie od rozmiaru bloku x wszyscy użytkownicy.
+Moduł nie zależy od Django.
+"""
+import numpy as np
+from scipy import sparse
+
+PREFERENCE_WEIGHTS = {'categories': 0.6, 'authors': 0.3, 'publishers': 0.1}
+
+
+def binary_matrix(rows_values, n_rows):
+    """
+    Rzadka macierz 0/1 z list wartości (powtórzenia liczone raz - jak w zbiorze)
+    """
+    vocabulary = {}
+    rows, cols = [], []
+    for row, values in rows_values:
+        for value in set(values or []):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(value, len(vocabulary)))
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(n_rows, len(vocabulary))
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+
+class PreferenceMatrix:
+    """
+    Zakodowane profile; wiersze w kolejności `user_ids` (posortowane)
+    """
+
+    def __init__(self, user_ids, categories, authors, publishers):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.categories = sparse.csr_matrix(categories)   # wiersze znormalizowane L2
+        self.categories_T = self.categories.T.tocsr()
+        self.authors = authors              # CSR 0/1
+        self.authors_T = authors.T.tocsr()
+        self.author_counts = np.asarray(authors.sum(axis=1)).ravel()
+        self.publishers = publishers        # CSR 0/1
+        self.publishers_T = publishers.T.tocsr()
+        self.publisher_counts = np.asarray(publishers.sum(axis=1)).ravel()
+
+    @classmethod
+    def from_profiles(cls, user_ids, profiles):
+        """
+        user_ids - wiersze macierzy; profiles - {user_id: profil} (brak = pusty wiersz)
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        rows = {user_id: row for row, user_id in enumerate(user_ids.tolist())}
+        owned = [(rows[user_id], profile) for user_id, profile in profiles.items() if user_id in rows]
+
+        category_keys = {}
+        for _, profile in owned:
+            for key in (profile.preferred_categories or {}):
+                category_keys.setdefault(key, len(category_keys))
+
+        categories = np.zeros((len(user_ids), len(category_keys)))
+        for row, profile in owned:
+            for key, weight in (profile.preferred_categories or {}).items():
+                categories[row, category_keys[key]] = weight
+
+        norms = np.linalg.norm(categories, axis=1, keepdims=True)
+        categories = np.divide(categories, norms, out=np.zeros_like(categories), where=norms > 0)
+
+        authors = binary_matrix(((row, profile.preferred_authors) for row, profile in owned), len(user_ids))
+        publishers = binary_matrix(((row, profile.preferred_publishers) for row, profile in owned), len(user_ids))
+
+        return cls(user_ids, categories, authors, publishers)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @staticmethod
+    def _jaccard(block, matrix_T, counts, rows):
+        # Jaccard liczony tylko tam, gdzie część wspólna jest niezerowa
+        intersection = (block @ matrix_T).tocoo()
+        union = counts[rows][intersection.row] + counts[intersection.col] - intersection.data
+        return sparse.csr_matrix(
+            (intersection.data / union, (intersection.row, intersection.col)), shape=intersection.shape
+        )
+
+    def similarity_rows(self, rows):
+        """
+        Rzadka macierz CSR (len(rows) x wszyscy użytkownicy) podobieństw preferencji 0-1
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+
+        category_similarity = self.categories[rows] @ self.categories_T
+        author_similarity = self._jaccard(self.authors[rows], self.authors_T, self.author_counts, rows)
+        publisher_similarity = self._jaccard(self.publishers[rows], self.publishers_T, self.publisher_counts, rows)
+
+        similarity = (
+            category_similarity * PREFERENCE_WEIGHTS['categories'] +
+            author_similarity * PREFERENCE_WEIGHTS['authors'] +
+            publisher_similarity * PREFERENCE_WEIGHTS['publishers']
+        )
+        # Iloczyn macierzy sumuje w innej kolejności niż np.dot dla pary -
+        # zaokrąglenie, żeby pary na progu wypadały tak samo
+        similarity = similarity.tocsr()
+        similarity.data = np.round(similarity.data, 12)
+        return similarity
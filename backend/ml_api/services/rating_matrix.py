@@ -0,0 +1,168 @@
+"""
+Rzadka macierz ocen użytkownik x książka i podobieństwo ocen dla wszystkich
+par użytkowników liczone blokowymi iloczynami macierzy.
+
+Pearson jest liczony dokładnie jak w ścieżce para po parze - tylko na
+wspólnych książkach, ze średnimi z tych książek - z sum po wspólnych
+książkach (B to maska ocen):
+
+    n    = B·Bᵀ        Σx  = R·Bᵀ      Σy  = B·Rᵀ
+    Σxy  = R·Rᵀ        Σx² = R²·Bᵀ     Σy² = B·(R²)ᵀ
+
+Cosinus działa na macierzy wycentrowanej średnią użytkownika (po wszystkich
+jego ocenach). Obie miary są przeskalowane do 0-1: (r + 1) / 2, a pary z
+mniej niż `min_common` wspólnymi książkami (lub zerową wariancją) dostają 0.
+Moduł nie zależy od Django.
+"""
+import numpy as np
+from scipy import sparse
+
+RATING_METRICS = ('pearson', 'cosine')
+
+
+class RatingMatrix:
+    """
+    Oceny jako macierz CSR; wiersze to `user_ids`, kolumny `book_ids` (posortowane)
+    """
+
+    def __init__(self, user_ids, book_ids, matrix):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.book_ids = np.asarray(book_ids, dtype=np.int64)
+        self.matrix = matrix
+
+    @classmethod
+    def from_triples(cls, user_ids, book_ids, ratings, all_user_ids=None):
+        """
+        Zbuduj macierz z trójek (użytkownik, książka, ocena).
+        all_user_ids - pełna lista wierszy (także użytkownicy bez ocen)
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+
+        rows_universe = np.unique(np.concatenate([
+            user_ids, np.asarray(all_user_ids if all_user_ids is not None else [], dtype=np.int64)
+        ]))
+        columns_universe = np.unique(book_ids)
+
+        matrix = sparse.csr_matrix(
+            (ratings, (np.searchsorted(rows_universe, user_ids), np.searchsorted(columns_universe, book_ids))),
+            shape=(len(rows_universe), len(columns_universe)),
+        )
+        matrix.sum_duplicates()
+        return cls(rows_universe, columns_universe, matrix)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def row(self, user_id):
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return row
+        return None
+
+    def mask(self):
+        mask = self.matrix.copy()
+        mask.data[:] = 1.0
+        return mask
+
+    def mean_centered(self):
+        """
+        Oceny minus średnia użytkownika (tylko istniejące oceny; wzorzec bez zmian)
+        """
+        counts = np.diff(self.matrix.indptr)
+        sums = np.asarray(self.matrix.sum(axis=1)).ravel()
+        means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+        centered = self.matrix.copy()
+        centered.data = centered.data - np.repeat(means, counts)
+        return centered
+
+
+class RatingSimilarityEngine:
+    """
+    Podobieństwo ocen użytkowników blokami wierszy
+    """
+
+    def __init__(self, metric='pearson', min_common=2, block_size=500):
+        if metric not in RATING_METRICS:
+            raise ValueError(f"Unknown rating metric: {metric}")
+        self.metric = metric
+        self.min_common = min_common  # Minimum wspólnych książek
+        self.block_size = block_size
+
+    def prepare(self, ratings):
+        """
+        Macierze pomocnicze liczone raz na przebieg
+        """
+        mask = ratings.mask()
+        prepared = {'R': ratings.matrix, 'B': mask, 'BT': mask.T.tocsr()}
+
+        if self.metric == 'pearson':
+            prepared['RT'] = ratings.matrix.T.tocsr()
+            prepared['R2T'] = ratings.matrix.multiply(ratings.matrix).T.tocsr()
+        else:
+            centered = ratings.mean_centered()
+            prepared['C'] = centered
+            prepared['CT'] = centered.T.tocsr()
+            prepared['norms'] = np.sqrt(np.asarray(centered.multiply(centered).sum(axis=1)).ravel())
+
+        return prepared
+
+    def score_rows(self, prepared, rows, upper_only=True):
+        """
+        Podobieństwa wierszy `rows` (posortowane indeksy) do wszystkich użytkowników.
+        Zwraca (wiersze, kolumny, podobieństwa 0-1) dla par z >= min_common
+        wspólnymi książkami; upper_only - tylko kolumny > wiersz (każda para raz).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        B = prepared['B']
+
+        common = (B[rows] @ prepared['BT']).tocoo()
+        local = common.row.astype(np.int64)
+        cols = common.col.astype(np.int64)
+        n = common.data
+
+        keep = (n >= self.min_common) & (cols != rows[local])
+        if upper_only:
+            keep &= cols > rows[local]
+        local, cols, n = local[keep], cols[keep], n[keep]
+
+        if len(local) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+        def pick(matrix):
+            matrix = matrix.tocsr()
+            matrix.sort_indices()  # odczyt par z nieposortowanego CSR jest bardzo wolny
+            return np.asarray(matrix[local, cols]).ravel()
+
+        if self.metric == 'pearson':
+            R = prepared['R'][rows]
+            sum_x = pick(R @ prepared['BT'])
+            sum_y = pick(B[rows] @ prepared['RT'])
+            sum_xy = pick(R @ prepared['RT'])
+            sum_xx = pick(R.multiply(R) @ prepared['BT'])
+            sum_yy = pick(B[rows] @ prepared['R2T'])
+
+            numerator = sum_xy - sum_x * sum_y / n
+            variance = np.clip(sum_xx - sum_x ** 2 / n, 0, None) * np.clip(sum_yy - sum_y ** 2 / n, 0, None)
+            denominator = np.sqrt(variance)
+        else:
+            numerator = pick(prepared['C'][rows] @ prepared['CT'])
+            denominator = prepared['norms'][rows[local]] * prepared['norms'][cols]
+
+        valid = denominator > 1e-12
+        correlation = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=valid)
+        # Wzór z sum gubi kilka ostatnich bitów - zaokrąglenie, żeby pary na progu
+        # wypadały tak samo jak w liczeniu para po parze
+        similarity = np.where(valid, np.clip(np.round((correlation + 1) / 2, 12), 0.0, 1.0), 0.0)
+
+        return rows[local], cols, similarity
+
+    def iter_blocks(self, prepared, total):
+        """
+        (start, end, wiersze, kolumny, podobieństwa) dla górnego trójkąta, blok po bloku
+        """
+        for start in range(0, total, self.block_size):
+            end = min(start + self.block_size, total)
+            yield (start, end) + self.score_rows(prepared, np.arange(start, end))
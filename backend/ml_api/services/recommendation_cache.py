@@ -0,0 +1,63 @@
+"""
+Klucze cache rekomendacji książek.
+
+Całość unieważnia `SimilarityGeneration.cache_version` (przeliczenie).
+Pojedyncze książki mają własny licznik w cache
+(`book_recommendations_token:<id>`) będący częścią klucza - jego zmiana
+unieważnia wszystkie warianty (limit, próg, szczegóły) tylko tej książki.
+Zmiana danych książki (tytuł, autorzy, kategorie, oceny) unieważnia ją
+i książki, które mają ją na liście sąsiadów.
+"""
+from django.core.cache import caches
+from django.db.models import Q
+
+from ..models import BookSimilarity
+
+TOKEN_KEY = 'book_recommendations_token:{book_id}'
+
+
+def get_cache():
+    return caches['recommendations']
+
+
+def book_token(book_id, cache=None):
+    cache = cache or get_cache()
+    return cache.get(TOKEN_KEY.format(book_id=book_id), 0)
+
+
+def book_recommendations_key(book_id, limit, min_similarity, include_details, cache=None):
+    token = book_token(book_id, cache)
+    return f"book_recommendations:{book_id}:{token}:{limit}:{min_similarity}:{int(include_details)}"
+
+
+def invalidate_books(book_ids):
+    """
+    Unieważnij zapisane rekomendacje podanych książek (bez ruszania reszty)
+    """
+    cache = get_cache()
+    for book_id in set(book_ids):
+        key = TOKEN_KEY.format(book_id=book_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Brak licznika - klucze używały tokenu 0; licznik bez wygasania
+            cache.set(key, 1, timeout=None)
+
+
+def neighbour_ids(book_ids):
+    """
+    Książki, na których listach sąsiadów są podane książki (pary są symetryczne)
+    """
+    book_ids = set(book_ids)
+    pairs = BookSimilarity.live().filter(
+        Q(book1_id__in=book_ids) | Q(book2_id__in=book_ids)
+    ).values_list('book1_id', 'book2_id')
+    return {book_id for pair in pairs for book_id in pair} - book_ids
+
+
+def invalidate_books_and_neighbours(book_ids):
+    """
+    Unieważnij podane książki i te, które pokazują je jako polecane
+    """
+    book_ids = set(book_ids)
+    invalidate_books(book_ids | neighbour_ids(book_ids))
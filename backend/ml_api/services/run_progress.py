@@ -0,0 +1,79 @@
+"""
+Checkpointy długich przeliczeń podobieństw (tabela SimilarityRun)
+oraz raportowanie przepustowości i szacowanego czasu do końca.
+"""
+import time
+from datetime import timedelta
+
+from ml_api.models import SimilarityRun
+
+
+class RunProgress:
+    """
+    Zapisuje postęp przebiegu po każdej jednostce pracy (blok lub książka)
+    """
+
+    def __init__(self, run, unit='blocks'):
+        self.run = run
+        self.unit = unit
+        # Przepustowość liczona od startu tej sesji (także po wznowieniu)
+        self._session_started = time.perf_counter()
+        self._session_start_units = run.completed_units
+
+    @classmethod
+    def start(cls, engine, generation, total_units, parameters, unit='blocks'):
+        run = SimilarityRun.objects.create(
+            engine=engine,
+            generation=generation,
+            total_units=total_units,
+            parameters=parameters,
+        )
+        return cls(run, unit=unit)
+
+    def checkpoint(self, completed_units, last_book_id=None):
+        """
+        Zapisz liczbę ukończonych jednostek (i ostatnią książkę w pairwise)
+        """
+        self.run.completed_units = completed_units
+        update_fields = ['completed_units', 'updated_at']
+
+        if last_book_id is not None:
+            self.run.last_book_id = last_book_id
+            update_fields.append('last_book_id')
+
+        self.run.save(update_fields=update_fields)
+
+    def finish(self, status='completed'):
+        self.run.status = status
+        self.run.save(update_fields=['status', 'updated_at'])
+
+    def units_per_second(self):
+        elapsed = time.perf_counter() - self._session_started
+        done = self.run.completed_units - self._session_start_units
+        return done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """
+        Szacowany czas do końca (None, dopóki nie ma pomiaru)
+        """
+        rate = self.units_per_second()
+        if rate <= 0:
+            return None
+        remaining = max(self.run.total_units - self.run.completed_units, 0)
+        return timedelta(seconds=round(remaining / rate))
+
+    def describe(self, rows_written=None):
+        total = self.run.total_units
+        done = self.run.completed_units
+        percent = (done / total * 100) if total else 100.0
+        eta = self.eta()
+
+        line = (
+            f"📈 {done}/{total} {self.unit} ({percent:.1f}%) | "
+            f"{self.units_per_second():.2f} {self.unit}/s"
+        )
+        if rows_written is not None:
+            elapsed = time.perf_counter() - self._session_started
+            line += f" | {rows_written / elapsed if elapsed > 0 else 0:.0f} rows/s"
+        line += f" | ETA {eta if eta is not None else '?'}"
+        return line
@@ -0,0 +1,438 @@
+"""
+Wektoryzowany silnik podobieństw książek oparty o macierze rzadkie (scipy.sparse).
+
+Zamiast liczyć podobieństwo para po parze na słownikach, budujemy jedną
+macierz CSR na aspekt (kategorie, słowa kluczowe, autorzy, opis), normalizujemy
+wiersze (L2) i wyliczamy wszystkie podobieństwa kosinusowe blokowymi
+iloczynami macierzy. Moduł nie zależy od Django - operuje tylko na słownikach
+wektorów (format z `BookSimilarityService.create_book_vector` / `BookVector`).
+"""
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from scipy import sparse
+
+ASPECTS = ('category', 'keyword', 'author', 'description')
+
+SIMILARITY_FIELDS = (
+    'cosine_similarity',
+    'category_similarity',
+    'keyword_similarity',
+    'author_similarity',
+    'description_similarity',
+)
+
+
+def build_aspect_matrix(dict_vectors, vocabulary=None):
+    """
+    Zbuduj macierz CSR (książki x cechy) z listy słowników {cecha: waga}
+    """
+    if vocabulary is None:
+        vocabulary = {}
+
+    indptr = [0]
+    indices = []
+    data = []
+
+    for vector in dict_vectors:
+        for feature, weight in vector.items():
+            index = vocabulary.setdefault(feature, len(vocabulary))
+            indices.append(index)
+            data.append(weight)
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (
+            np.asarray(data, dtype=np.float64),
+            np.asarray(indices, dtype=np.int32),
+            np.asarray(indptr, dtype=np.int64),
+        ),
+        shape=(len(dict_vectors), max(len(vocabulary), 1)),
+    )
+    matrix.sum_duplicates()
+    return matrix, vocabulary
+
+
+def l2_normalize_rows(matrix):
+    """
+    Znormalizuj wiersze macierzy rzadkiej (wiersze zerowe zostają zerowe)
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=np.float64)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+
+    inverse = np.zeros_like(norms)
+    nonzero = norms > 0
+    inverse[nonzero] = 1.0 / norms[nonzero]
+
+    return sparse.csr_matrix(sparse.diags(inverse) @ matrix)
+
+
+def share_matrices(matrices):
+    """
+    Skopiuj macierze CSR do pamięci współdzielonej.
+    Zwraca (opis do przekazania workerom, uchwyty SharedMemory do zwolnienia)
+    """
+    spec = {}
+    handles = []
+
+    for name, matrix in matrices.items():
+        parts = {}
+        for part in ('data', 'indices', 'indptr'):
+            values = getattr(matrix, part)
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            handles.append(block)
+            parts[part] = (block.name, values.shape, values.dtype.str)
+        spec[name] = (parts, matrix.shape)
+
+    return spec, handles
+
+
+def attach_matrices(spec):
+    """
+    Odtwórz macierze CSR z pamięci współdzielonej (bez kopiowania danych)
+    """
+    matrices = {}
+    handles = []
+
+    for name, (parts, shape) in spec.items():
+        arrays = {}
+        for part, (block_name, part_shape, dtype) in parts.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            handles.append(block)
+            arrays[part] = np.ndarray(part_shape, dtype=dtype, buffer=block.buf)
+        matrices[name] = sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False
+        )
+
+    return matrices, handles
+
+
+# Stan procesu roboczego puli (ustawiany raz przez _init_worker)
+_worker_state = {}
+
+
+def _init_worker(spec, book_ids, options):
+    matrices, handles = attach_matrices(spec)
+    _worker_state.update(
+        matrices=matrices,
+        handles=handles,
+        book_ids=book_ids,
+        engine=SparseSimilarityEngine(**options),
+    )
+
+
+def _score_block_in_worker(bounds):
+    start, end = bounds
+    return _worker_state['engine']._score_block_batch(
+        _worker_state['matrices'], _worker_state['book_ids'], start, end
+    )
+
+
+class SparseSimilarityEngine:
+    """
+    Liczy podobieństwa wszystkich par książek blokowymi iloczynami macierzy rzadkich
+    """
+
+    def __init__(self, aspect_weights, min_similarity=0.05, block_size=1000, top_k=None, max_block_pairs=5_000_000):
+        self.aspect_weights = aspect_weights
+        self.min_similarity = min_similarity  # Próg (przy top_k - dolna granica)
+        self.block_size = block_size
+        self.top_k = top_k  # None = zapisuj wszystkie pary powyżej progu
+        self.max_block_pairs = max_block_pairs  # Limit komórek blok x katalog
+
+    def block_size_for(self, total):
+        """
+        Rozmiar bloku dla katalogu `total` książek - iloczyn bloku z całym
+        katalogiem ma najwyżej max_block_pairs komórek
+        """
+        return max(1, min(self.block_size, self.max_block_pairs // max(total, 1)))
+
+    def build_matrices(self, book_vectors):
+        """
+        Zbuduj znormalizowane macierze dla każdego aspektu i macierz łączną.
+
+        `book_vectors` to lista słowników z kluczami `category_vector`,
+        `keyword_vector`, `author_vector`, `description_vector`.
+        Macierz łączna odpowiada `combined_vector` - konkatenacji aspektów
+        przemnożonych przez wagi - więc jej kosinus jest równy
+        `cosine_similarity` liczonemu w ścieżce para po parze.
+        """
+        raw = {}
+        for aspect in ASPECTS:
+            raw[aspect], _ = build_aspect_matrix(
+                [vector[f'{aspect}_vector'] for vector in book_vectors]
+            )
+
+        return self.build_matrices_from_raw(raw)
+
+    def build_matrices_from_raw(self, raw):
+        """
+        Jak `build_matrices`, ale z gotowych surowych macierzy aspektów
+        (np. złożonych z binarnego formatu BookVector)
+        """
+        matrices = {aspect: l2_normalize_rows(raw[aspect]) for aspect in ASPECTS}
+        matrices['combined'] = l2_normalize_rows(sparse.hstack(
+            [raw[aspect] * self.aspect_weights[aspect] for aspect in ASPECTS],
+            format='csr'
+        ))
+
+        return matrices
+
+    def iter_similarity_batches(self, matrices, book_ids, workers=1):
+        """
+        Generuj paczki wyników blok po bloku (górny trójkąt macierzy).
+
+        Każda paczka to słownik tablic: `book1_id`, `book2_id` (book1_id < book2_id)
+        oraz kolumny z SIMILARITY_FIELDS - gotowe do zapisu w `BookSimilarity`.
+
+        Przy ustawionym `top_k` zostaje tylko K najlepszych sąsiadów każdej
+        książki (suma list sąsiadów, każda para zwracana raz).
+
+        workers > 1 - bloki liczone równolegle w ProcessPoolExecutor na
+        macierzach w pamięci współdzielonej; wyniki wracają w kolejności
+        bloków, więc są takie same jak przy jednym procesie.
+        """
+        for _, _, batch in self.iter_block_batches(matrices, book_ids, workers=workers):
+            if len(batch['book1_id']):
+                yield batch
+
+    def iter_block_batches(self, matrices, book_ids, workers=1, start_row=0):
+        """
+        Jak `iter_similarity_batches`, ale zwraca (start, end, paczka) dla
+        każdego bloku wierszy (także pustego) - do zapisywania checkpointów.
+
+        start_row - wznów od bloku zaczynającego się w tym wierszu. Listy
+        sąsiadów wcześniejszych bloków nie są wtedy znane, więc w trybie
+        top-K część par może się powtórzyć - zapis musi pomijać konflikty.
+        """
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        total = len(book_ids)
+        neighbours = None
+
+        if self.top_k:
+            neighbours = np.full((total, self.top_k), -1, dtype=np.int64)
+
+        block_size = self.block_size_for(total)
+        bounds = [
+            (start, min(start + block_size, total))
+            for start in range(start_row, total, block_size)
+        ]
+
+        if workers > 1 and len(bounds) > 1:
+            results = self._iter_parallel_blocks(matrices, book_ids, bounds, workers)
+        else:
+            results = (
+                self._score_block_batch(matrices, book_ids, start, end)
+                for start, end in bounds
+            )
+
+        for (start, end), (rows, cols, batch) in zip(bounds, results):
+            if self.top_k and len(rows):
+                keep = self._drop_emitted(neighbours, rows, cols)
+                batch = {column: values[keep] for column, values in batch.items()}
+
+            yield start, end, batch
+
+    def _iter_parallel_blocks(self, matrices, book_ids, bounds, workers):
+        """
+        Policz bloki w puli procesów (macierze przekazane przez pamięć współdzieloną)
+        """
+        spec, handles = share_matrices(matrices)
+        options = {
+            'aspect_weights': self.aspect_weights,
+            'min_similarity': self.min_similarity,
+            'block_size': self.block_size,
+            'top_k': self.top_k,
+        }
+
+        # Ograniczone okno zleconych bloków - gotowe wyniki nie gromadzą się
+        # w pamięci rodzica, gdy zapis do bazy nie nadąża za pulą
+        window = 2 * workers
+        blocks = iter(bounds)
+        pending = deque()
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(spec, book_ids, options),
+        )
+
+        try:
+            for bound in itertools.islice(blocks, window):
+                pending.append(executor.submit(_score_block_in_worker, bound))
+
+            while pending:
+                result = pending.popleft().result()
+                bound = next(blocks, None)
+                if bound is not None:
+                    pending.append(executor.submit(_score_block_in_worker, bound))
+                yield result
+        finally:
+            # Przerwany generator nie czeka na resztę przebiegu - tylko na bloki w toku
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+            for block in handles:
+                block.close()
+                block.unlink()
+
+    def _score_block_batch(self, matrices, book_ids, start, end):
+        """
+        Policz blok [start, end) i złóż paczkę wyników.
+        Zwraca (wiersze, kolumny, paczka) - w trybie top-K jeszcze bez
+        usunięcia par zwróconych wcześniej (robi to `_drop_emitted`).
+        """
+        if self.top_k:
+            rows, cols, scores = self._top_k_block(matrices, start, end)
+        else:
+            rows, cols, scores = self._score_block(matrices, start, end)
+
+        if len(rows) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            batch = {column: np.empty(0) for column in SIMILARITY_FIELDS}
+            batch.update(book1_id=empty, book2_id=empty)
+            return rows, cols, batch
+
+        return rows, cols, self._make_batch(matrices, book_ids, rows, cols, scores)
+
+    def iter_incremental_batches(self, matrices, book_ids, changed_indices, kth_scores=None):
+        """
+        Przelicz tylko wiersze zmienionych książek - O(ΔN·N) zamiast O(N²).
+
+        Zwraca wszystkie pary (zmieniona, dowolna). W trybie top-K para
+        zostaje, gdy mieści się w top-K zmienionej książki albo gdy jej wynik
+        jest >= `kth_scores[j]` (obecny K-ty najlepszy wynik niezmienionej
+        książki j, czyli wchodzi do jej top-K). Pary dwóch zmienionych książek
+        mogą się wtedy powtórzyć - zapis musi pomijać konflikty.
+        """
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        changed_indices = np.unique(np.asarray(changed_indices, dtype=np.int64))
+        is_changed = np.zeros(len(book_ids), dtype=bool)
+        is_changed[changed_indices] = True
+        combined = matrices['combined']
+
+        block_size = self.block_size_for(len(book_ids))
+
+        for start in range(0, len(changed_indices), block_size):
+            block_rows = changed_indices[start:start + block_size]
+            block = (combined[block_rows] @ combined.T).tocsr()
+
+            rows, cols, scores = [], [], []
+
+            for local, row in enumerate(block_rows):
+                lo, hi = block.indptr[local], block.indptr[local + 1]
+                indices = block.indices[lo:hi].astype(np.int64)
+                values = block.data[lo:hi]
+
+                keep = (indices != row) & (values >= self.min_similarity)
+                indices, values = indices[keep], values[keep]
+
+                if self.top_k:
+                    selected = np.ones(len(values), dtype=bool)
+                    if len(values) > self.top_k:
+                        selected[:] = False
+                        selected[np.argpartition(-values, self.top_k - 1)[:self.top_k]] = True
+                    selected |= ~is_changed[indices] & (values >= kth_scores[indices])
+                else:
+                    # Para dwóch zmienionych książek - tylko raz, z mniejszego indeksu
+                    selected = ~is_changed[indices] | (indices > row)
+
+                rows.append(np.full(int(selected.sum()), row, dtype=np.int64))
+                cols.append(indices[selected])
+                scores.append(values[selected])
+
+            rows = np.concatenate(rows)
+            if len(rows) == 0:
+                continue
+
+            yield self._make_batch(matrices, book_ids, rows, np.concatenate(cols), np.concatenate(scores))
+
+    def _make_batch(self, matrices, book_ids, rows, cols, scores):
+        """
+        Złóż paczkę wyników (identyfikatory + wszystkie kolumny podobieństw)
+        """
+        batch = self._aspect_scores(matrices, rows, cols)
+        batch['cosine_similarity'] = np.clip(scores, 0.0, 1.0)
+
+        ids1 = book_ids[rows]
+        ids2 = book_ids[cols]
+        batch['book1_id'] = np.minimum(ids1, ids2)
+        batch['book2_id'] = np.maximum(ids1, ids2)
+
+        return batch
+
+    def _score_block(self, matrices, start, end):
+        """
+        Kosinus łączny dla wierszy [start, end) względem kolumn >= start.
+        Zwraca globalne indeksy par z górnego trójkąta powyżej progu.
+        """
+        combined = matrices['combined']
+        block = (combined[start:end] @ combined[start:].T).tocoo()
+
+        rows = block.row.astype(np.int64) + start
+        cols = block.col.astype(np.int64) + start
+        mask = (cols > rows) & (block.data >= self.min_similarity)
+
+        return rows[mask], cols[mask], block.data[mask]
+
+    def _top_k_block(self, matrices, start, end):
+        """
+        K najlepszych sąsiadów (>= min_similarity) dla wierszy [start, end).
+        Wybór przez argpartition w każdym wierszu.
+        """
+        combined = matrices['combined']
+        block = (combined[start:end] @ combined.T).tocsr()
+
+        rows, cols, scores = [], [], []
+
+        for local in range(end - start):
+            row = start + local
+            lo, hi = block.indptr[local], block.indptr[local + 1]
+            indices = block.indices[lo:hi]
+            values = block.data[lo:hi]
+
+            keep = (indices != row) & (values >= self.min_similarity)
+            indices, values = indices[keep], values[keep]
+
+            if len(values) > self.top_k:
+                best = np.argpartition(-values, self.top_k - 1)[:self.top_k]
+                indices, values = indices[best], values[best]
+
+            rows.append(np.full(len(indices), row, dtype=np.int64))
+            cols.append(indices.astype(np.int64))
+            scores.append(values)
+
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+    def _drop_emitted(self, neighbours, rows, cols):
+        """
+        Zapisz listy sąsiadów bloku i zwróć maskę par do zachowania.
+
+        Para (i, j), w której j < i jest pomijana, jeśli i jest już na liście
+        sąsiadów j - wtedy została zwrócona przy wierszu j. Bloki muszą
+        przychodzić w kolejności wierszy.
+        """
+        # Pozycja pary na liście sąsiadów jej wiersza (wiersze są pogrupowane)
+        group_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(rows)])
+        positions = np.arange(len(rows)) - np.repeat(group_starts, group_sizes)
+        neighbours[rows, positions] = cols
+
+        already_emitted = (cols < rows) & (neighbours[cols] == rows[:, None]).any(axis=1)
+        return ~already_emitted
+
+    def _aspect_scores(self, matrices, rows, cols):
+        """
+        Podobieństwa per aspekt tylko dla wybranych par (rows[i], cols[i]):
+        iloczyn skalarny wierszy, bez iloczynu bloku z całym katalogiem
+        """
+        scores = {}
+
+        for aspect in ASPECTS:
+            matrix = matrices[aspect]
+            values = np.asarray(matrix[rows].multiply(matrix[cols]).sum(axis=1)).ravel()
+            scores[f'{aspect}_similarity'] = np.clip(values, 0.0, 1.0)
+
+        return scores
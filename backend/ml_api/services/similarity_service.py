@@ -1,31 +1,65 @@
 import os
+import re
 import sys
 import math
 import json
+import heapq
+import itertools
+import hashlib
+import shutil
+import threading
 import nltk
 from collections import defaultdict, Counter
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import numpy as np
-from django.db import transaction, models
-from django.db.models import Q, Count, Avg
+from django.db import connection, transaction, models
+from django.db.models import Q, F, Count, Avg, Max
 from django.utils import timezone
 from datetime import timedelta
 
-# Dodaj path do Django
-sys.path.append('/app')
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+if __name__ == "__main__":
+    # Uruchomienie jako skrypt - skonfiguruj Django przed importem modeli.
+    # Zwykły import modułu nie ma żadnych efektów ubocznych.
+    sys.path.append('/app')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    
+    import django
+    django.setup()
+
+from ml_api.models import (
+    Book, BookSimilarity, BookVector, Category, Author, SimilarityGeneration, SimilarityRun, VectorFeature
+)
+from ml_api.services.similarity_engine import SparseSimilarityEngine, SIMILARITY_FIELDS, ASPECTS
+from ml_api.services.similarity_writer import SimilarityWriter
+from ml_api.services import recommendation_cache
+from ml_api.services.candidate_index import FeatureInvertedIndex
+from ml_api.services.ann_index import RandomProjectionLSH
+from ml_api.services.neighbour_store import NeighbourStore
+from ml_api.services.run_progress import RunProgress
+from ml_api.services.tfidf_model import CorpusTfidfModel
+from ml_api.services.lsa_model import LsaEmbeddingModel
+from ml_api.services.vector_codec import ASPECT_PREFIXES, pack_vector, unpack_vector, packed_to_csr
+from django.conf import settings
 
-import django
-django.setup()
+# Słowa z samych liter - odpowiednik word_tokenize + isalpha(): "well-known"
+# i "3d" odpadają, końcówki "n't" / "'s" / "'re" są odcinane ("wouldn't" -> "would")
+WORD_PATTERN = re.compile(r"(?<![\w-])([^\W\d_]+?)(?:n['’]t|['’][^\W\d_]+)?(?![\w-]|['’][^\W\d_])")
 
-from ml_api.models import Book, BookSimilarity, BookVector, Category, Author
+# Przestrzeń kluczy blokad doradczych PostgreSQL (pg_advisory_xact_lock(ns, book_id))
+# dla wyliczania dynamicznego podobieństw
+DYNAMIC_SIMILARITY_LOCK = 5101
 
 class BookSimilarityService:
     """
     Serwis do wyliczania i zarządzania podobieństwami książek
     """
     
+    # Pola wektora zapisywane w BookVector
+    VECTOR_FIELDS = (
+        'category_vector', 'keyword_vector', 'author_vector',
+        'description_vector', 'combined_vector'
+    )
+    
     def __init__(self):
         self.min_similarity_threshold = 0.05  # Minimum similarity to store
         self.tfidf_vectorizer = None
@@ -40,26 +74,58 @@ class BookSimilarityService:
         self._nltk_initialized = False
         self._stop_words = None
         
-        # POPRAWKA: Wywołaj inicjalizację NLTK od razu
-        self._ensure_nltk_data()
+        # Indeks odwrócony cech do wyboru kandydatów (budowany leniwie)
+        self._candidate_index = None
+        self.max_dynamic_candidates = 500
+        
+        # Indeks ANN (LSH) wczytywany z dysku raz na proces
+        self._ann_index = None
+        self._ann_index_loaded = False
+        self.ann_index_path = os.path.join(settings.ML_ARTIFACTS_DIR, 'book_ann_index.npz')
+        
+        # Ważenie opisu i słów kluczowych: 'tf' (surowe TF, max 50 słów opisu)
+        # albo 'tfidf' (model korpusowy dopasowany raz i zapisany na dysk)
+        self.text_weighting = settings.BOOK_VECTOR_WEIGHTING
+        self.max_description_words = None if self.text_weighting == 'tfidf' else 50
+        self._tfidf_model = None
+        self._tfidf_missing_reported = False
+        self.tfidf_model_path = os.path.join(settings.ML_ARTIFACTS_DIR, 'book_tfidf.npz')
+        
+        # Globalny słownik cech formatu binarnego (nazwa <-> ID), uzupełniany leniwie
+        self._feature_ids = {}
+        self._feature_names = []
+        
+        # Magazyn sąsiadów (CSR, memmap) - odświeżany, gdy katalog na dysku się zmieni
+        self._neighbour_store = None
+        self._neighbour_store_inode = None
+        self.neighbour_store_path = os.path.join(settings.ML_ARTIFACTS_DIR, 'book_neighbours')
+        self.export_chunk_size = 10000  # Wiersze na porcję przy eksporcie magazynu
+        
+        # Osadzenia LSA (BOOK_SIMILARITY_METHOD='lsa' / --engine lsa) wczytywane raz na proces
+        self.similarity_method = settings.BOOK_SIMILARITY_METHOD
+        self.lsa_components = settings.LSA_COMPONENTS
+        self._lsa_model = None
+        self._lsa_model_loaded = False
+        self.lsa_model_path = os.path.join(settings.ML_ARTIFACTS_DIR, 'book_lsa.npz')
+        
+        # Wyliczenia dynamiczne w toku (book_id -> Future) - single-flight
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.dynamic_wait_timeout = 120  # sekundy
+        
+        # Zasoby (NLTK, modele, indeksy) ładowane leniwie - albo w warm_up()
     
     def _ensure_nltk_data(self):
-        """Upewnij się że NLTK data jest pobrana - TYLKO RAZ"""
+        """Upewnij się że NLTK data jest pobrana - TYLKO RAZ (przy pierwszym użyciu)"""
         if self._nltk_initialized:
             return
-            
+        
+        # Tokenizacja opisów to WORD_PATTERN - z NLTK potrzebne są tylko stop words
         try:
-            # Test czy data już jest
-            nltk.data.find('tokenizers/punkt')
             nltk.data.find('corpora/stopwords')
-            nltk.data.find('corpora/wordnet')
-            print("✅ NLTK data already available")
         except LookupError:
-            print("📥 Downloading NLTK data (one-time setup)...")
-            nltk.download('punkt', quiet=True)
-            nltk.download('stopwords', quiet=True) 
-            nltk.download('wordnet', quiet=True)
-            nltk.download('omw-1.4', quiet=True)
+            print("📥 Downloading NLTK stopwords (one-time setup)...")
+            nltk.download('stopwords', quiet=True)
             print("✅ NLTK data downloaded successfully")
         
         # Cache stop words
@@ -81,54 +147,175 @@ class BookSimilarityService:
         if not self._nltk_initialized:
             self._ensure_nltk_data()
     
+    def warm_up(self):
+        """
+        Załaduj z góry zasoby używane przy obsłudze żądań (np. przy starcie
+        workera), żeby pierwsze żądania nie płaciły za leniwe ładowanie.
+        
+        Tylko odczyt istniejących danych - bez pobierania NLTK, dopasowania
+        modeli ani budowy indeksu kandydatów (ten tylko przy
+        SIMILARITY_WARM_UP_CANDIDATE_INDEX; domyślnie leniwie).
+        """
+        try:
+            nltk.data.find('corpora/stopwords')
+            self._ensure_nltk_data()
+        except LookupError:
+            print("⚠️  NLTK stopwords missing - skipped in warm-up")
+        
+        self.load_feature_vocabulary()
+        
+        if self.text_weighting == 'tfidf' and os.path.exists(self.tfidf_model_path):
+            self.get_tfidf_model()
+        
+        self.get_neighbour_store()
+        
+        if self.similarity_method == 'lsa':
+            self.get_lsa_model()
+        
+        # Bez indeksu ANN fallback korzysta z indeksu odwróconego - jego budowa
+        # dekoduje wszystkie BookVector, więc przy starcie tylko na życzenie
+        if self.get_ann_index() is None and settings.SIMILARITY_WARM_UP_CANDIDATE_INDEX:
+            self.get_candidate_index()
+        
+        print("🔥 BookSimilarityService warmed up")
+        return self
+    
     def extract_features_from_book(self, book):
         """
         Wyciągnij cechy z książki do wektoryzacji
         """
-        features = {
-            'categories': [],
-            'keywords': [],
-            'authors': [],
-            'description_words': []
-        }
-        
-        # Kategorie
-        categories = book.categories.all()
-        features['categories'] = [cat.name.lower() for cat in categories]
+        return self.extract_features_batch([book])[0]
+    
+    def extract_features_batch(self, books):
+        """
+        Wyciągnij cechy wielu książek naraz.
         
-        # Autorzy
-        authors = book.authors.all()
-        features['authors'] = [f"{author.first_name} {author.last_name}".strip().lower() for author in authors]
+        Opisy są tokenizowane jednym skompilowanym wyrażeniem regularnym
+        zamiast word_tokenize; autorzy i kategorie pochodzą z prefetch_related
+        (jeśli książki zostały pobrane bez prefetchu - jedno zapytanie na relację).
+        """
+        # Zabezpieczenie - upewnij się że stop_words są zainicjalizowane
+        if self._stop_words is None:
+            self._ensure_nltk_data()
+        stop_words = self._stop_words
         
-        # Słowa kluczowe
-        if book.keywords:
-            keywords = [kw.strip().lower() for kw in book.keywords.split(',') if kw.strip()]
-            features['keywords'] = keywords
+        all_features = []
         
-        # Słowa z opisu
-        if book.description:
-            # NLTK już zainicjalizowane, używaj cache
-            from nltk.tokenize import word_tokenize
+        for book in books:
+            features = {
+                'categories': [cat.name.lower() for cat in book.categories.all()],
+                'authors': [
+                    f"{author.first_name} {author.last_name}".strip().lower()
+                    for author in book.authors.all()
+                ],
+                'keywords': [],
+                'description_words': []
+            }
             
-            # Zabezpieczenie - upewnij się że stop_words są zainicjalizowane
-            if self._stop_words is None:
-                self._ensure_nltk_data()
+            # Słowa kluczowe
+            if book.keywords:
+                features['keywords'] = [kw.strip().lower() for kw in book.keywords.split(',') if kw.strip()]
             
-            words = word_tokenize(book.description.lower())
-            # Filtruj słowa używając cached stop_words
-            filtered_words = [
-                word for word in words 
-                if word.isalpha() and len(word) > 2 and word not in self._stop_words
-            ]
-            features['description_words'] = filtered_words[:50]  # Max 50 słów
+            # Słowa z opisu (w trybie 'tf' max 50 słów)
+            if book.description:
+                words = [
+                    word for word in WORD_PATTERN.findall(book.description.lower())
+                    if len(word) > 2 and word not in stop_words
+                ]
+                features['description_words'] = words[:self.max_description_words]
+            
+            all_features.append(features)
+        
+        return all_features
+    
+    def extract_catalog_features(self, chunk_size=500):
+        """
+        Cechy całego katalogu: książki strumieniowane paczkami z prefetch_related.
+        Zwraca (lista ID książek, lista słowników cech) posortowane po ID.
+        """
+        books = Book.objects.prefetch_related('authors', 'categories').order_by('id')
+        book_ids = []
+        all_features = []
+        chunk = []
+        
+        for book in books.iterator(chunk_size=chunk_size):
+            chunk.append(book)
+            if len(chunk) >= chunk_size:
+                book_ids.extend(book.id for book in chunk)
+                all_features.extend(self.extract_features_batch(chunk))
+                chunk = []
+        
+        if chunk:
+            book_ids.extend(book.id for book in chunk)
+            all_features.extend(self.extract_features_batch(chunk))
+        
+        return book_ids, all_features
+    
+    def get_tfidf_model(self, refit=False, fit_missing=False):
+        """
+        Korpusowy model TF-IDF wczytany z dysku. Dopasowanie do całego katalogu
+        tylko w przebiegach wsadowych (refit / fit_missing) - przy obsłudze
+        żądań brak modelu zwraca None i wektory używają wag TF.
+        """
+        if self._tfidf_model is None or refit:
+            if os.path.exists(self.tfidf_model_path) and not refit:
+                self._tfidf_model = CorpusTfidfModel.load(self.tfidf_model_path)
+            elif refit or fit_missing:
+                self._tfidf_model = self.fit_tfidf_model()
+            else:
+                if not self._tfidf_missing_reported:
+                    print("⚠️  TF-IDF model not found - using TF weighting "
+                          "(fit it with: calculate_similarities --fit-tfidf)")
+                    self._tfidf_missing_reported = True
+                return None
+        return self._tfidf_model
+    
+    def fit_tfidf_model(self):
+        """
+        Dopasuj model TF-IDF do całego katalogu i zapisz słowniki oraz IDF
+        """
+        print("📐 Fitting corpus TF-IDF model...")
+        _, all_features = self.extract_catalog_features()
+        
+        model = CorpusTfidfModel().fit({
+            'description': [features['description_words'] for features in all_features],
+            'keyword': [features['keywords'] for features in all_features],
+        })
+        model.save(self.tfidf_model_path)
         
-        return features
+        self._tfidf_model = model
+        print(
+            f"✅ TF-IDF model {model.model_id}: {len(model.vocabularies['description'])} description terms, "
+            f"{len(model.vocabularies['keyword'])} keywords"
+        )
+        return model
+    
+    def tfidf_text_vectors(self, features_list):
+        """
+        Wektory TF-IDF (słowa kluczowe, opis) dla listy cech - jedna transformacja na paczkę
+        """
+        model = self.get_tfidf_model()
+        if model is None:
+            return [None] * len(features_list)
+        keyword_rows = model.transform('keyword', [features['keywords'] for features in features_list])
+        description_rows = model.transform(
+            'description', [features['description_words'] for features in features_list]
+        )
+        return [
+            (model.row_to_dict(keyword_rows[i]), model.row_to_dict(description_rows[i]))
+            for i in range(len(features_list))
+        ]
     
-    def create_book_vector(self, book):
+    def create_book_vector(self, book, features=None, text_vectors=None):
         """
-        Stwórz wektor dla książki
+        Stwórz wektor dla książki (features - cechy wyliczone wcześniej wsadowo,
+        text_vectors - gotowe wektory TF-IDF słów kluczowych i opisu)
         """
-        features = self.extract_features_from_book(book)
+        if features is None:
+            features = self.extract_features_from_book(book)
+        
+        if text_vectors is None and self.text_weighting == 'tfidf':
+            text_vectors = self.tfidf_text_vectors([features])[0]
         
         # Wektory dla każdego typu cechy
         vectors = {
@@ -146,19 +333,23 @@ class BookSimilarityService:
         for author in features['authors']:
             vectors['author_vector'][author] = 1.0
         
-        # Wektor słów kluczowych (binary)
-        for keyword in features['keywords']:
-            vectors['keyword_vector'][keyword] = 1.0
-        
-        # Wektor opisu (TF-IDF like)
-        if features['description_words']:
-            word_counts = Counter(features['description_words'])
-            total_words = len(features['description_words'])
+        if text_vectors is not None:
+            # Model korpusowy TF-IDF - klucze to ID termów
+            vectors['keyword_vector'], vectors['description_vector'] = text_vectors
+        else:
+            # Wektor słów kluczowych (binary)
+            for keyword in features['keywords']:
+                vectors['keyword_vector'][keyword] = 1.0
             
-            for word, count in word_counts.items():
-                # Prosta TF (term frequency)
-                tf = count / total_words
-                vectors['description_vector'][word] = tf
+            # Wektor opisu (TF-IDF like)
+            if features['description_words']:
+                word_counts = Counter(features['description_words'])
+                total_words = len(features['description_words'])
+                
+                for word, count in word_counts.items():
+                    # Prosta TF (term frequency)
+                    tf = count / total_words
+                    vectors['description_vector'][word] = tf
         
         # Kombinowany wektor
         combined = {}
@@ -235,13 +426,16 @@ class BookSimilarityService:
         
         return similarities
     
-    def calculate_similarity_between_books(self, book1, book2):
+    def calculate_similarity_between_books(self, book1, book2, vector1=None, vector2=None):
         """
         Wylicz podobieństwo między dwoma książkami
+        (vector1/vector2 - gotowe wektory, np. z BookVector, pomijają wektoryzację)
         """
         # Stwórz wektory
-        vector1 = self.create_book_vector(book1)
-        vector2 = self.create_book_vector(book2)
+        if vector1 is None:
+            vector1 = self.create_book_vector(book1)
+        if vector2 is None:
+            vector2 = self.create_book_vector(book2)
         
         # Ogólne podobieństwo kosinusowe
         cosine_sim = self.cosine_similarity_vectors(
@@ -262,115 +456,1121 @@ class BookSimilarityService:
         Zaktualizuj wektor dla książki
         """
         vector_data = self.create_book_vector(book)
+        row = self.packed_vector_fields(vector_data)
+        row['fingerprint'] = self.compute_fingerprint(book)
         
         book_vector, created = BookVector.objects.get_or_create(
             book=book,
-            defaults=vector_data
+            defaults=row
         )
         
         if not created:
             # Aktualizuj istniejący wektor
-            for key, value in vector_data.items():
+            for key, value in row.items():
                 setattr(book_vector, key, value)
             book_vector.save()
         
         return book_vector
     
-    def calculate_similarities_for_book(self, target_book, batch_size=100):
+    def load_feature_vocabulary(self, names=()):
+        """
+        Uzupełnij słownik cech (nazwa <-> ID) - brakujące nazwy są dopisywane
+        do VectorFeature jednym bulk_create
+        """
+        if not self._feature_names:
+            self._reload_feature_vocabulary()
+        
+        missing = {name for name in names if name not in self._feature_ids}
+        if missing:
+            VectorFeature.objects.bulk_create(
+                [VectorFeature(name=name) for name in missing], ignore_conflicts=True
+            )
+            self._reload_feature_vocabulary()
+    
+    def _reload_feature_vocabulary(self):
+        rows = list(VectorFeature.objects.values_list('id', 'name'))
+        size = max((feature_id for feature_id, _ in rows), default=-1) + 1
+        
+        self._feature_names = [None] * size
+        for feature_id, name in rows:
+            self._feature_names[feature_id] = name
+        self._feature_ids = {name: feature_id for feature_id, name in rows}
+    
+    def _feature_name(self, aspect, key):
+        return f"{ASPECT_PREFIXES[aspect]}_{key}"[:255]
+    
+    def packed_vector_fields(self, vector_data, load_vocabulary=True):
+        """
+        Pola BookVector w formacie binarnym (stare pola JSON zostają puste)
+        """
+        if load_vocabulary:
+            self.load_feature_vocabulary(
+                self._feature_name(aspect, key)
+                for aspect in ASPECTS for key in vector_data[f'{aspect}_vector']
+            )
+        
+        aspect_arrays = []
+        for aspect in ASPECTS:
+            vector = vector_data[f'{aspect}_vector']
+            aspect_arrays.append((
+                [self._feature_ids[self._feature_name(aspect, key)] for key in vector],
+                list(vector.values()),
+            ))
+        
+        row = {field: {} for field in self.VECTOR_FIELDS}
+        row['packed'] = pack_vector(aspect_arrays)
+        return row
+    
+    def decode_vector(self, packed):
+        """
+        Format binarny -> słowniki wektorów (jak z create_book_vector)
+        """
+        aspect_arrays = unpack_vector(packed)
+        
+        if any(len(indices) and int(indices.max()) >= len(self._feature_names) for indices, _ in aspect_arrays):
+            # Cechy dopisane przez inny proces
+            self._reload_feature_vocabulary()
+        
+        vectors = {}
+        combined = {}
+        for aspect, (indices, values) in zip(ASPECTS, aspect_arrays):
+            prefix_length = len(ASPECT_PREFIXES[aspect]) + 1
+            weight = self.category_weights[aspect]
+            vector = {}
+            for index, value in zip(indices.tolist(), values.tolist()):
+                name = self._feature_names[index]
+                vector[name[prefix_length:]] = value
+                combined[name] = value * weight
+            vectors[f'{aspect}_vector'] = vector
+        
+        vectors['combined_vector'] = combined
+        return vectors
+    
+    def compute_fingerprint(self, book):
+        """
+        Odcisk danych wejściowych wektora (tytuł, opis, słowa kluczowe, autorzy, kategorie)
+        """
+        parts = [
+            book.title or '',
+            book.description or '',
+            book.keywords or '',
+            '|'.join(sorted(f"{author.first_name} {author.last_name}" for author in book.authors.all())),
+            '|'.join(sorted(category.name for category in book.categories.all())),
+        ]
+        if self.text_weighting == 'tfidf':
+            # Nowe dopasowanie modelu unieważnia wszystkie wektory (także
+            # te policzone wagami TF, zanim model był dostępny)
+            model = self.get_tfidf_model()
+            parts.append(model.model_id if model is not None else 'tf')
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+    
+    def vectorize_catalog(self, chunk_size=500, force=False):
+        """
+        Etap wektoryzacji: policz BookVector dla całego katalogu w jednym przebiegu.
+        Autorzy i kategorie są prefetchowane, zapis przez bulk_create/bulk_update.
+        Książki, których odcisk się nie zmienił, są pomijane (chyba że force=True).
+        
+        Zwraca listę ID książek, których wektor został (prze)liczony.
+        """
+        print("🧮 VECTORIZING CATALOG")
+        
+        if self.text_weighting == 'tfidf':
+            # Dopasowanie (jeśli potrzebne) przed strumieniowaniem katalogu
+            self.get_tfidf_model(fit_missing=True)
+        
+        books = Book.objects.prefetch_related('authors', 'categories').order_by('id')
+        total_books = books.count()
+        changed_ids = []
+        skipped_count = 0
+        chunk = []
+        
+        def flush(chunk):
+            existing = {
+                vector.book_id: vector
+                for vector in BookVector.objects.filter(
+                    book_id__in=[book.id for book in chunk]
+                ).only('id', 'book_id', 'fingerprint', 'packed')
+            }
+            to_create = []
+            to_update = []
+            stale = []
+            
+            for book in chunk:
+                fingerprint = self.compute_fingerprint(book)
+                book_vector = existing.get(book.id)
+                
+                # Wektory w starym formacie (tylko JSON) też są przeliczane
+                if (book_vector is not None and book_vector.fingerprint == fingerprint
+                        and book_vector.packed is not None and not force):
+                    continue
+                stale.append((book, fingerprint, book_vector))
+            
+            # Cechy tylko zmienionych książek, wyliczone wsadowo
+            batch_features = self.extract_features_batch([book for book, _, _ in stale])
+            batch_text_vectors = [None] * len(stale)
+            if self.text_weighting == 'tfidf' and stale:
+                batch_text_vectors = self.tfidf_text_vectors(batch_features)
+            
+            batch_vectors = [
+                self.create_book_vector(book, features=features, text_vectors=text_vectors)
+                for (book, _, _), features, text_vectors in zip(stale, batch_features, batch_text_vectors)
+            ]
+            # Nowe cechy całej paczki trafiają do słownika jednym zapytaniem
+            self.load_feature_vocabulary(
+                self._feature_name(aspect, key)
+                for vector_data in batch_vectors
+                for aspect in ASPECTS for key in vector_data[f'{aspect}_vector']
+            )
+            
+            for (book, fingerprint, book_vector), vector_data in zip(stale, batch_vectors):
+                row = self.packed_vector_fields(vector_data, load_vocabulary=False)
+                changed_ids.append(book.id)
+                
+                if book_vector is None:
+                    to_create.append(BookVector(book=book, fingerprint=fingerprint, **row))
+                else:
+                    for key, value in row.items():
+                        setattr(book_vector, key, value)
+                    book_vector.fingerprint = fingerprint
+                    to_update.append(book_vector)
+            
+            BookVector.objects.bulk_create(to_create, batch_size=chunk_size)
+            # bulk_update nie uruchamia auto_now - ustawiamy updated_at ręcznie
+            now = timezone.now()
+            for book_vector in to_update:
+                book_vector.updated_at = now
+            BookVector.objects.bulk_update(
+                to_update, list(self.VECTOR_FIELDS) + ['packed', 'fingerprint', 'updated_at'], batch_size=chunk_size
+            )
+            return len(chunk) - len(stale)
+        
+        processed = 0
+        for book in books.iterator(chunk_size=chunk_size):
+            chunk.append(book)
+            if len(chunk) >= chunk_size:
+                skipped_count += flush(chunk)
+                processed += len(chunk)
+                chunk = []
+                print(f"   Checked {processed}/{total_books} books...")
+        
+        if chunk:
+            skipped_count += flush(chunk)
+        
+        print(f"✅ Vectors: {len(changed_ids)} (re)built, {skipped_count} unchanged")
+        return changed_ids
+    
+    def get_cached_vectors(self, books):
+        """
+        Pobierz wektory książek z BookVector jednym zapytaniem
+        (brakujące zostaną policzone i zapisane)
+        """
+        vectors = {
+            book_id: self.decode_vector(packed)
+            for book_id, packed in BookVector.objects.filter(
+                book_id__in=[book.id for book in books], packed__isnull=False
+            ).values_list('book_id', 'packed')
+        }
+        
+        for book in books:
+            if book.id not in vectors:
+                book_vector = self.update_book_vector(book)
+                vectors[book.id] = self.decode_vector(book_vector.packed)
+        
+        return vectors
+    
+    def iter_packed_vectors(self, chunk_size=2000):
+        """
+        (book_id, bajty wektora) wszystkich wektorów, posortowane po book_id
+        """
+        return BookVector.objects.filter(packed__isnull=False).order_by('book_id').values_list(
+            'book_id', 'packed'
+        ).iterator(chunk_size=chunk_size)
+    
+    def load_vector_data(self):
+        """
+        Wczytaj wszystkie zapisane wektory (posortowane po book_id)
+        Zwraca (book_ids, lista słowników wektorów)
+        """
+        self.load_feature_vocabulary()
+        book_ids = []
+        vectors = []
+        
+        for book_id, packed in self.iter_packed_vectors():
+            book_ids.append(book_id)
+            vectors.append(self.decode_vector(packed))
+        
+        return book_ids, vectors
+    
+    def load_vector_matrices(self):
+        """
+        Wczytaj wszystkie wektory prosto do macierzy CSR (bez słowników)
+        Zwraca (book_ids, słownik aspekt -> surowa macierz książki x cechy)
+        """
+        book_ids = []
+        blobs = []
+        
+        for book_id, packed in self.iter_packed_vectors():
+            book_ids.append(book_id)
+            blobs.append(packed)
+        
+        n_features = VectorFeature.objects.aggregate(last=Max('id'))['last'] or 0
+        return book_ids, packed_to_csr(blobs, n_features + 1)
+    
+    def get_candidate_index(self, rebuild=False):
+        """
+        Indeks odwrócony cech z BookVector (raz na proces, chyba że rebuild=True)
+        """
+        if self._candidate_index is None or rebuild:
+            book_ids, vectors = self.load_vector_data()
+            self._candidate_index = FeatureInvertedIndex().build(book_ids, vectors)
+            print(f"🗂️  Candidate index ready: {self._candidate_index.stats()}")
+        return self._candidate_index
+    
+    def build_ann_index(self):
+        """
+        Zbuduj indeks LSH z BookVector i zapisz go na dysk
+        """
+        print("🧭 Building ANN (LSH) index...")
+        book_ids, vectors = self.load_vector_data()
+        
+        index = RandomProjectionLSH().fit(
+            book_ids, [vector['combined_vector'] for vector in vectors]
+        )
+        index.save(self.ann_index_path)
+        
+        self._ann_index = index
+        self._ann_index_loaded = True
+        print(f"✅ ANN index with {len(index)} books saved to {self.ann_index_path}")
+        return index
+    
+    def get_ann_index(self):
+        """
+        Indeks LSH z dysku (None, jeśli jeszcze nie został zbudowany)
+        """
+        if not self._ann_index_loaded:
+            self._ann_index_loaded = True
+            if os.path.exists(self.ann_index_path):
+                self._ann_index = RandomProjectionLSH.load(self.ann_index_path)
+                print(f"🧭 ANN index loaded ({len(self._ann_index)} books)")
+        return self._ann_index
+    
+    def export_neighbour_store(self):
+        """
+        Wyeksportuj tabelę book_similarities do magazynu sąsiadów (memmap)
+        """
+        print("📦 Exporting neighbour store...")
+        
+        columns = ('book1_id', 'book2_id') + SIMILARITY_FIELDS
+        live = BookSimilarity.live()
+        
+        # Tablice zaalokowane z góry i wypełniane porcjami (bez listy całej tabeli);
+        # gdy w międzyczasie dojdą wiersze, tablice rosną
+        capacity = max(live.count(), 1)
+        pairs = np.empty((capacity, 2), dtype=np.int64)
+        scores = np.empty((capacity, len(SIMILARITY_FIELDS)), dtype=np.float32)
+        filled = 0
+        
+        rows_iterator = live.values_list(*columns).iterator(chunk_size=self.export_chunk_size)
+        while True:
+            chunk = list(itertools.islice(rows_iterator, self.export_chunk_size))
+            if not chunk:
+                break
+            
+            block = np.asarray(chunk, dtype=np.float64)
+            end = filled + len(block)
+            if end > len(pairs):
+                capacity = max(end, 2 * len(pairs))
+                pairs = np.resize(pairs, (capacity, 2))
+                scores = np.resize(scores, (capacity, len(SIMILARITY_FIELDS)))
+            
+            pairs[filled:end] = block[:, :2]
+            scores[filled:end] = block[:, 2:]
+            filled = end
+        
+        pairs, scores = pairs[:filled], scores[:filled]
+        
+        book_ids = np.union1d(
+            np.fromiter(BookVector.objects.values_list('book_id', flat=True), dtype=np.int64),
+            pairs.ravel()
+        )
+        
+        store = NeighbourStore.write(
+            self.neighbour_store_path,
+            book_ids,
+            pairs[:, 0],
+            pairs[:, 1],
+            scores
+        )
+        
+        print(f"✅ Neighbour store ready: {store.stats()}")
+        return store
+    
+    def clean_similarities(self):
+        """
+        Usuń wszystkie podobieństwa razem z tym, co je serwuje: magazyn
+        sąsiadów, cache rekomendacji, odciski (--incremental przeliczy
+        wszystko) i checkpointy niedokończonych przebiegów
+        """
+        with transaction.atomic():
+            deleted_count = BookSimilarity.objects.all().delete()[0]
+            BookVector.objects.update(similarity_fingerprint='')
+            SimilarityRun.objects.exclude(status='completed').update(status='failed')
+            SimilarityRun.objects.filter(status='failed').update(completed_units=0, last_book_id=None)
+            SimilarityGeneration.bump_cache_version()
+            transaction.on_commit(self.discard_neighbour_store)
+        return deleted_count
+    
+    def discard_neighbour_store(self):
+        """
+        Usuń magazyn sąsiadów - do następnego eksportu odpowiada baza danych
+        """
+        if os.path.exists(self.neighbour_store_path):
+            shutil.rmtree(self.neighbour_store_path, ignore_errors=True)
+            print("🗑️  Neighbour store discarded (serving from database)")
+    
+    def get_neighbour_store(self):
+        """
+        Magazyn sąsiadów z dysku (None, jeśli nie istnieje). Po ponownym
+        eksporcie katalog ma nowy inode - wtedy mapujemy pliki od nowa.
+        """
+        try:
+            inode = os.stat(self.neighbour_store_path).st_ino
+        except FileNotFoundError:
+            self._neighbour_store = None
+            self._neighbour_store_inode = None
+            return None
+        
+        if inode != self._neighbour_store_inode:
+            self._neighbour_store = NeighbourStore(self.neighbour_store_path)
+            self._neighbour_store_inode = inode
+        
+        return self._neighbour_store
+    
+    def calculate_similarities_for_book(self, target_book, batch_size=100, top_k=None, replace_existing=True,
+                                        writer=None, refresh_vector=True, use_candidates=False):
         """
         Wylicz podobieństwa dla jednej książki względem wszystkich innych
+
+        top_k - zapisz tylko K najlepszych sąsiadów (kopiec), zamiast
+                wszystkich par powyżej progu
+        replace_existing - usuń wcześniej stare podobieństwa tej książki
+        writer - współdzielony SimilarityWriter (np. dla całego przebiegu,
+                 zapisujący do nowej generacji); bez niego wyniki trafiają
+                 do aktywnej generacji
+        refresh_vector - przelicz wektor docelowej książki (False gdy katalog
+                         był właśnie zwektoryzowany)
+        use_candidates - porównuj tylko z książkami mającymi wspólną cechę
+                         (indeks odwrócony) zamiast z całym katalogiem
         """
+        standalone = writer is None
+        if standalone:
+            writer = SimilarityWriter(
+                ignore_conflicts=bool(top_k), generation=SimilarityGeneration.get_active()
+            )
+            # Pojedyncze przeliczenie - w magazynie nieaktualne są tylko listy
+            # tej książki i jej dotychczasowych sąsiadów (oznaczane po zapisie)
+            store = self.get_neighbour_store()
+            previous_neighbour_ids = store.neighbour_ids(target_book.id).tolist() if store else []
+        
         print(f"📊 Calculating similarities for: {target_book.title}")
         
         # Zaktualizuj wektor docelowej książki
-        self.update_book_vector(target_book)
+        if refresh_vector:
+            self.update_book_vector(target_book)
+        target_vector = self.get_cached_vectors([target_book])[target_book.id]
         
         # Pobierz wszystkie inne książki batch'ami
         other_books = Book.objects.exclude(id=target_book.id)
-        total_books = other_books.count()
+        candidate_ids = None
+        
+        if use_candidates:
+            candidate_ids = self.get_candidate_index().candidates(
+                target_vector, exclude_id=target_book.id
+            ).tolist()
+            total_books = len(candidate_ids)
+        else:
+            total_books = other_books.count()
         processed = 0
         similarities_created = 0
         
+        # Kopiec (min-heap) K najlepszych sąsiadów w trybie top-K
+        best_neighbours = []
+        rows = []
+        
         print(f"📚 Processing {total_books} other books...")
         
         with transaction.atomic():
-            # Usuń stare podobieństwa dla tej książki
-            BookSimilarity.objects.filter(
-                Q(book1=target_book) | Q(book2=target_book)
-            ).delete()
+            # Usuń stare podobieństwa dla tej książki (dwa zapytania po indeksach zamiast OR)
+            if replace_existing:
+                generation_rows = BookSimilarity.objects.filter(generation=writer.generation)
+                generation_rows.filter(book1=target_book).delete()
+                generation_rows.filter(book2=target_book).delete()
             
             for i in range(0, total_books, batch_size):
-                batch = other_books[i:i + batch_size]
+                if candidate_ids is not None:
+                    batch = list(Book.objects.filter(id__in=candidate_ids[i:i + batch_size]))
+                else:
+                    batch = list(other_books[i:i + batch_size])
+                # Wektory pozostałych książek z cache (BookVector), jedno zapytanie na batch
+                batch_vectors = self.get_cached_vectors(batch)
                 
                 for other_book in batch:
-                    # Zaktualizuj wektor drugiej książki
-                    self.update_book_vector(other_book)
-                    
                     # Wylicz podobieństwo
                     similarity_data = self.calculate_similarity_between_books(
-                        target_book, other_book
+                        target_book, other_book,
+                        vector1=target_vector,
+                        vector2=batch_vectors[other_book.id]
                     )
                     
                     # Zapisz tylko jeśli podobieństwo jest wystarczające
-                    if similarity_data['cosine_similarity'] >= self.min_similarity_threshold:
+                    if top_k and similarity_data['cosine_similarity'] >= self.min_similarity_threshold:
+                        entry = (similarity_data['cosine_similarity'], other_book.id, other_book, similarity_data)
+                        if len(best_neighbours) < top_k:
+                            heapq.heappush(best_neighbours, entry)
+                        elif entry[:2] > best_neighbours[0][:2]:
+                            heapq.heapreplace(best_neighbours, entry)
+                    
+                    elif similarity_data['cosine_similarity'] >= self.min_similarity_threshold:
                         # Upewnij się że book1.id < book2.id (dla unikatowości)
-                        book1, book2 = (target_book, other_book) if target_book.id < other_book.id else (other_book, target_book)
-                        
-                        BookSimilarity.objects.create(
-                            book1=book1,
-                            book2=book2,
+                        rows.append({
+                            'book1_id': min(target_book.id, other_book.id),
+                            'book2_id': max(target_book.id, other_book.id),
                             **similarity_data
-                        )
-                        similarities_created += 1
+                        })
                     
                     processed += 1
                 
                 if (i + batch_size) % (batch_size * 5) == 0:  # Progress every 5 batches
                     print(f"   Processed {min(i + batch_size, total_books)}/{total_books} books...")
+            
+            # W trybie top-K para może już istnieć (target jest w top-K drugiej
+            # książki) - writer musi wtedy mieć ignore_conflicts=True
+            for _, other_id, _, similarity_data in best_neighbours:
+                rows.append({
+                    'book1_id': min(target_book.id, other_id),
+                    'book2_id': max(target_book.id, other_id),
+                    **similarity_data
+                })
+            
+            writer.write_rows(rows)
+            similarities_created = len(rows)
+            
+            # W pełnym przebiegu odciski są oznaczane przy publikacji generacji
+            if standalone:
+                BookVector.objects.filter(book=target_book).update(
+                    similarity_fingerprint=F('fingerprint')
+                )
+                SimilarityGeneration.bump_cache_version()
+                
+                stale_ids = {target_book.id, *previous_neighbour_ids}
+                stale_ids.update(row['book1_id'] + row['book2_id'] - target_book.id for row in rows)
+                transaction.on_commit(
+                    lambda: NeighbourStore.mark_stale(self.neighbour_store_path, stale_ids)
+                )
         
         print(f"✅ Created {similarities_created} similarity records for {target_book.title}")
         return similarities_created
     
-    def calculate_all_similarities(self, batch_size=50):
+    def calculate_all_similarities(self, batch_size=50, engine='pairwise', block_size=1000, top_k=None,
+                                   write_method='bulk', write_batch_size=5000, use_candidates=False, workers=1,
+                                   resume=False):
         """
         Wylicz podobieństwa dla wszystkich książek
+
+        engine='pairwise' - klasyczna ścieżka książka po książce
+        engine='sparse'   - wektoryzowany silnik na macierzach rzadkich
+        engine='lsa'      - osadzenia LSA (TruncatedSVD), zawsze top-K; wyniki
+                            zapisywane z osobną wartością `version`
+        top_k - zachowaj tylko K najlepszych sąsiadów każdej książki
+                (min_similarity_threshold działa wtedy jako dolna granica)
+        write_method - 'bulk' (bulk_create) lub 'copy' (COPY FROM STDIN)
+        use_candidates - (pairwise) porównuj tylko książki ze wspólną cechą;
+                         silnik sparse i tak mnoży tylko współwystępujące cechy
+        workers - liczba procesów dla silnika sparse (workers > 1 wymusza sparse)
+        resume - kontynuuj ostatni przerwany przebieg od zapisanego checkpointu
+                 (z jego silnikiem i parametrami)
         """
+        method = 'lsa' if engine == 'lsa' else 'aspects'
+        run = SimilarityRun.get_resumable(method) if resume else None
+        
+        if resume and run is None:
+            print("ℹ️  No interrupted run to resume - starting a new one")
+        
+        if run is not None:
+            params = run.parameters
+            engine = run.engine
+            top_k = params.get('top_k')
+            block_size = params.get('block_size', block_size)
+            use_candidates = params.get('use_candidates', False)
+            self.min_similarity_threshold = params.get('min_similarity', self.min_similarity_threshold)
+            print(f"⏯️  Resuming {engine} run (generation {run.generation}) "
+                  f"at {run.completed_units}/{run.total_units}")
+        else:
+            # Porzucone, nieopublikowane generacje tej metody nie będą już wznawiane
+            self._discard_unpublished(method=method)
+        
+        if engine == 'lsa':
+            top_k = top_k or 20
+        elif workers > 1 and engine != 'sparse':
+            print(f"⚙️  {workers} workers requested - using the sparse engine")
+            engine = 'sparse'
+        
+        writer = SimilarityWriter(
+            method=write_method,
+            batch_size=write_batch_size,
+            # Po wznowieniu top-K część par z wcześniejszych bloków może się powtórzyć
+            ignore_conflicts=bool(top_k) and (engine == 'pairwise' or run is not None),
+            generation=run.generation if run is not None else self._next_generation(),
+            version=BookSimilarity.METHOD_VERSIONS['lsa' if engine == 'lsa' else 'aspects']
+        )
+        
+        if engine == 'lsa':
+            return self.calculate_all_similarities_lsa(
+                block_size=block_size, top_k=top_k, writer=writer, run=run
+            )
+        
+        if engine == 'sparse':
+            return self.calculate_all_similarities_sparse(
+                block_size=block_size, top_k=top_k, writer=writer, workers=workers, run=run
+            )
+
         print("🚀 CALCULATING ALL BOOK SIMILARITIES")
         print("=" * 50)
         
-        books = Book.objects.all()
+        # Stała kolejność po ID - checkpoint to ostatnia ukończona książka
+        books = Book.objects.order_by('id')
         total_books = books.count()
         
-        print(f"📚 Processing {total_books} books...")
+        if run is None:
+            progress = RunProgress.start(
+                'pairwise', writer.generation, total_books, unit='books', parameters={
+                    'top_k': top_k,
+                    'min_similarity': self.min_similarity_threshold,
+                    'use_candidates': use_candidates,
+                }
+            )
+        else:
+            progress = RunProgress(run, unit='books')
+            if run.last_book_id is not None:
+                books = books.filter(id__gt=run.last_book_id)
         
-        processed = 0
+        print(f"📚 Processing {books.count()} books...")
+        
+        processed = progress.run.completed_units
         total_similarities = 0
+        failed_books = []
         
-        for book in books:
-            try:
-                similarities_count = self.calculate_similarities_for_book(book, batch_size)
-                total_similarities += similarities_count
+        # Każdy wektor liczony raz na przebieg, nie raz na parę
+        self.vectorize_catalog()
+        
+        if use_candidates:
+            self.get_candidate_index(rebuild=True)
+        
+        print(f"🗂️  Writing generation {writer.generation}")
+        
+        try:
+            for book in books:
+                try:
+                    # W top-K listy sąsiadów się nakładają - nowa generacja jest
+                    # pusta, więc nie usuwamy nic per książka
+                    similarities_count = self.calculate_similarities_for_book(
+                        book, batch_size, top_k=top_k, replace_existing=not top_k,
+                        writer=writer, refresh_vector=False, use_candidates=use_candidates
+                    )
+                    total_similarities += similarities_count
+                    
+                except Exception as e:
+                    failed_books.append(book.id)
+                    print(f"❌ Error processing {book.title}: {e}")
+                
                 processed += 1
+                progress.checkpoint(processed, last_book_id=book.id)
                 
                 if processed % 10 == 0:
-                    print(f"📈 Progress: {processed}/{total_books} books processed")
-                
-            except Exception as e:
-                print(f"❌ Error processing {book.title}: {e}")
-                continue
+                    print(progress.describe(rows_written=writer.rows_written))
+        except BaseException:
+            # Zapisane wiersze zostają w nieopublikowanej generacji - do wznowienia
+            progress.finish('failed')
+            print(f"⏸️  Run interrupted at {processed}/{total_books} books - continue with --resume")
+            raise
+        
+        if failed_books:
+            # Niepełna generacja nie może zastąpić opublikowanej - zostaje poprzednia;
+            # wiersze są usuwane, a --resume zaczyna przebieg od początku
+            self._discard_unpublished(writer.generation)
+            progress.run.last_book_id = None
+            progress.checkpoint(0)
+            progress.run.save(update_fields=['last_book_id'])
+            progress.finish('failed')
+            raise RuntimeError(
+                f"{len(failed_books)} of {total_books} books failed (IDs: {failed_books[:20]}) - "
+                f"generation {writer.generation} was not published"
+            )
+        
+        self._publish_generation(writer.generation)
+        progress.finish()
+        self.export_neighbour_store()
         
         print("=" * 50)
         print(f"✅ SIMILARITY CALCULATION COMPLETED!")
         print(f"📊 Books processed: {processed}/{total_books}")
         print(f"🔗 Total similarities created: {total_similarities}")
+        writer.print_report()
+        
+        return total_similarities
+    
+    def calculate_all_similarities_sparse(self, block_size=1000, top_k=None, writer=None, workers=1, run=None):
+        """
+        Wylicz podobieństwa dla wszystkich książek silnikiem macierzowym
+        (workers > 1 - bloki liczone równolegle w puli procesów,
+        run - wznawiany SimilarityRun)
+        """
+        if writer is None:
+            writer = SimilarityWriter(generation=self._next_generation())
+        
+        print("🚀 CALCULATING ALL BOOK SIMILARITIES (sparse engine)")
+        print("=" * 50)
+        
+        self.vectorize_catalog()
+        book_ids, raw_matrices = self.load_vector_matrices()
+        total_books = len(book_ids)
+        
+        engine = SparseSimilarityEngine(
+            self.category_weights,
+            min_similarity=self.min_similarity_threshold,
+            block_size=block_size,
+            top_k=top_k
+        )
+        # Granice bloków liczone tak samo jak w silniku (limit blok x katalog)
+        engine_block_size = engine.block_size_for(total_books)
+        total_blocks = math.ceil(total_books / engine_block_size)
+        
+        catalog = self._catalog_fingerprint(book_ids)
+        
+        if run is not None and (
+            run.parameters.get('books') != total_books or run.parameters.get('catalog') != catalog
+        ):
+            # Granice bloków zależą od katalogu - checkpoint jest nieaktualny
+            print("⚠️  Catalog changed since the interrupted run - starting over")
+            run.status = 'failed'
+            run.save(update_fields=['status', 'updated_at'])
+            self._discard_unpublished(writer.generation)
+            run = None
+        
+        if run is None:
+            progress = RunProgress.start('sparse', writer.generation, total_blocks, parameters={
+                'top_k': top_k,
+                'block_size': block_size,
+                'min_similarity': self.min_similarity_threshold,
+                'books': total_books,
+                'catalog': catalog,
+            })
+        else:
+            progress = RunProgress(run)
+        
+        matrices = engine.build_matrices_from_raw(raw_matrices)
+        
+        total_similarities = 0
+        completed_blocks = progress.run.completed_units
+        
+        print(f"🗂️  Writing generation {writer.generation}")
+        
+        # Nowa generacja jest niewidoczna dla czytających aż do publikacji
+        try:
+            for _, _, batch in engine.iter_block_batches(
+                matrices, book_ids, workers=workers, start_row=completed_blocks * engine_block_size
+            ):
+                # Blok i jego checkpoint zapisujemy razem
+                with transaction.atomic():
+                    writer.write_batch(batch)
+                    completed_blocks += 1
+                    progress.checkpoint(completed_blocks)
+                
+                total_similarities += len(batch['book1_id'])
+                print(progress.describe(rows_written=total_similarities))
+        except BaseException:
+            progress.finish('failed')
+            print(f"⏸️  Run interrupted at block {completed_blocks}/{total_blocks} - continue with --resume")
+            raise
+        
+        self._publish_generation(writer.generation)
+        progress.finish()
+        self.export_neighbour_store()
+        
+        print("=" * 50)
+        print(f"✅ SIMILARITY CALCULATION COMPLETED!")
+        print(f"📊 Books processed: {total_books}")
+        print(f"🔗 Total similarities created: {total_similarities}")
+        writer.print_report()
+        
+        return total_similarities
+    
+    def calculate_all_similarities_lsa(self, block_size=1000, top_k=20, writer=None, run=None):
+        """
+        Dopasuj osadzenia LSA do całego katalogu i zapisz top-K sąsiadów każdej
+        książki (kosinus osadzeń + podobieństwa aspektów dla porównania) jako
+        nową generację metody 'lsa'
+        """
+        if writer is None:
+            writer = SimilarityWriter(
+                generation=self._next_generation(), version=BookSimilarity.METHOD_VERSIONS['lsa']
+            )
+        
+        print("🚀 CALCULATING ALL BOOK SIMILARITIES (LSA embeddings)")
+        print("=" * 50)
+        
+        self.vectorize_catalog()
+        book_ids, raw_matrices = self.load_vector_matrices()
+        
+        engine = SparseSimilarityEngine(
+            self.category_weights,
+            min_similarity=self.min_similarity_threshold,
+            block_size=block_size,
+            top_k=top_k
+        )
+        matrices = engine.build_matrices_from_raw(raw_matrices)
+        catalog = self._catalog_fingerprint(book_ids)
+        
+        if run is not None:
+            # Wznowienie - te same osadzenia co w przerwanym przebiegu, o ile
+            # katalog się nie zmienił (wiersze macierzy idą w kolejności modelu)
+            model = self.get_lsa_model() if os.path.exists(self.lsa_model_path) else None
+            if (
+                run.parameters.get('books') != len(book_ids)
+                or run.parameters.get('catalog') != catalog
+                or model is None
+                or not np.array_equal(model.book_ids, np.sort(np.asarray(book_ids, dtype=np.int64)))
+            ):
+                print("⚠️  Catalog changed since the interrupted run - starting over")
+                run.status = 'failed'
+                run.save(update_fields=['status', 'updated_at'])
+                self._discard_unpublished(writer.generation)
+                run = None
+        
+        if run is None:
+            model = self.fit_lsa_model(book_ids, matrices['combined'])
+        
+        # Wiersze modelu są posortowane po ID - macierze aspektów w tej samej kolejności
+        order = np.argsort(np.asarray(book_ids, dtype=np.int64), kind='stable')
+        matrices = {name: matrix[order] for name, matrix in matrices.items()}
+        
+        total_books = len(model)
+        # Blok osadzeń x katalog jest gęsty - ten sam limit co w silniku
+        engine_block_size = engine.block_size_for(total_books)
+        total_blocks = math.ceil(total_books / engine_block_size)
+        
+        if run is None:
+            progress = RunProgress.start('lsa', writer.generation, total_blocks, parameters={
+                'top_k': top_k,
+                'block_size': block_size,
+                'min_similarity': self.min_similarity_threshold,
+                'books': total_books,
+                'catalog': catalog,
+                'components': model.n_components,
+            })
+        else:
+            progress = RunProgress(run)
+        
+        neighbours = np.full((total_books, top_k), -1, dtype=np.int64)
+        total_similarities = 0
+        completed_blocks = progress.run.completed_units
+        
+        print(f"🗂️  Writing generation {writer.generation} (version {writer.version})")
+        
+        try:
+            for start, end, rows, cols, scores in model.iter_top_k_blocks(
+                top_k, min_similarity=self.min_similarity_threshold,
+                block_size=engine_block_size, start_row=completed_blocks * engine_block_size
+            ):
+                if len(rows):
+                    keep = engine._drop_emitted(neighbours, rows, cols)
+                    batch = engine._make_batch(
+                        matrices, model.book_ids,
+                        rows[keep], cols[keep], np.clip(scores[keep], 0.0, 1.0)
+                    )
+                    
+                    with transaction.atomic():
+                        writer.write_batch(batch)
+                        completed_blocks += 1
+                        progress.checkpoint(completed_blocks)
+                    total_similarities += len(batch['book1_id'])
+                else:
+                    completed_blocks += 1
+                    progress.checkpoint(completed_blocks)
+                
+                print(progress.describe(rows_written=total_similarities))
+        except BaseException:
+            progress.finish('failed')
+            print(f"⏸️  Run interrupted at block {completed_blocks}/{total_blocks} - continue with --resume")
+            raise
+        
+        self._publish_generation(writer.generation, method='lsa')
+        progress.finish()
+        if self.similarity_method == 'lsa':
+            self.export_neighbour_store()
+        
+        print("=" * 50)
+        print(f"✅ LSA SIMILARITY CALCULATION COMPLETED!")
+        print(f"📊 Books processed: {total_books}")
+        print(f"🔗 Total similarities created: {total_similarities}")
+        writer.print_report()
+        
+        return total_similarities
+    
+    def fit_lsa_model(self, book_ids=None, combined_matrix=None):
+        """
+        Dopasuj osadzenia LSA (TruncatedSVD) do łącznej macierzy cech i zapisz na dysk.
+        W trybie 'tf' kolumny są przeważane przez IDF; w trybie 'tfidf' opis
+        i słowa kluczowe już są TF-IDF.
+        """
+        if combined_matrix is None:
+            book_ids, raw_matrices = self.load_vector_matrices()
+            engine = SparseSimilarityEngine(self.category_weights)
+            combined_matrix = engine.build_matrices_from_raw(raw_matrices)['combined']
+        
+        print(f"📐 Fitting LSA embeddings ({self.lsa_components} dimensions)...")
+        model = LsaEmbeddingModel(
+            n_components=self.lsa_components, use_idf=self.text_weighting != 'tfidf'
+        ).fit(book_ids, combined_matrix)
+        model.save(self.lsa_model_path)
+        
+        self._lsa_model = model
+        self._lsa_model_loaded = True
+        print(f"✅ LSA model {model.model_id}: {len(model)} books x {model.n_components} dimensions")
+        return model
+    
+    def get_lsa_model(self):
+        """
+        Osadzenia LSA z dysku (None, jeśli model nie został jeszcze dopasowany)
+        """
+        if not self._lsa_model_loaded:
+            self._lsa_model_loaded = True
+            if os.path.exists(self.lsa_model_path):
+                self._lsa_model = LsaEmbeddingModel.load(self.lsa_model_path)
+                print(f"🧭 LSA model loaded: {len(self._lsa_model)} books")
+        return self._lsa_model
+    
+    def compare_similarity_methods(self, limit=10):
+        """
+        Porównaj listy sąsiadów obu metod (po polu `version`): średnie pokrycie
+        top-`limit` dla książek mających wyniki w obu metodach
+        """
+        neighbour_lists = {}
+        for method in BookSimilarity.METHOD_VERSIONS:
+            lists = defaultdict(list)
+            rows = BookSimilarity.live(method).order_by('-cosine_similarity').values_list('book1_id', 'book2_id')
+            for book1_id, book2_id in rows.iterator(chunk_size=10000):
+                for source_id, target_id in ((book1_id, book2_id), (book2_id, book1_id)):
+                    if len(lists[source_id]) < limit:
+                        lists[source_id].append(target_id)
+            neighbour_lists[method] = lists
+        
+        aspects, lsa = neighbour_lists['aspects'], neighbour_lists['lsa']
+        common = aspects.keys() & lsa.keys()
+        overlaps = [
+            len(set(aspects[book_id]) & set(lsa[book_id])) / min(len(aspects[book_id]), len(lsa[book_id]))
+            for book_id in common
+        ]
+        
+        return {
+            'books_compared': len(common),
+            'limit': limit,
+            'mean_overlap': float(np.mean(overlaps)) if overlaps else 0.0,
+        }
+    
+    def calculate_incremental_similarities(self, block_size=1000, top_k=None, write_method='bulk', write_batch_size=5000):
+        """
+        Przelicz podobieństwa tylko dla książek, których dane się zmieniły
+        (fingerprint != similarity_fingerprint) - O(ΔN·N) zamiast O(N²).
+        
+        W trybie top-K niezmienione książki mogą zyskać zmienioną książkę jako
+        sąsiada; jeśli ją stracą, ich lista będzie krótsza aż do pełnego przebiegu.
+        """
+        writer = SimilarityWriter(
+            method=write_method,
+            batch_size=write_batch_size,
+            ignore_conflicts=bool(top_k),
+            generation=SimilarityGeneration.get_active()
+        )
+        
+        print("🔁 INCREMENTAL BOOK SIMILARITY UPDATE")
+        print("=" * 50)
+        
+        self.vectorize_catalog()
+        
+        pending_ids = set(
+            BookVector.objects.exclude(
+                similarity_fingerprint=F('fingerprint')
+            ).values_list('book_id', flat=True)
+        )
+        
+        if not pending_ids:
+            print("✅ No changed books - similarities are up to date")
+            return 0
+        
+        book_ids, raw_matrices = self.load_vector_matrices()
+        changed_indices = [index for index, book_id in enumerate(book_ids) if book_id in pending_ids]
+        
+        print(f"📚 {len(pending_ids)} changed books out of {len(book_ids)}")
+        
+        engine = SparseSimilarityEngine(
+            self.category_weights,
+            min_similarity=self.min_similarity_threshold,
+            block_size=block_size,
+            top_k=top_k
+        )
+        matrices = engine.build_matrices_from_raw(raw_matrices)
+        
+        kth_scores = None
+        if top_k:
+            kth_scores = self._current_kth_scores(book_ids, pending_ids, top_k)
+        
+        total_similarities = 0
+        
+        with transaction.atomic():
+            generation_rows = BookSimilarity.objects.filter(generation=writer.generation)
+            generation_rows.filter(book1_id__in=pending_ids).delete()
+            generation_rows.filter(book2_id__in=pending_ids).delete()
+            
+            for batch in engine.iter_incremental_batches(matrices, book_ids, changed_indices, kth_scores):
+                writer.write_batch(batch)
+                total_similarities += len(batch['book1_id'])
+            
+            BookVector.objects.filter(book_id__in=pending_ids).update(
+                similarity_fingerprint=F('fingerprint')
+            )
+            SimilarityGeneration.bump_cache_version()
+        
+        self.export_neighbour_store()
+        
+        print(f"✅ Recalculated {total_similarities} similarities for {len(pending_ids)} changed books")
+        writer.print_report()
         
         return total_similarities
     
+    def _next_generation(self):
+        """
+        Numer nowej, jeszcze niewidocznej generacji podobieństw
+        """
+        latest = BookSimilarity.objects.aggregate(latest=Max('generation'))['latest'] or 0
+        active = SimilarityGeneration.objects.aggregate(active=Max('active'))['active'] or 0
+        # Przebieg innej metody/workera mógł zarezerwować numer, nie zapisując jeszcze wierszy
+        reserved = SimilarityRun.objects.aggregate(reserved=Max('generation'))['reserved'] or 0
+        return max(latest, active, reserved) + 1
+    
+    def _publish_generation(self, generation, method='aspects'):
+        """
+        Przestaw wskaźnik metody na gotową generację i usuń jej poprzednie
+        generacje (wyniki drugiej metody zostają)
+        """
+        with transaction.atomic():
+            SimilarityGeneration.activate(generation, key=BookSimilarity.GENERATION_KEYS[method])
+            if method == 'aspects':
+                BookVector.objects.update(similarity_fingerprint=F('fingerprint'))
+        
+        # Czytający widzą już nową generację - stare wiersze można usunąć
+        # (poza generacjami przebiegów tej metody, które jeszcze trwają)
+        keep = {generation, *SimilarityRun.in_progress(method).values_list('generation', flat=True)}
+        deleted_count = BookSimilarity.objects.filter(
+            version=BookSimilarity.METHOD_VERSIONS[method]
+        ).exclude(generation__in=keep).delete()[0]
+        print(f"🔀 Generation {generation} is live ({deleted_count} old rows removed)")
+    
+    @staticmethod
+    def _catalog_fingerprint(book_ids):
+        """
+        Skrót posortowanych ID książek - wznowienie wymaga tego samego katalogu
+        """
+        ids = np.sort(np.asarray(book_ids, dtype=np.int64))
+        return hashlib.sha256(ids.tobytes()).hexdigest()[:16]
+    
+    def _discard_unpublished(self, generation=None, method='aspects'):
+        """
+        Usuń wiersze podanej generacji albo nieopublikowanych generacji
+        porzuconych przebiegów metody (SimilarityRun.abandoned) - przebiegi
+        w toku, także drugiej metody, zostają nietknięte
+        """
+        if generation is not None:
+            rows = BookSimilarity.objects.filter(generation=generation)
+        else:
+            abandoned = SimilarityRun.abandoned(method)
+            # Opublikowane generacje wskazują wskaźniki metod (bez wskaźnika - generacja 0)
+            active_generations = set(SimilarityGeneration.objects.values_list('active', flat=True))
+            active_generations.add(0)
+            generations = set(abandoned.values_list('generation', flat=True)) - active_generations
+            rows = BookSimilarity.objects.filter(generation__in=generations)
+            abandoned.filter(status='running').update(status='failed')
+        
+        deleted_count = rows.delete()[0]
+        if deleted_count:
+            print(f"🗑️  Discarded {deleted_count} rows of unpublished generations")
+    
+    def _current_kth_scores(self, book_ids, excluded_ids, top_k):
+        """
+        K-ty najlepszy zapisany wynik każdej książki (bez par z excluded_ids).
+        Książki z mniej niż K sąsiadami dostają próg min_similarity_threshold.
+        """
+        index_of = {book_id: index for index, book_id in enumerate(book_ids)}
+        kth_scores = np.full(len(book_ids), self.min_similarity_threshold, dtype=np.float64)
+        
+        stored = np.array(
+            BookSimilarity.live('aspects').exclude(book1_id__in=excluded_ids).exclude(
+                book2_id__in=excluded_ids
+            ).values_list('book1_id', 'book2_id', 'cosine_similarity'),
+            dtype=np.float64
+        ).reshape(-1, 3)
+        
+        if len(stored) == 0:
+            return kth_scores
+        
+        indices = np.array(
+            [index_of.get(int(book_id), -1) for book_id in np.concatenate([stored[:, 0], stored[:, 1]])]
+        )
+        scores = np.concatenate([stored[:, 2], stored[:, 2]])
+        valid = indices >= 0
+        indices, scores = indices[valid], scores[valid]
+        
+        # Sortuj po książce, a w obrębie książki malejąco po wyniku
+        order = np.lexsort((-scores, indices))
+        indices, scores = indices[order], scores[order]
+        counts = np.bincount(indices, minlength=len(book_ids))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        
+        full = counts >= top_k
+        kth_scores[full] = scores[starts[full] + top_k - 1]
+        
+        return kth_scores
+    
     def get_similar_books(self, book, limit=10, min_similarity=0.1):
         """
         Znajdź podobne książki (z cache lub wylicz dynamicznie)
         """
-        # Sprawdź czy są prekalkulowane podobieństwa
+        # Najpierw magazyn sąsiadów (memmap) - bez zapytań o listę sąsiadów
+        store = self.get_neighbour_store()
+        stored = store.similar(book.id, limit=limit, min_similarity=min_similarity) if store else None
+        
+        if stored is not None:
+            # Książka jest w magazynie - pusta lista to też ostateczna odpowiedź
+            neighbour_ids, scores = stored
+            if not len(neighbour_ids):
+                return []
+            books_by_id = Book.objects.in_bulk(neighbour_ids.tolist())
+            return [
+                {
+                    'book': books_by_id[neighbour_id],
+                    'similarity': float(row[0]),
+                    'details': {
+                        'category': float(row[1]),
+                        'keyword': float(row[2]),
+                        'author': float(row[3]),
+                        'description': float(row[4])
+                    }
+                }
+                for neighbour_id, row in zip(neighbour_ids.tolist(), scores)
+                if neighbour_id in books_by_id
+            ]
+        
+        # Sprawdź czy są prekalkulowane podobieństwa (książki spoza magazynu)
         cached_similarities = BookSimilarity.get_similar_books(
             book, limit=limit, min_similarity=min_similarity
         )
@@ -378,20 +1578,190 @@ class BookSimilarityService:
         if cached_similarities:
             return cached_similarities
         
-        # Jeśli brak cache, wylicz dynamicznie dla kilku najbardziej popularnych książek
+        # Metoda LSA - osadzenia z pamięci (jedno mnożenie macierz-wektor)
+        if self.similarity_method == 'lsa':
+            lsa_similarities = self._lsa_similar_books(book, limit, min_similarity)
+            if lsa_similarities is not None:
+                return lsa_similarities
+        
+        # Jeśli brak cache, wylicz dynamicznie - jedno obliczenie na książkę
+        # naraz, wynik zapisany do BookSimilarity dla kolejnych zapytań
+        dynamic_similarities = self._coalesced_dynamic_similarities(book)
+        
+        return [
+            similarity for similarity in dynamic_similarities
+            if similarity['similarity'] >= min_similarity
+        ][:limit]
+    
+    def _lsa_similar_books(self, book, limit, min_similarity):
+        """
+        Sąsiedzi z osadzeń LSA (None, gdy brak modelu albo książki w modelu).
+        Podobieństwa aspektów są liczone tylko dla zwróconych książek.
+        """
+        model = self.get_lsa_model()
+        stored = model.similar(book.id, limit=limit, min_similarity=min_similarity) if model else None
+        if stored is None:
+            return None
+        
+        neighbour_ids, scores = stored
+        books_by_id = Book.objects.in_bulk(neighbour_ids.tolist())
+        cached_vectors = self.get_cached_vectors([book] + list(books_by_id.values()))
+        
+        results = []
+        for neighbour_id, score in zip(neighbour_ids.tolist(), scores.tolist()):
+            other_book = books_by_id.get(neighbour_id)
+            if other_book is None:
+                continue
+            
+            similarity_data = self.calculate_similarity_between_books(
+                book, other_book,
+                vector1=cached_vectors[book.id],
+                vector2=cached_vectors[other_book.id]
+            )
+            results.append({
+                'book': other_book,
+                'similarity': min(float(score), 1.0),
+                'details': {
+                    'category': similarity_data['category_similarity'],
+                    'keyword': similarity_data['keyword_similarity'],
+                    'author': similarity_data['author_similarity'],
+                    'description': similarity_data['description_similarity']
+                }
+            })
+        
+        return results
+    
+    def _coalesced_dynamic_similarities(self, book):
+        """
+        Single-flight dla wyliczania dynamicznego: równoległe zapytania o tę
+        samą książkę w procesie czekają na jedno obliczenie (Future), a między
+        workerami kolejkuje je blokada doradcza PostgreSQL. Zwraca wszystkie
+        wyniki kandydatów (malejąco) - filtr progu i limit nakłada wołający.
+        """
+        with self._inflight_lock:
+            flight = self._inflight.get(book.id)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._inflight[book.id] = flight
+        
+        if not leader:
+            try:
+                return flight.result(timeout=self.dynamic_wait_timeout)
+            except FutureTimeoutError:
+                # Lider liczy za długo - liczymy sami (blokada doradcza kolejkuje
+                # workery, a wiersze zapisane przez lidera są czytane z bazy)
+                print(f"⏳ Dynamic calculation for {book.title} still running - computing directly")
+                return self._locked_dynamic_similarities(book)
+        
+        try:
+            results = self._locked_dynamic_similarities(book)
+            flight.set_result(results)
+            return results
+        except BaseException as e:
+            # Także przerwanie lidera budzi czekających (zamiast czekać do timeoutu)
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(book.id, None)
+    
+    def _locked_dynamic_similarities(self, book):
+        """
+        Wylicz dynamicznie pod blokadą doradczą i zapisz pary powyżej progu
+        do aktywnej generacji. Worker, który czekał na blokadę, czyta już
+        zapisane wiersze zamiast liczyć ponownie.
+        """
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT pg_advisory_xact_lock(%s, %s)",
+                        [DYNAMIC_SIMILARITY_LOCK, book.id]
+                    )
+            
+            stored = BookSimilarity.get_similar_books(
+                book, limit=self.max_dynamic_candidates, min_similarity=0
+            )
+            if stored:
+                return stored
+            
+            dynamic_similarities = self._calculate_dynamic_similarities(book)
+            
+            # Wyniki dynamiczne to kosinus aspektów - przy serwowaniu LSA nie
+            # trafiłyby do czytanej generacji (inna `version`), więc ich nie zapisujemy
+            if self.similarity_method != 'aspects':
+                return dynamic_similarities
+            
+            # Magazyn sąsiadów nie jest odświeżany - książki w nim nie ma,
+            # więc kolejne zapytania trafią do bazy
+            rows = [
+                {
+                    'book1_id': min(book.id, similarity['book'].id),
+                    'book2_id': max(book.id, similarity['book'].id),
+                    'cosine_similarity': similarity['similarity'],
+                    **{
+                        f'{aspect}_similarity': similarity['details'][aspect]
+                        for aspect in ASPECTS
+                    }
+                }
+                for similarity in dynamic_similarities
+                if similarity['similarity'] >= self.min_similarity_threshold
+            ]
+            
+            if rows:
+                SimilarityWriter(
+                    ignore_conflicts=True,
+                    generation=SimilarityGeneration.get_active(BookSimilarity.GENERATION_KEYS['aspects']),
+                    version=BookSimilarity.METHOD_VERSIONS['aspects']
+                ).write_rows(rows)
+                # Nowe pary zmieniają tylko listy tej książki i jej sąsiadów
+                affected_ids = [book.id] + [row['book1_id'] + row['book2_id'] - book.id for row in rows]
+                transaction.on_commit(lambda: recommendation_cache.invalidate_books(affected_ids))
+        
+        return dynamic_similarities
+    
+    def _calculate_dynamic_similarities(self, book):
+        """
+        Podobieństwa do kandydatów z indeksu ANN (cały katalog), a bez niego
+        z indeksu odwróconego - wszystkie wyniki > 0, malejąco
+        """
         print(f"⚡ Dynamic calculation for {book.title}")
         
-        # Weź np. 100 najpopularniejszych książek do porównania
-        popular_books = Book.objects.exclude(id=book.id).annotate(
-            review_count=Count('reviews')
-        ).order_by('-review_count')[:100]
+        target_vector = self.get_cached_vectors([book])[book.id]
+        ann_index = self.get_ann_index()
+        
+        candidate_ids = []
+        if ann_index is not None:
+            candidate_ids = ann_index.query(
+                target_vector['combined_vector'], limit=self.max_dynamic_candidates, exclude_id=book.id
+            )
+        
+        if not len(candidate_ids):
+            candidate_ids = self.get_candidate_index().candidates(
+                target_vector, exclude_id=book.id, limit=self.max_dynamic_candidates
+            )
+        
+        if len(candidate_ids):
+            candidate_books = list(Book.objects.filter(id__in=candidate_ids.tolist()))
+        else:
+            # Brak wspólnych (nie-masowych) cech - weź 100 najpopularniejszych książek
+            candidate_books = list(Book.objects.exclude(id=book.id).annotate(
+                review_count=Count('reviews')
+            ).order_by('-review_count')[:100])
         
         dynamic_similarities = []
+        cached_vectors = self.get_cached_vectors(candidate_books)
+        cached_vectors[book.id] = target_vector
         
-        for other_book in popular_books:
-            similarity_data = self.calculate_similarity_between_books(book, other_book)
+        for other_book in candidate_books:
+            similarity_data = self.calculate_similarity_between_books(
+                book, other_book,
+                vector1=cached_vectors[book.id],
+                vector2=cached_vectors[other_book.id]
+            )
             
-            if similarity_data['cosine_similarity'] >= min_similarity:
+            if similarity_data['cosine_similarity'] > 0:
                 dynamic_similarities.append({
                     'book': other_book,
                     'similarity': similarity_data['cosine_similarity'],
@@ -406,7 +1776,76 @@ class BookSimilarityService:
         # Sortuj według podobieństwa
         dynamic_similarities.sort(key=lambda x: x['similarity'], reverse=True)
         
-        return dynamic_similarities[:limit]
+        return dynamic_similarities
+    
+    def get_similar_books_batch(self, book_ids, limit=10, min_similarity=0.1, books_queryset=None):
+        """
+        Podobne książki dla wielu książek naraz - stała liczba zapytań.
+        
+        Sąsiedzi są brani z magazynu (memmap), a dla książek spoza niego
+        z jednego zapytania do `BookSimilarity.live()`. Wszystkie polecane
+        książki są pobierane jednym zapytaniem z `books_queryset` (np. z
+        prefetch_related / annotate). Bez wyliczania dynamicznego - książki
+        bez prekalkulowanych podobieństw dostają pustą listę.
+        
+        Zwraca słownik book_id -> lista w formacie get_similar_books.
+        """
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+        neighbours = {book_id: [] for book_id in book_ids}
+        
+        store = self.get_neighbour_store()
+        missing_ids = []
+        
+        for book_id in book_ids:
+            stored = store.similar(book_id, limit=limit, min_similarity=min_similarity) if store else None
+            if stored is None:
+                missing_ids.append(book_id)
+                continue
+            
+            neighbour_ids, scores = stored
+            neighbours[book_id] = [
+                (neighbour_id, row.tolist())
+                for neighbour_id, row in zip(neighbour_ids.tolist(), scores)
+            ]
+        
+        if missing_ids:
+            missing = set(missing_ids)
+            rows = BookSimilarity.live().filter(
+                Q(book1_id__in=missing_ids) | Q(book2_id__in=missing_ids),
+                cosine_similarity__gte=min_similarity
+            ).order_by('-cosine_similarity').values_list('book1_id', 'book2_id', *SIMILARITY_FIELDS)
+            
+            # Wiersze są malejąco po kosinusie - wystarczy obciąć każdą listę do limitu
+            for book1_id, book2_id, *scores in rows:
+                for source_id, target_id in ((book1_id, book2_id), (book2_id, book1_id)):
+                    if source_id in missing and len(neighbours[source_id]) < limit:
+                        neighbours[source_id].append((target_id, scores))
+        
+        if books_queryset is None:
+            books_queryset = Book.objects.all()
+        
+        books_by_id = books_queryset.in_bulk({
+            neighbour_id for pairs in neighbours.values() for neighbour_id, _ in pairs
+        })
+        
+        results = {}
+        for book_id, pairs in neighbours.items():
+            results[book_id] = [
+                {
+                    'book': books_by_id[neighbour_id],
+                    'similarity': float(scores[0]),
+                    'details': {
+                        'category': float(scores[1]),
+                        'keyword': float(scores[2]),
+                        'author': float(scores[3]),
+                        'description': float(scores[4])
+                    }
+                }
+                for neighbour_id, scores in pairs
+                if neighbour_id in books_by_id
+            ]
+        
+        return results
 
 # Singleton instance - utwórz raz i używaj wszędzie
 _service_instance = None
@@ -0,0 +1,129 @@
+"""
+Zapis wyników podobieństw do bazy paczkami (bulk_create lub COPY FROM STDIN)
+"""
+import io
+import time
+from django.db import connection
+from django.utils import timezone
+
+from ml_api.models import BookSimilarity
+from ml_api.services.similarity_engine import SIMILARITY_FIELDS
+
+
+class SimilarityWriter:
+    """
+    Strumieniowy zapis paczek `BookSimilarity` z pomiarem przepustowości.
+
+    method='bulk' - `bulk_create(batch_size=...)` (działa na każdej bazie)
+    method='copy' - `COPY ... FROM STDIN` na połączeniu psycopg2 (PostgreSQL);
+                    na innych bazach automatycznie przechodzi na 'bulk'
+    """
+
+    COLUMNS = ('book1_id', 'book2_id') + SIMILARITY_FIELDS
+    STAGING_TABLE = 'book_similarities_staging'
+
+    def __init__(self, method='bulk', batch_size=5000, ignore_conflicts=False, generation=0, version=1):
+        if method == 'copy' and connection.vendor != 'postgresql':
+            print("⚠️  COPY requires PostgreSQL - falling back to bulk_create")
+            method = 'bulk'
+
+        self.method = method
+        self.batch_size = batch_size
+        self.ignore_conflicts = ignore_conflicts  # Pomijaj pary, które już istnieją
+        self.generation = generation  # Generacja, do której trafiają wiersze
+        self.version = version  # Wersja algorytmu (BookSimilarity.METHOD_VERSIONS)
+        self.rows_written = 0
+        self.seconds = 0.0
+        self._staging_ready = False
+
+    def write_rows(self, rows):
+        """
+        Zapisz listę słowników {book1_id, book2_id, cosine_similarity, ...}
+        """
+        if not rows:
+            return
+        self.write_batch({
+            column: [row[column] for row in rows] for column in self.COLUMNS
+        })
+
+    def write_batch(self, batch):
+        """
+        Zapisz paczkę kolumnową (słownik kolumna -> tablica), np. z silnika macierzowego
+        """
+        total = len(batch['book1_id'])
+        columns = [self._as_list(batch[column]) for column in self.COLUMNS]
+
+        for start in range(0, total, self.batch_size):
+            chunk = [values[start:start + self.batch_size] for values in columns]
+            started = time.perf_counter()
+
+            if self.method == 'copy':
+                self._copy_chunk(chunk)
+            else:
+                self._bulk_chunk(chunk)
+
+            self.seconds += time.perf_counter() - started
+            self.rows_written += len(chunk[0])
+
+    def report(self):
+        """
+        Statystyki zapisu: liczba wierszy, czas i wiersze na sekundę
+        """
+        return {
+            'method': self.method,
+            'rows': self.rows_written,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_written / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+    def print_report(self):
+        stats = self.report()
+        print(
+            f"💾 Wrote {stats['rows']} rows via {stats['method']} in {stats['seconds']:.2f}s "
+            f"({stats['rows_per_second']:.0f} rows/s)"
+        )
+
+    def _as_list(self, values):
+        return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+    def _bulk_chunk(self, chunk):
+        BookSimilarity.objects.bulk_create(
+            [
+                BookSimilarity(generation=self.generation, version=self.version, **dict(zip(self.COLUMNS, values)))
+                for values in zip(*chunk)
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=self.ignore_conflicts
+        )
+
+    def _copy_chunk(self, chunk):
+        calculated_at = timezone.now().isoformat()
+        buffer = io.StringIO()
+
+        for values in zip(*chunk):
+            buffer.write('\t'.join(str(value) for value in values))
+            buffer.write(f'\t{calculated_at}\t{self.version}\t{self.generation}\n')
+        buffer.seek(0)
+
+        columns = ', '.join(self.COLUMNS + ('calculated_at', 'version', 'generation'))
+        table = BookSimilarity._meta.db_table
+
+        with connection.cursor() as cursor:
+            if not self.ignore_conflicts:
+                cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+                return
+
+            # COPY nie obsługuje ON CONFLICT - ładujemy do tabeli tymczasowej
+            if not self._staging_ready:
+                cursor.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {self.STAGING_TABLE} AS "
+                    f"SELECT {columns} FROM {table} WITH NO DATA"
+                )
+                self._staging_ready = True
+
+            cursor.copy_expert(f"COPY {self.STAGING_TABLE} ({columns}) FROM STDIN", buffer)
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {self.STAGING_TABLE} "
+                f"ON CONFLICT DO NOTHING"
+            )
+            cursor.execute(f"TRUNCATE {self.STAGING_TABLE}")
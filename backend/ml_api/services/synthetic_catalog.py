@@ -0,0 +1,149 @@
+"""
+Syntetyczny katalog książek do benchmarków liczenia podobieństw.
+
+Rozkłady naśladują prawdziwy katalog: popularność kategorii, autorów,
+słów kluczowych i słów opisu jest zipfowska (kilka bardzo częstych, długi
+ogon rzadkich), a długość opisu ma rozkład log-normalny. Obiekty mają te
+same atrybuty, których używa `extract_features_batch` (categories.all(),
+authors.all(), keywords, description) - nie trafiają do bazy danych.
+Moduł nie zależy od Django.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+SyntheticCategory = namedtuple('SyntheticCategory', 'name')
+SyntheticAuthor = namedtuple('SyntheticAuthor', 'first_name last_name')
+
+CATEGORY_NAMES = (
+    'Fiction', 'Fantasy', 'Science Fiction', 'Mystery', 'Thriller', 'Romance',
+    'Horror', 'Historical Fiction', 'Biography', 'History', 'Science', 'Philosophy',
+    'Poetry', 'Drama', 'Young Adult', 'Children', 'Crime', 'Adventure', 'Classics',
+    'Self-Help', 'Business', 'Psychology', 'Travel', 'Cooking', 'Art', 'Religion',
+    'Politics', 'Economics', 'Health', 'Sports', 'Music', 'Comics', 'Humor',
+    'Memoir', 'Nature', 'Technology', 'Mathematics', 'Education', 'Law', 'War',
+)
+
+# Słowa funkcyjne wplatane w opisy - tokenizer i filtr stop words mają co odrzucać
+FILLER_WORDS = ('the', 'and', 'of', 'a', 'in', 'to', 'is', 'with', 'his', 'her', 'that', 'for')
+
+SYLLABLES = (
+    'ka', 'lo', 'mi', 'ra', 'ten', 'vor', 'shi', 'dan', 'el', 'mor', 'qua', 'zi',
+    'bel', 'tor', 'ven', 'ar', 'is', 'nu', 'pha', 'gri', 'sol', 'ith', 'wen', 'dra',
+)
+
+
+class _Related(list):
+    """Lista udająca menedżera relacji (book.categories.all())"""
+
+    def all(self):
+        return self
+
+
+class SyntheticBook:
+    __slots__ = ('id', 'title', 'description', 'keywords', 'categories', 'authors')
+
+    def __init__(self, id, title, description, keywords, categories, authors):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.keywords = keywords
+        self.categories = _Related(categories)
+        self.authors = _Related(authors)
+
+
+def zipf_weights(size, exponent=1.0):
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def make_vocabulary(rng, size, min_syllables=2, max_syllables=4):
+    """
+    Unikalne, czysto literowe słowa z sylab (w losowej kolejności popularności)
+    """
+    syllables = np.asarray(SYLLABLES)
+    words = set()
+    while len(words) < size:
+        # Losuj z zapasem - duplikaty odpadają w zbiorze
+        count = 2 * (size - len(words))
+        lengths = rng.integers(min_syllables, max_syllables + 1, size=count)
+        parts = syllables[rng.integers(0, len(syllables), size=(count, max_syllables))]
+        for row, length in zip(parts.tolist(), lengths.tolist()):
+            words.add(''.join(row[:length]))
+    words = sorted(words)[:size] if len(words) > size else sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def _split(values, lengths):
+    return np.split(values, np.cumsum(lengths)[:-1])
+
+
+def generate_catalog(n_books, seed=42, vocabulary_size=20000, keyword_vocabulary_size=2000):
+    """
+    Wygeneruj `n_books` syntetycznych książek (ID od 1).
+
+    Losowanie odbywa się jednym wywołaniem na cechę dla całego katalogu
+    (rng.choice z wagami jest O(rozmiar słownika) na wywołanie).
+    """
+    rng = np.random.default_rng(seed)
+
+    vocabulary = np.asarray(make_vocabulary(rng, vocabulary_size))
+    keyword_vocabulary = np.asarray(make_vocabulary(rng, keyword_vocabulary_size, 2, 3))
+    categories = [SyntheticCategory(name) for name in CATEGORY_NAMES]
+
+    n_authors = max(n_books // 8, 10)
+    first_names = make_vocabulary(rng, 500, 2, 3)
+    last_names = make_vocabulary(rng, 2000, 2, 4)
+    authors = [
+        SyntheticAuthor(first_names[i % len(first_names)].title(), last_names[i % len(last_names)].title())
+        for i in range(n_authors)
+    ]
+
+    # Liczba cech na książkę
+    category_counts = rng.choice([1, 2, 3], size=n_books, p=[0.5, 0.35, 0.15])
+    author_counts = rng.choice([1, 2], size=n_books, p=[0.85, 0.15])
+    keyword_counts = rng.integers(3, 11, size=n_books)
+    description_lengths = np.clip(
+        rng.lognormal(mean=4.6, sigma=0.5, size=n_books), 20, 400
+    ).astype(np.int64)
+
+    # Cechy całego katalogu (zipf - kilka popularnych, długi ogon)
+    category_ids = _split(
+        rng.choice(len(categories), size=category_counts.sum(), p=zipf_weights(len(categories), 1.1)),
+        category_counts
+    )
+    author_ids = _split(
+        rng.choice(n_authors, size=author_counts.sum(), p=zipf_weights(n_authors, 0.9)),
+        author_counts
+    )
+    keyword_ids = _split(
+        rng.choice(len(keyword_vocabulary), size=keyword_counts.sum(), p=zipf_weights(len(keyword_vocabulary))),
+        keyword_counts
+    )
+    word_ids = _split(
+        rng.choice(len(vocabulary), size=description_lengths.sum(), p=zipf_weights(len(vocabulary), 1.07)),
+        description_lengths
+    )
+    fillers = _split(
+        rng.choice(FILLER_WORDS, size=(description_lengths // 3).sum()),
+        description_lengths // 3
+    )
+
+    books = []
+    for index in range(n_books):
+        words = vocabulary[word_ids[index]].tolist()
+        # Co trzecie słowo - słowo funkcyjne (wstawione co trzy pozycje)
+        for position, filler in enumerate(fillers[index].tolist()):
+            words.insert(position * 3, filler)
+
+        books.append(SyntheticBook(
+            id=index + 1,
+            title=f"Synthetic Book {index + 1}",
+            description=' '.join(words).capitalize() + '.',
+            keywords=', '.join(dict.fromkeys(keyword_vocabulary[keyword_ids[index]].tolist())),
+            categories=[categories[i] for i in dict.fromkeys(category_ids[index].tolist())],
+            authors=[authors[i] for i in dict.fromkeys(author_ids[index].tolist())],
+        ))
+
+    return books
@@ -0,0 +1,136 @@
+"""
+Korpusowy model TF-IDF dla opisów i słów kluczowych książek.
+
+Model jest dopasowywany raz do całego katalogu (TfidfVectorizer na gotowych
+tokenach), a słownik i wartości IDF są zapisywane na dysk (.npz). Nowe książki
+są transformowane przyrostowo tym samym słownikiem - nieznane słowa są
+pomijane. Wynikiem są wiersze rzadkie (CSR) z całkowitymi ID termów.
+"""
+import os
+import hashlib
+import numpy as np
+from scipy import sparse
+
+from ml_api.services.similarity_engine import l2_normalize_rows
+
+# Aspekt -> czy TF jest binarne (słowa kluczowe) czy logarytmiczne (opis)
+TFIDF_ASPECTS = {
+    'description': False,
+    'keyword': True,
+}
+
+
+def _identity(tokens):
+    return tokens
+
+
+class CorpusTfidfModel:
+    """
+    Słowniki i IDF dla aspektów z TFIDF_ASPECTS
+    """
+
+    def __init__(self, min_df=1, max_df=1.0):
+        self.min_df = min_df
+        self.max_df = max_df
+        self.vocabularies = {}  # aspekt -> {term: id}
+        self.idf = {}           # aspekt -> np.ndarray float64
+        self.model_id = ''      # Identyfikator dopasowania (zmienia się po ponownym fit)
+
+    def _compute_model_id(self):
+        digest = hashlib.sha256()
+        for aspect in sorted(self.vocabularies):
+            digest.update(aspect.encode('utf-8'))
+            digest.update('\x1f'.join(self.terms(aspect)).encode('utf-8'))
+            digest.update(self.idf[aspect].tobytes())
+        self.model_id = digest.hexdigest()[:16]
+
+    def terms(self, aspect):
+        vocabulary = self.vocabularies[aspect]
+        return sorted(vocabulary, key=vocabulary.get)
+
+    def fit(self, documents):
+        """
+        Dopasuj model; `documents` to słownik aspekt -> lista list tokenów
+        """
+        # sklearn jest potrzebny tylko przy dopasowaniu - nie przy imporcie modułu
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        for aspect, binary in TFIDF_ASPECTS.items():
+            vectorizer = TfidfVectorizer(
+                analyzer=_identity,
+                binary=binary,
+                sublinear_tf=not binary,
+                min_df=self.min_df,
+                max_df=self.max_df,
+            )
+            try:
+                vectorizer.fit(documents[aspect])
+            except ValueError:
+                # Pusty słownik (np. brak opisów w katalogu)
+                self.vocabularies[aspect] = {}
+                self.idf[aspect] = np.empty(0, dtype=np.float64)
+                continue
+
+            self.vocabularies[aspect] = {
+                term: int(index) for term, index in vectorizer.vocabulary_.items()
+            }
+            self.idf[aspect] = np.asarray(vectorizer.idf_, dtype=np.float64)
+
+        self._compute_model_id()
+        return self
+
+    def transform(self, aspect, documents):
+        """
+        Zamień listy tokenów na wiersze TF-IDF (CSR, wiersze znormalizowane L2)
+        """
+        vocabulary = self.vocabularies[aspect]
+        binary = TFIDF_ASPECTS[aspect]
+
+        indptr = [0]
+        indices = []
+        data = []
+
+        for tokens in documents:
+            counts = {}
+            for token in tokens:
+                index = vocabulary.get(token)
+                if index is not None:
+                    counts[index] = counts.get(index, 0) + 1
+            indices.extend(counts)
+            data.extend(counts.values())
+            indptr.append(len(indices))
+
+        tf = np.asarray(data, dtype=np.float64)
+        tf = np.ones_like(tf) if binary else 1.0 + np.log(tf)
+        indices = np.asarray(indices, dtype=np.int32)
+
+        matrix = sparse.csr_matrix(
+            (tf * self.idf[aspect][indices], indices, np.asarray(indptr, dtype=np.int64)),
+            shape=(len(documents), max(len(vocabulary), 1)),
+        )
+        return l2_normalize_rows(matrix)
+
+    def row_to_dict(self, row):
+        """
+        Wiersz CSR -> słownik {ID termu (str): waga} zapisywany w BookVector
+        """
+        return {str(int(index)): float(value) for index, value in zip(row.indices, row.data)}
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {}
+        for aspect in TFIDF_ASPECTS:
+            arrays[f'{aspect}_terms'] = np.asarray(self.terms(aspect), dtype=str)
+            arrays[f'{aspect}_idf'] = self.idf[aspect]
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        model = cls()
+        with np.load(path) as data:
+            for aspect in TFIDF_ASPECTS:
+                terms = data[f'{aspect}_terms'].tolist()
+                model.vocabularies[aspect] = {term: index for index, term in enumerate(terms)}
+                model.idf[aspect] = data[f'{aspect}_idf']
+        model._compute_model_id()
+        return model
@@ -1,8 +1,11 @@
 import numpy as np
 from collections import defaultdict
 from django.db import transaction, models
-from django.db.models import Q, Avg, Count
+from django.db.models import Q, Avg, Count, Sum, F, Case, When, Value, FloatField, ExpressionWrapper
+from scipy import sparse
 from sklearn.metrics.pairwise import cosine_similarity
+from .rating_matrix import RatingMatrix, RatingSimilarityEngine
+from .preference_matrix import PreferenceMatrix
 from ..models import (
     User, UserSimilarity, UserPreferenceProfile, 
     BookReview, Category, Author, Publisher
@@ -19,6 +22,9 @@ class UserSimilarityService:
             'preference': 0.6,  # Profile preferences
             'rating': 0.4       # Rating patterns
         }
+        self.rating_metric = 'pearson'  # 'pearson' (common books) or 'cosine' (mean-centered)
+        self.write_batch_size = 1000
+        self.max_block_pairs = 2_000_000  # Cap on block_size x users scored at once
     
     def calculate_preference_similarity(self, user1_profile, user2_profile):
         """
@@ -143,155 +149,228 @@ class UserSimilarityService:
             'combined_similarity': combined
         }
     
-    def calculate_similarities_for_user(self, target_user, batch_size=50):
+    def load_rating_matrix(self, all_user_ids=None):
+        """
+        Load every review once into a sparse user x book rating matrix
+        """
+        reviews = np.array(
+            list(BookReview.objects.values_list('user_id', 'book_id', 'rating')),
+            dtype=np.int64
+        ).reshape(-1, 3)
+        return RatingMatrix.from_triples(
+            reviews[:, 0], reviews[:, 1], reviews[:, 2], all_user_ids=all_user_ids
+        )
+
+    def _load_candidates(self):
+        """
+        Users taking part in similarity (with reviews or a profile), their
+        rating matrix and profiles - one query each
+        """
+        profiles = {profile.user_id: profile for profile in UserPreferenceProfile.objects.all()}
+        ratings = self.load_rating_matrix(all_user_ids=list(profiles))
+        return ratings, profiles
+
+    def _build_similarity_records(self, ratings, preferences, rows, rating_rows, rating_cols, rating_sims, upper_only=True):
+        """
+        Combine rating and preference similarity of a block of matrix rows
+        against all users into unsaved UserSimilarity objects above the threshold.
+        Both parts stay sparse - only pairs with a non-zero score are looked at
+        (the threshold is positive, so the rest can never be kept).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        preference = preferences.similarity_rows(rows)
+
+        rating = sparse.csr_matrix(
+            (rating_sims, (np.searchsorted(rows, rating_rows), rating_cols)), shape=preference.shape
+        )
+
+        combined = (
+            preference * self.weights['preference'] +
+            rating * self.weights['rating']
+        ).tocoo()
+        local, cols = combined.row.astype(np.int64), combined.col.astype(np.int64)
+
+        keep = combined.data >= self.min_similarity_threshold
+        keep &= (cols > rows[local]) if upper_only else (cols != rows[local])
+        local, cols = local[keep], cols[keep]
+
+        # Row-major order, so records come out in the same order as before
+        order = np.lexsort((cols, local))
+        local, cols, combined_sims = local[order], cols[order], combined.data[keep][order]
+
+        def pick(matrix):
+            matrix.sort_indices()  # indexing pairs in an unsorted CSR is very slow
+            return np.asarray(matrix[local, cols]).ravel() if len(local) else np.empty(0)
+
+        user_ids = ratings.user_ids
+        first, second = user_ids[rows[local]], user_ids[cols]
+
+        return [
+            UserSimilarity(
+                user1_id=min(user_a, user_b),
+                user2_id=max(user_a, user_b),
+                preference_similarity=pref_sim,
+                rating_similarity=rating_sim,
+                combined_similarity=combined_sim
+            )
+            for user_a, user_b, pref_sim, rating_sim, combined_sim in zip(
+                first.tolist(), second.tolist(),
+                pick(preference).tolist(), pick(rating).tolist(), combined_sims.tolist()
+            )
+        ]
+
+    def calculate_similarities_for_user(self, target_user, batch_size=50, metric=None):
         """
         Calculate similarities for one user against all others
         """
         print(f"📊 Calculating user similarities for: {target_user.username}")
-        
-        # Get all other users (with reviews or profiles)
-        other_users = User.objects.exclude(id=target_user.id).filter(
-            models.Q(reviews__isnull=False) | 
-            models.Q(preference_profile__isnull=False)
-        ).distinct()
-        
-        total_users = other_users.count()
-        similarities_created = 0
-        
-        print(f"👥 Processing {total_users} other users...")
-        
+
+        ratings, profiles = self._load_candidates()
+        if ratings.row(target_user.id) is None:
+            ratings = self.load_rating_matrix(all_user_ids=list(profiles) + [target_user.id])
+        target_row = ratings.row(target_user.id)
+
+        print(f"👥 Processing {len(ratings) - 1} other users...")
+
+        engine = RatingSimilarityEngine(metric=metric or self.rating_metric)
+        prepared = engine.prepare(ratings)
+        preferences = PreferenceMatrix.from_profiles(ratings.user_ids, profiles)
+
+        records = self._build_similarity_records(
+            ratings, preferences, [target_row],
+            *engine.score_rows(prepared, [target_row], upper_only=False),
+            upper_only=False
+        )
+
         with transaction.atomic():
             # Delete old similarities
             UserSimilarity.objects.filter(
                 Q(user1=target_user) | Q(user2=target_user)
             ).delete()
-            
-            for i, other_user in enumerate(other_users):
-                if i % batch_size == 0:
-                    print(f"   Progress: {i}/{total_users}")
-                
-                # Calculate similarity
-                sim_data = self.calculate_similarity_between_users(
-                    target_user, other_user
-                )
-                
-                # Save only if above threshold
-                if sim_data['combined_similarity'] >= self.min_similarity_threshold:
-                    user1, user2 = (target_user, other_user) if target_user.id < other_user.id else (other_user, target_user)
-                    
-                    UserSimilarity.objects.create(
-                        user1=user1,
-                        user2=user2,
-                        **sim_data
-                    )
-                    similarities_created += 1
-        
-        print(f"Created {similarities_created} user similarity records")
-        return similarities_created
-    
-    def calculate_all_similarities(self, batch_size=50):
+            UserSimilarity.objects.bulk_create(records, batch_size=self.write_batch_size)
+
+        print(f"Created {len(records)} user similarity records")
+        return len(records)
+
+    def calculate_all_similarities(self, batch_size=50, metric=None, block_size=500):
         """
-        Calculate similarities for all users
+        Calculate similarities for all users.
+        Reviews are loaded once into a sparse rating matrix and profiles into
+        preference matrices; every block of block_size users is scored
+        against all users with a few sparse matrix products and the table is
+        replaced in one transaction.
+        batch_size is kept for existing callers - writes use write_batch_size.
         """
         print("CALCULATING ALL USER SIMILARITIES")
         print("=" * 50)
-        
-        # Get users with reviews or profiles
-        users = User.objects.filter(
-            models.Q(reviews__isnull=False) | 
-            models.Q(preference_profile__isnull=False)
-        ).distinct()
-        
-        total_users = users.count()
-        print(f"👥 Processing {total_users} users...")
-        
-        processed = 0
+
+        ratings, profiles = self._load_candidates()
+        total_users = len(ratings)
+        # Category similarity is non-zero for most pairs, so a block costs
+        # about block_size x users values - smaller blocks for large user bases
+        block_size = max(1, min(block_size, self.max_block_pairs // max(total_users, 1)))
+        print(f"👥 Processing {total_users} users (blocks of {block_size})...")
+
+        engine = RatingSimilarityEngine(metric=metric or self.rating_metric, block_size=block_size)
+        prepared = engine.prepare(ratings)
+        preferences = PreferenceMatrix.from_profiles(ratings.user_ids, profiles)
+
         total_similarities = 0
-        
-        for user in users:
-            try:
-                count = self.calculate_similarities_for_user(user, batch_size)
-                total_similarities += count
-                processed += 1
-                
-                if processed % 10 == 0:
-                    print(f"Progress: {processed}/{total_users} users")
-            
-            except Exception as e:
-                print(f"Error processing {user.username}: {e}")
-                continue
-        
+
+        with transaction.atomic():
+            UserSimilarity.objects.all().delete()
+
+            for start, end, rows, cols, rating_sims in engine.iter_blocks(prepared, total_users):
+                records = self._build_similarity_records(
+                    ratings, preferences, np.arange(start, end), rows, cols, rating_sims
+                )
+                UserSimilarity.objects.bulk_create(records, batch_size=self.write_batch_size)
+                total_similarities += len(records)
+
+                print(f"Progress: {end}/{total_users} users")
+
         print("=" * 50)
         print(f"✅ USER SIMILARITY CALCULATION COMPLETED!")
-        print(f"👥 Users processed: {processed}/{total_users}")
+        print(f"👥 Users processed: {total_users}")
         print(f"🔗 Total similarities: {total_similarities}")
-        
+
         return total_similarities
-    
-    def get_collaborative_recommendations(self, user, limit=10, min_similarity=0.3):
+
+    def get_collaborative_recommendations(self, user, limit=10, min_similarity=0.3, neighbours=20):
         """
-        Get book recommendations based on similar users (collaborative filtering)
+        Get book recommendations based on similar users (collaborative filtering).
+        Scores are one aggregated query - SUM(similarity * rating / 10) over
+        reviews rated 7+ by the similar users, without books the user has
+        already reviewed - followed by one prefetched fetch of the top books.
         """
 
         print(f"Getting collaborative recommendations for user: {user.username}")
         # Find similar users
-        similar_users = UserSimilarity.get_similar_users(
-            user, 
-            limit=20,  # Get more similar users
-            min_similarity=min_similarity
-        )
-        
+        similar_users = {}
+        for user1_id, user2_id, similarity in UserSimilarity.objects.filter(
+            Q(user1=user) | Q(user2=user),
+            combined_similarity__gte=min_similarity
+        ).order_by('-combined_similarity').values_list(
+            'user1_id', 'user2_id', 'combined_similarity'
+        )[:neighbours]:
+            similar_users[user2_id if user1_id == user.id else user1_id] = similarity
+
         if not similar_users:
             return []
-        
+
         print(f"Found {len(similar_users)} similar users")
-        
-        # Get books rated highly by similar users
-        from ..models import Book
-        
-        # Books already reviewed by target user
-        reviewed_book_ids = set(
-            BookReview.objects.filter(user=user).values_list('book_id', flat=True)
+
+        # Similarity of the review's author as a SQL expression
+        similarity = Case(
+            *[When(user_id=user_id, then=Value(sim)) for user_id, sim in similar_users.items()],
+            default=Value(0.0),
+            output_field=FloatField()
         )
-        
-        # Collect recommendations with scores
-        recommendations = defaultdict(float)
-        
-        for sim_data in similar_users:
-            similar_user = sim_data['user']
-            similarity = sim_data['similarity']
-            
-            # Get their highly rated books
-            high_ratings = BookReview.objects.filter(
-                user=similar_user,
+
+        top_books = list(
+            BookReview.objects.filter(
+                user_id__in=list(similar_users),
                 rating__gte=7  # Only books rated 7+
             ).exclude(
-                book_id__in=reviewed_book_ids
-            ).select_related('book')
-            
-            for review in high_ratings:
-                # Weight by similarity and rating
-                score = similarity * (review.rating / 10.0)
-                recommendations[review.book] += score
-        
-        # Sort by score
-        sorted_recommendations = sorted(
-            recommendations.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:limit]
-        
+                book_id__in=BookReview.objects.filter(user=user).values('book_id')
+            ).values('book_id').annotate(
+                score=Sum(
+                    ExpressionWrapper(similarity * F('rating') / 10.0, output_field=FloatField())
+                )
+            ).order_by('-score', 'book_id').values_list('book_id', 'score')[:limit]
+        )
+
+        books = load_recommended_books([book_id for book_id, _ in top_books])
+
         # Format results
-        results = []
-        for book, score in sorted_recommendations:
-            results.append({
-                'book': book,
+        return [
+            {
+                'book': books[book_id],
                 'recommendation_score': score,
                 'recommendation_type': 'collaborative_filtering',
                 'reason': 'Users with similar taste loved this book'
-            })
-        
-        return results
+            }
+            for book_id, score in top_books
+            if book_id in books
+        ]
+
+
+def load_recommended_books(book_ids):
+    """
+    Books for recommendation lists in one fetch: {id: book} with authors,
+    categories and publisher prefetched and the rating aggregates annotated
+    (BookListSerializer needs no further queries)
+    """
+    from ..models import Book
+
+    return Book.objects.filter(id__in=list(book_ids)).select_related(
+        'publisher'
+    ).prefetch_related(
+        'authors', 'categories'
+    ).annotate(
+        rating_avg=Avg('reviews__rating'),
+        rating_count=Count('reviews')
+    ).in_bulk()
 
 # Singleton instance
 _user_similarity_service = None
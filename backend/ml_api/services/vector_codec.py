@@ -0,0 +1,89 @@
+"""
+Kompaktowy format binarny wektorów książek (kolumna bytea w BookVector).
+
+Cechy wszystkich aspektów mają globalne ID z tabeli `VectorFeature`
+(nazwy jak w `combined_vector`: `cat_fantasy`, `kw_dragon`, `auth_...`, `desc_...`).
+Wektor jednej książki to:
+
+    int32[4]   liczba cech w aspektach (kolejność ASPECTS)
+    int32[n]   ID cech (aspekty po kolei)
+    float32[n] wagi
+
+Wszystkie liczby w little-endian. Moduł nie zależy od Django.
+"""
+import numpy as np
+from scipy import sparse
+
+from ml_api.services.similarity_engine import ASPECTS
+
+# Prefiks nazwy cechy dla każdego aspektu (jak w combined_vector)
+ASPECT_PREFIXES = {
+    'category': 'cat',
+    'keyword': 'kw',
+    'author': 'auth',
+    'description': 'desc',
+}
+
+INDEX_DTYPE = np.dtype('<i4')
+VALUE_DTYPE = np.dtype('<f4')
+
+
+def pack_vector(aspect_arrays):
+    """
+    Spakuj wektor; `aspect_arrays` to lista (ID cech, wagi) w kolejności ASPECTS
+    """
+    counts = np.asarray([len(indices) for indices, _ in aspect_arrays], dtype=INDEX_DTYPE)
+    indices = np.concatenate(
+        [np.asarray(indices, dtype=INDEX_DTYPE) for indices, _ in aspect_arrays]
+    )
+    values = np.concatenate(
+        [np.asarray(values, dtype=VALUE_DTYPE) for _, values in aspect_arrays]
+    )
+    return counts.tobytes() + indices.tobytes() + values.tobytes()
+
+
+def unpack_vector(data):
+    """
+    Rozpakuj wektor do listy (ID cech, wagi) w kolejności ASPECTS
+    """
+    counts = np.frombuffer(data, dtype=INDEX_DTYPE, count=len(ASPECTS))
+    total = int(counts.sum())
+    offset = counts.nbytes
+    indices = np.frombuffer(data, dtype=INDEX_DTYPE, count=total, offset=offset)
+    values = np.frombuffer(data, dtype=VALUE_DTYPE, count=total, offset=offset + indices.nbytes)
+
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    return [
+        (indices[bounds[i]:bounds[i + 1]], values[bounds[i]:bounds[i + 1]])
+        for i in range(len(ASPECTS))
+    ]
+
+
+def packed_to_csr(blobs, n_features):
+    """
+    Zbuduj surowe (nieznormalizowane) macierze CSR aspektów prosto z bajtów.
+    Zwraca słownik aspekt -> macierz (książki x globalne ID cech).
+    """
+    parts = {aspect: ([], [], [0]) for aspect in ASPECTS}
+
+    for data in blobs:
+        for aspect, (indices, values) in zip(ASPECTS, unpack_vector(data)):
+            aspect_indices, aspect_values, indptr = parts[aspect]
+            aspect_indices.append(indices)
+            aspect_values.append(values)
+            indptr.append(indptr[-1] + len(indices))
+
+    matrices = {}
+    for aspect, (aspect_indices, aspect_values, indptr) in parts.items():
+        matrix = sparse.csr_matrix(
+            (
+                np.concatenate(aspect_values).astype(np.float64) if aspect_values else np.empty(0),
+                np.concatenate(aspect_indices).astype(np.int32) if aspect_indices else np.empty(0, dtype=np.int32),
+                np.asarray(indptr, dtype=np.int64),
+            ),
+            shape=(len(indptr) - 1, max(n_features, 1)),
+        )
+        matrix.sum_duplicates()
+        matrices[aspect] = matrix
+
+    return matrices
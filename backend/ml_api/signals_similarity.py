@@ -0,0 +1,51 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.db import transaction
+from .models import Book, BookAuthor, BookCategory, BookReview
+from .services import recommendation_cache
+
+
+def invalidate_on_commit(book_ids):
+    """Po zapisie unieważnij cache rekomendacji książek i ich sąsiadów"""
+    book_ids = {book_id for book_id in book_ids if book_id is not None}
+    if book_ids:
+        transaction.on_commit(lambda: recommendation_cache.invalidate_books_and_neighbours(book_ids))
+
+
+@receiver(post_save, sender=Book)
+def invalidate_book_recommendations(sender, instance, **kwargs):
+    """Zmiana danych książki (tytuł, opis, cena) widoczna jest na listach jej sąsiadów"""
+    invalidate_on_commit([instance.pk])
+
+
+@receiver(pre_delete, sender=Book)
+def invalidate_deleted_book_recommendations(sender, instance, **kwargs):
+    """Sąsiedzi usuwanej książki - zanim kaskada usunie jej podobieństwa"""
+    affected_ids = {instance.pk} | recommendation_cache.neighbour_ids([instance.pk])
+    transaction.on_commit(lambda: recommendation_cache.invalidate_books(affected_ids))
+
+
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+@receiver(post_save, sender=BookCategory)
+@receiver(post_delete, sender=BookCategory)
+@receiver(post_save, sender=BookReview)
+@receiver(post_delete, sender=BookReview)
+def invalidate_related_book_recommendations(sender, instance, **kwargs):
+    """Autorzy, kategorie i oceny (średnia, liczba) książki są częścią odpowiedzi"""
+    invalidate_on_commit([instance.book_id])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.categories.through)
+def invalidate_m2m_book_recommendations(sender, instance, action, reverse, pk_set, **kwargs):
+    """book.authors.add()/remove()/clear() nie wysyła post_save modelu pośredniego"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_on_commit([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        # author.books.add(...) - pk_set to ID książek
+        invalidate_on_commit(pk_set or [])
+    elif action == 'pre_clear':
+        # Po clear() nie wiadomo już, których książek dotyczył
+        invalidate_on_commit(instance.books.values_list('id', flat=True))
@@ -1,3 +1,380 @@
-from django.test import TestCase
+import io
+import itertools
+import random
+import shutil
+import tempfile
+from collections import defaultdict
+from contextlib import redirect_stdout
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import views
+from .models import (
+    Author, Book, BookAuthor, BookCategory, BookReview, BookSimilarity, Category, SimilarityGeneration,
+    SimilarityRun, User, UserPreferenceProfile, UserSimilarity
+)
+from .services import recommendation_cache, similarity_service
+from .services.preference_matrix import PreferenceMatrix
+from .services.similarity_engine import SparseSimilarityEngine, SIMILARITY_FIELDS
+from .services.user_similarity_service import UserSimilarityService
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'recommendations': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+}
+
+WORDS = (
+    "dragon magic kingdom war love detective murder space ship alien family secret "
+    "journey ocean island history empire king queen city night forest"
+).split()
+
+
+def create_catalog(size=40, seed=3):
+    """
+    Mały, powtarzalny katalog: opis, słowa kluczowe, 1-2 kategorie, autor
+    """
+    rng = random.Random(seed)
+    categories = [Category.objects.create(name=name) for name in ('Fantasy', 'Crime', 'SciFi', 'Romance', 'History')]
+    authors = [Author.objects.create(first_name=f'First{i}', last_name=f'Last{i}') for i in range(8)]
+
+    for i in range(size):
+        book = Book.objects.create(
+            title=f'Book {i}',
+            description=' '.join(rng.choices(WORDS, k=25)),
+            keywords=', '.join(rng.sample(WORDS, 3))
+        )
+        for category in rng.sample(categories, rng.randint(1, 2)):
+            BookCategory.objects.create(book=book, category=category)
+        BookAuthor.objects.create(book=book, author=rng.choice(authors))
+
+
+def live_similarities():
+    """
+    Opublikowane pary -> podobieństwa (zaokrąglone - float z bazy)
+    """
+    return {
+        (row['book1_id'], row['book2_id']): tuple(round(row[field], 9) for field in SIMILARITY_FIELDS)
+        for row in BookSimilarity.live().values('book1_id', 'book2_id', *SIMILARITY_FIELDS)
+    }
+
+
+class SimilarityServiceTestCase(TestCase):
+    """
+    Serwis z artefaktami (TF-IDF, magazyn sąsiadów, LSA) w katalogu tymczasowym
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog()
+
+    def setUp(self):
+        artifacts_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, artifacts_dir, ignore_errors=True)
+
+        with override_settings(ML_ARTIFACTS_DIR=artifacts_dir):
+            self.service = similarity_service.BookSimilarityService()
+
+    def run_quietly(self, method, *args, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return method(*args, **kwargs)
+
+    def calculate(self, **kwargs):
+        self.run_quietly(self.service.calculate_all_similarities, **kwargs)
+        return live_similarities()
+
+
+class EngineParityTests(SimilarityServiceTestCase):
+
+    def test_sparse_engine_matches_pairwise(self):
+        pairwise = self.calculate(engine='pairwise')
+        sparse = self.calculate(engine='sparse', block_size=7)
+
+        self.assertTrue(pairwise)
+        self.assertEqual(sparse, pairwise)
+
+    def test_sparse_engine_matches_pairwise_top_k(self):
+        pairwise = self.calculate(engine='pairwise', top_k=5)
+        sparse = self.calculate(engine='sparse', block_size=7, top_k=5)
+
+        self.assertEqual(sparse, pairwise)
+
+    def test_workers_match_single_process(self):
+        rng = np.random.default_rng(0)
+        vectors = [
+            {f'{aspect}_vector': {f'f{k}': float(rng.random()) for k in rng.integers(0, 40, size=4)}
+             for aspect in ('category', 'keyword', 'author', 'description')}
+            for _ in range(200)
+        ]
+        book_ids = list(range(1, 201))
+
+        def collect(workers, top_k):
+            engine = SparseSimilarityEngine(
+                self.service.category_weights, min_similarity=0.05, block_size=32, top_k=top_k
+            )
+            matrices = engine.build_matrices(vectors)
+            pairs = {}
+            for batch in engine.iter_similarity_batches(matrices, book_ids, workers=workers):
+                for i, (book1, book2) in enumerate(zip(batch['book1_id'], batch['book2_id'])):
+                    pairs[(int(book1), int(book2))] = tuple(float(batch[field][i]) for field in SIMILARITY_FIELDS)
+            return pairs
+
+        for top_k in (None, 5):
+            with self.subTest(top_k=top_k):
+                self.assertEqual(collect(3, top_k), collect(1, top_k))
+
+
+class IncrementalParityTests(SimilarityServiceTestCase):
+
+    def test_incremental_update_matches_full_run(self):
+        self.calculate(engine='sparse')
+
+        books = list(Book.objects.order_by('id')[:3])
+        for book in books:
+            book.description = 'space alien ship ocean dragon'
+            book.save()
+        Book.objects.filter(id=books[1].id).update(keywords='war, love')
+
+        self.run_quietly(self.service.calculate_incremental_similarities)
+        incremental = live_similarities()
+
+        self.assertEqual(incremental, self.calculate(engine='sparse'))
+
+
+class ResumeParityTests(SimilarityServiceTestCase):
+
+    def interrupt_and_resume(self, engine, top_k=None):
+        original_checkpoint = similarity_service.RunProgress.checkpoint
+
+        def interrupted_checkpoint(progress, completed_units, last_book_id=None):
+            original_checkpoint(progress, completed_units, last_book_id)
+            if completed_units == 3:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(similarity_service.RunProgress, 'checkpoint', interrupted_checkpoint):
+            with self.assertRaises(KeyboardInterrupt):
+                self.calculate(engine=engine, block_size=7, top_k=top_k)
+
+        run = SimilarityRun.get_resumable()
+        self.assertIsNotNone(run)
+        # Sparse: blok przerwany razem z checkpointem jest wycofywany
+        self.assertIn(run.completed_units, (2, 3))
+        self.assertLess(run.completed_units, run.total_units)
+
+        return self.calculate(resume=True)
+
+    def test_resumed_run_matches_uninterrupted(self):
+        for engine in ('sparse', 'pairwise'):
+            for top_k in (None, 5):
+                with self.subTest(engine=engine, top_k=top_k):
+                    uninterrupted = self.calculate(engine=engine, block_size=7, top_k=top_k)
+                    resumed = self.interrupt_and_resume(engine, top_k)
+
+                    self.assertEqual(resumed, uninterrupted)
+                    self.assertIsNone(SimilarityRun.get_resumable())
+
+    def test_interrupted_run_keeps_published_generation(self):
+        published = self.calculate(engine='sparse', block_size=7)
+        original_checkpoint = similarity_service.RunProgress.checkpoint
+
+        def interrupted_checkpoint(progress, completed_units, last_book_id=None):
+            original_checkpoint(progress, completed_units, last_book_id)
+            raise KeyboardInterrupt
+
+        with mock.patch.object(similarity_service.RunProgress, 'checkpoint', interrupted_checkpoint):
+            with self.assertRaises(KeyboardInterrupt):
+                self.calculate(engine='sparse', block_size=7)
+
+        self.assertEqual(live_similarities(), published)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecommendationCacheInvalidationTests(SimilarityServiceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calculate(engine='sparse', top_k=5)
+        self.book = Book.objects.order_by('id').first()
+        self.neighbour_id = self.neighbours(self.book.id)[0]
+        listing_ids = {self.book.id, self.neighbour_id, *self.neighbours(self.neighbour_id)}
+        self.unrelated = Book.objects.exclude(id__in=listing_ids).order_by('id').first()
+
+    def neighbours(self, book_id):
+        return sorted(recommendation_cache.neighbour_ids([book_id]))
+
+    def tokens(self):
+        return (
+            recommendation_cache.book_token(self.book.id),
+            recommendation_cache.book_token(self.unrelated.id),
+            SimilarityGeneration.get_cache_version(),
+        )
+
+    def assert_only_listing_books_invalidated(self, change):
+        book_token, unrelated_token, cache_version = self.tokens()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+        self.assertGreater(recommendation_cache.book_token(self.book.id), book_token)
+        self.assertEqual(recommendation_cache.book_token(self.unrelated.id), unrelated_token)
+        self.assertEqual(SimilarityGeneration.get_cache_version(), cache_version)
+
+    def test_review_invalidates_books_listing_the_reviewed_book(self):
+        user = User.objects.create_user(email='reader@example.com', username='reader', password='x')
+        self.assert_only_listing_books_invalidated(
+            lambda: BookReview.objects.create(user=user, book_id=self.neighbour_id, rating=8)
+        )
+
+    def test_m2m_change_invalidates_books_listing_the_book(self):
+        author = Author.objects.create(first_name='New', last_name='Author')
+        neighbour = Book.objects.get(id=self.neighbour_id)
+        self.assert_only_listing_books_invalidated(lambda: neighbour.authors.add(author))
+        self.assert_only_listing_books_invalidated(lambda: author.books.clear())
+
+    def test_deleted_book_invalidates_its_neighbours(self):
+        self.assert_only_listing_books_invalidated(lambda: Book.objects.get(id=self.neighbour_id).delete())
+
+
+class UserSimilarityTestCase(TestCase):
+    """
+    Użytkownicy z losowymi ocenami i profilami preferencji (część bez profilu)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog(size=30)
+        rng = random.Random(5)
+        books = list(Book.objects.order_by('id'))
+        categories = list(Category.objects.values_list('name', flat=True))
+
+        for i in range(14):
+            user = User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='x')
+            for book in rng.sample(books, rng.randint(0, 12)):
+                BookReview.objects.create(user=user, book=book, rating=rng.randint(1, 10))
+            if i % 4:
+                UserPreferenceProfile.objects.create(
+                    user=user,
+                    preferred_categories={name: rng.random() for name in rng.sample(categories, 3)},
+                    preferred_authors=rng.sample(range(8), rng.randint(0, 3)),
+                    preferred_publishers=rng.sample(range(4), rng.randint(0, 2))
+                )
+
+    def setUp(self):
+        self.service = UserSimilarityService()
+        self.users = list(User.objects.order_by('id'))
+
+    def run_quietly(self, method, *args, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return method(*args, **kwargs)
+
+
+class UserSimilarityParityTests(UserSimilarityTestCase):
+
+    def pairwise_similarities(self):
+        expected = {}
+        for user1, user2 in itertools.combinations(self.users, 2):
+            scores = self.service.calculate_similarity_between_users(user1, user2)
+            if scores['combined_similarity'] >= self.service.min_similarity_threshold:
+                expected[(user1.id, user2.id)] = scores
+        return expected
+
+    def test_matrix_matches_pairwise(self):
+        expected = self.pairwise_similarities()
+        self.assertTrue(expected)
+
+        for block_size in (500, 4):
+            with self.subTest(block_size=block_size):
+                self.run_quietly(self.service.calculate_all_similarities, block_size=block_size)
+                stored = {(row.user1_id, row.user2_id): row for row in UserSimilarity.objects.all()}
+
+                self.assertEqual(set(stored), set(expected))
+                for pair, scores in expected.items():
+                    for field in ('preference_similarity', 'rating_similarity', 'combined_similarity'):
+                        self.assertAlmostEqual(getattr(stored[pair], field), scores[field], places=9)
+
+    def test_single_user_matches_pairwise(self):
+        target = self.users[3]
+        expected = {pair for pair in self.pairwise_similarities() if target.id in pair}
+
+        self.run_quietly(self.service.calculate_similarities_for_user, target)
+
+        self.assertEqual({(row.user1_id, row.user2_id) for row in UserSimilarity.objects.all()}, expected)
+
+
+class PreferenceMatrixParityTests(UserSimilarityTestCase):
+
+    def test_preference_matrix_matches_pairwise(self):
+        profiles = {profile.user_id: profile for profile in UserPreferenceProfile.objects.all()}
+        user_ids = [user.id for user in self.users]
+        matrix = PreferenceMatrix.from_profiles(user_ids, profiles).similarity_rows(range(len(user_ids))).toarray()
+
+        for (row1, user1), (row2, user2) in itertools.combinations(enumerate(user_ids), 2):
+            expected = self.service.calculate_preference_similarity(profiles.get(user1), profiles.get(user2))
+            self.assertAlmostEqual(matrix[row1, row2], expected, places=9)
+            self.assertAlmostEqual(matrix[row2, row1], expected, places=9)
+
+
+class CollaborativeRecommendationParityTests(UserSimilarityTestCase):
+
+    def pairwise_recommendations(self, user, min_similarity):
+        """
+        Poprzednia implementacja - jedno zapytanie o oceny na podobnego użytkownika
+        """
+        reviewed = set(BookReview.objects.filter(user=user).values_list('book_id', flat=True))
+        scores = defaultdict(float)
+        for similar in UserSimilarity.get_similar_users(user, limit=20, min_similarity=min_similarity):
+            for review in BookReview.objects.filter(user=similar['user'], rating__gte=7).exclude(book_id__in=reviewed):
+                scores[review.book_id] += similar['similarity'] * review.rating / 10.0
+        return scores
+
+    def test_aggregated_scores_match_pairwise(self):
+        self.run_quietly(self.service.calculate_all_similarities)
+        self.assertTrue(UserSimilarity.objects.exists())
+
+        recommended = 0
+        for user in self.users:
+            with self.subTest(user=user.username):
+                expected = self.pairwise_recommendations(user, min_similarity=0.3)
+                recommendations = self.run_quietly(
+                    self.service.get_collaborative_recommendations, user, limit=500, min_similarity=0.3
+                )
+                scores = {item['book'].id: item['recommendation_score'] for item in recommendations}
+
+                self.assertEqual(set(scores), set(expected))
+                recommended += bool(scores)
+                for book_id, score in expected.items():
+                    self.assertAlmostEqual(scores[book_id], score, places=9)
+                # Kolejność malejąca po wyniku
+                ordered = [item['recommendation_score'] for item in recommendations]
+                self.assertEqual(ordered, sorted(ordered, reverse=True))
+
+        self.assertTrue(recommended)
+
+
+class BatchRecommendationQueryTests(SimilarityServiceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calculate(engine='sparse', top_k=5)
+        self.book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[:8])
+
+    def query_count(self, book_ids):
+        request = RequestFactory().get(
+            '/api/books/similar/batch/', {'ids': ','.join(map(str, book_ids)), 'details': 'true', 'limit': 3}
+        )
+        with mock.patch.object(views, 'get_similarity_service', return_value=self.service), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.run_quietly(views.batch_book_recommendations, request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), len(book_ids))
+        return len(queries)
+
+    def test_query_count_independent_of_batch_size(self):
+        for store in (True, False):
+            with self.subTest(neighbour_store=store):
+                if not store:
+                    self.run_quietly(self.service.discard_neighbour_store)
+                self.assertEqual(self.query_count(self.book_ids[:2]), self.query_count(self.book_ids))
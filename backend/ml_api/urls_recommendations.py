@@ -7,4 +7,6 @@ urlpatterns = [
     path('collaborative/me/', views_recommendations.collaborative_recommendations, name='collaborative_me'),
     path('collaborative/<int:user_id>/', views_recommendations.collaborative_recommendations, name='collaborative_for_user'),
     path('collaborative/', views_recommendations.collaborative_recommendations, name='collaborative'),
+    path('item-based/me/', views_recommendations.item_based_recommendations, name='item_based_me'),
+    path('mf/me/', views_recommendations.matrix_factorization_recommendations, name='mf_me'),
 ]
\ No newline at end of file
@@ -1,9 +1,14 @@
 from django.shortcuts import render
 from django.http import JsonResponse
+from django.db.models import Avg, Count
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .models import Book, Author, Category, User, BookReview, BookSimilarity
-from .services.similarity_service import BookSimilarityService
+from .models import Book, Author, Category, User, BookReview, BookSimilarity, SimilarityGeneration
+from .services.similarity_service import get_similarity_service
+from .services import recommendation_cache
+
+# Maksymalna liczba książek w jednym zapytaniu batch_book_recommendations
+MAX_BATCH_BOOKS = 50
 
 @api_view(['GET'])
 def featured_books(request):
@@ -117,15 +122,27 @@ def stats(request):
 def book_recommendations(request, book_id):
     """API endpoint dla rekomendacji książek"""
     try:
-        book = Book.objects.get(id=book_id)
-        
         # Parametry
         limit = min(int(request.GET.get('limit', 10)), 50)  # Max 50
         min_similarity = float(request.GET.get('min_similarity', 0.1))
         include_details = request.GET.get('details', 'false').lower() == 'true'
         
-        # Użyj serwisu do znalezienia podobnych książek
-        service = BookSimilarityService()
+        # Cache odpowiedzi - wersja rośnie po przeliczeniu, token książki po
+        # zmianie jej danych, danych jej sąsiadów albo dopisaniu sąsiadów
+        cache = recommendation_cache.get_cache()
+        cache_key = recommendation_cache.book_recommendations_key(
+            book_id, limit, min_similarity, include_details, cache=cache
+        )
+        cache_version = SimilarityGeneration.get_cache_version()
+        
+        cached_response = cache.get(cache_key, version=cache_version)
+        if cached_response is not None:
+            return Response(cached_response)
+        
+        book = Book.objects.get(id=book_id)
+        
+        # Użyj serwisu do znalezienia podobnych książek (singleton na proces)
+        service = get_similarity_service()
         similar_books = service.get_similar_books(
             book, 
             limit=limit, 
@@ -133,37 +150,12 @@ def book_recommendations(request, book_id):
         )
         
         # Przygotuj dane odpowiedzi
-        recommendations = []
-        for similarity_data in similar_books:
-            similar_book = similarity_data['book']
-            
-            book_data = {
-                'id': similar_book.id,
-                'title': similar_book.title,
-                'authors': similar_book.author_names,
-                'price': str(similar_book.price) if similar_book.price else None,
-                'publish_year': similar_book.publish_year,
-                'average_rating': float(similar_book.average_rating) if similar_book.average_rating else 0,
-                'ratings_count': similar_book.ratings_count,
-                'description': (similar_book.description[:200] + '...') if similar_book.description and len(similar_book.description) > 200 else similar_book.description,
-                'cover_image_url': similar_book.cover_image_url,
-                'categories': [cat.name for cat in similar_book.categories.all()],
-                'similarity_score': round(similarity_data['similarity'], 4),
-            }
-            
-            # Dodaj szczegóły podobieństwa jeśli wymagane
-            if include_details and 'details' in similarity_data:
-                book_data['similarity_details'] = {
-                    'category_similarity': round(similarity_data['details']['category'], 4),
-                    'keyword_similarity': round(similarity_data['details']['keyword'], 4),
-                    'author_similarity': round(similarity_data['details']['author'], 4),
-                    'description_similarity': round(similarity_data['details']['description'], 4),
-                    'reason': generate_similarity_reason(similarity_data)
-                }
-            
-            recommendations.append(book_data)
+        recommendations = [
+            serialize_similar_book(similarity_data, include_details)
+            for similarity_data in similar_books
+        ]
         
-        return Response({
+        response_data = {
             'status': 'success',
             'book': {
                 'id': book.id,
@@ -177,7 +169,10 @@ def book_recommendations(request, book_id):
                 'min_similarity': min_similarity,
                 'include_details': include_details
             }
-        })
+        }
+        cache.set(cache_key, response_data, version=cache_version)
+        
+        return Response(response_data)
         
     except Book.DoesNotExist:
         return Response({
@@ -190,6 +185,124 @@ def book_recommendations(request, book_id):
             'message': str(e)
         }, status=500)
 
+def serialize_similar_book(similarity_data, include_details=False):
+    """Dane polecanej książki w odpowiedzi API (oceny z adnotacji, jeśli są)"""
+    similar_book = similarity_data['book']
+    
+    # Adnotacje z get_similar_books_batch (rating_avg/rating_count) są
+    # używane przez Book.average_rating/ratings_count bez dodatkowych zapytań
+    average_rating = similar_book.average_rating
+    ratings_count = similar_book.ratings_count
+    
+    book_data = {
+        'id': similar_book.id,
+        'title': similar_book.title,
+        'authors': similar_book.author_names,
+        'price': str(similar_book.price) if similar_book.price else None,
+        'publish_year': similar_book.publish_year,
+        'average_rating': float(average_rating) if average_rating else 0,
+        'ratings_count': ratings_count,
+        'description': (similar_book.description[:200] + '...') if similar_book.description and len(similar_book.description) > 200 else similar_book.description,
+        'cover_image_url': similar_book.cover_image_url,
+        'categories': [cat.name for cat in similar_book.categories.all()],
+        'similarity_score': round(similarity_data['similarity'], 4),
+    }
+    
+    # Dodaj szczegóły podobieństwa jeśli wymagane
+    if include_details and 'details' in similarity_data:
+        book_data['similarity_details'] = {
+            'category_similarity': round(similarity_data['details']['category'], 4),
+            'keyword_similarity': round(similarity_data['details']['keyword'], 4),
+            'author_similarity': round(similarity_data['details']['author'], 4),
+            'description_similarity': round(similarity_data['details']['description'], 4),
+            'reason': generate_similarity_reason(similarity_data)
+        }
+    
+    return book_data
+
+@api_view(['GET'])
+def batch_book_recommendations(request):
+    """Rekomendacje dla wielu książek w jednym wywołaniu (stała liczba zapytań)"""
+    try:
+        # ID książek: ?ids=1,2,3
+        raw_ids = [value for value in request.GET.get('ids', '').split(',') if value.strip()]
+        
+        try:
+            book_ids = list(dict.fromkeys(int(book_id) for book_id in raw_ids))
+        except (TypeError, ValueError):
+            return Response({
+                'status': 'error',
+                'message': 'Book IDs must be integers'
+            }, status=400)
+        
+        if not book_ids:
+            return Response({
+                'status': 'error',
+                'message': 'No book IDs provided'
+            }, status=400)
+        
+        if len(book_ids) > MAX_BATCH_BOOKS:
+            return Response({
+                'status': 'error',
+                'message': f'Too many books (max {MAX_BATCH_BOOKS})'
+            }, status=400)
+        
+        # Parametry (jak w book_recommendations)
+        limit = min(int(request.GET.get('limit', 10)), 50)  # Max 50
+        min_similarity = float(request.GET.get('min_similarity', 0.1))
+        include_details = request.GET.get('details', 'false').lower() == 'true'
+        
+        books = Book.objects.prefetch_related('authors').in_bulk(book_ids)
+        found_ids = [book_id for book_id in book_ids if book_id in books]
+        
+        # Polecane książki jednym zapytaniem z ocenami, autorami i kategoriami
+        recommended_books = Book.objects.annotate(
+            rating_avg=Avg('reviews__rating'),
+            rating_count=Count('reviews')
+        ).prefetch_related('authors', 'categories')
+        
+        service = get_similarity_service()
+        similar_books = service.get_similar_books_batch(
+            found_ids,
+            limit=limit,
+            min_similarity=min_similarity,
+            books_queryset=recommended_books
+        )
+        
+        results = {}
+        for book_id in found_ids:
+            book = books[book_id]
+            recommendations = [
+                serialize_similar_book(similarity_data, include_details)
+                for similarity_data in similar_books[book_id]
+            ]
+            results[str(book_id)] = {
+                'book': {
+                    'id': book.id,
+                    'title': book.title,
+                    'authors': book.author_names
+                },
+                'recommendations': recommendations,
+                'count': len(recommendations)
+            }
+        
+        return Response({
+            'status': 'success',
+            'results': results,
+            'missing': [book_id for book_id in book_ids if book_id not in books],
+            'parameters': {
+                'limit': limit,
+                'min_similarity': min_similarity,
+                'include_details': include_details
+            }
+        })
+        
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
 def generate_similarity_reason(similarity_data):
     """Generuj tekstowe uzasadnienie podobieństwa"""
     details = similarity_data.get('details', {})
@@ -215,18 +328,18 @@ def similarity_stats(request):
     try:
         from django.db.models import Avg, Max, Min, Count
         
+        # Tylko opublikowana generacja serwowanej metody (bez przebiegów w toku i LSA/aspektów)
+        live = BookSimilarity.live().aggregate(
+            count=Count('id'), avg=Avg('cosine_similarity'),
+            max=Max('cosine_similarity'), min=Min('cosine_similarity')
+        )
+        
         stats = {
-            'total_similarities': BookSimilarity.objects.count(),
+            'total_similarities': live['count'],
             'total_books': Book.objects.count(),
-            'avg_similarity': BookSimilarity.objects.aggregate(
-                avg=Avg('cosine_similarity')
-            )['avg'] or 0,
-            'max_similarity': BookSimilarity.objects.aggregate(
-                max=Max('cosine_similarity')
-            )['max'] or 0,
-            'min_similarity': BookSimilarity.objects.aggregate(
-                min=Min('cosine_similarity')
-            )['min'] or 0,
+            'avg_similarity': live['avg'] or 0,
+            'max_similarity': live['max'] or 0,
+            'min_similarity': live['min'] or 0,
         }
         
         # Dodaj coverage percentage
@@ -238,18 +351,14 @@ def similarity_stats(request):
             stats['coverage_percentage'] = 0
         
         # Top books by similarity count
-        top_books = Book.objects.annotate(
-            similarity_count=Count('similarities_as_book1') + Count('similarities_as_book2')
-        ).order_by('-similarity_count')[:10]
-        
         stats['top_similar_books'] = [
             {
                 'id': book.id,
                 'title': book.title,
                 'authors': book.author_names,
-                'similarity_count': book.similarity_count
+                'similarity_count': similarity_count
             }
-            for book in top_books
+            for book, similarity_count in BookSimilarity.most_connected_books(limit=10)
         ]
         
         return Response({
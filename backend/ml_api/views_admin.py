@@ -32,7 +32,7 @@ def admin_dashboard_stats(request):
         total_categories = Category.objects.count()
         
         # Similarity stats
-        book_similarities = BookSimilarity.objects.count()
+        book_similarities = BookSimilarity.live().count()
         user_similarities = UserSimilarity.objects.count()
         
         # User engagement
@@ -425,7 +425,7 @@ def system_health(request):
         
         # Check similarity coverage
         total_books = Book.objects.count()
-        total_similarities = BookSimilarity.objects.count()
+        total_similarities = BookSimilarity.live().count()
         max_possible = (total_books * (total_books - 1)) / 2 if total_books > 1 else 0
         similarity_coverage = (total_similarities / max_possible * 100) if max_possible > 0 else 0
         
@@ -4,6 +4,8 @@ from rest_framework.response import Response
 
 from .models import User
 from .services.user_similarity_service import get_user_similarity_service
+from .services.item_cf_service import get_item_cf_service
+from .services.mf_service import get_mf_service
 from .serializers import BookListSerializer
 
 
@@ -61,4 +63,97 @@ def collaborative_recommendations(request, user_id=None):
             'message': str(e),
             'recommendations': [],
             'count': 0
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def item_based_recommendations(request):
+    """
+    Get item-based collaborative filtering recommendations
+    Based on books similar to the ones the user rated highly
+    """
+    user = request.user
+    limit = min(int(request.GET.get('limit', 24)), 50)
+
+    try:
+        recommendations = get_item_cf_service().get_recommendations(user, limit=limit)
+
+        results = []
+        for rec in recommendations:
+            book_data = BookListSerializer(rec['book']).data
+            book_data['recommendation_score'] = round(rec['recommendation_score'], 4)
+            book_data['recommendation_type'] = rec['recommendation_type']
+            book_data['recommendation_reason'] = rec['reason']
+            results.append(book_data)
+
+        return Response({
+            'status': 'success',
+            'user': {
+                'id': user.id,
+                'username': user.username
+            },
+            'recommendations': results,
+            'count': len(results),
+            'method': 'item_based_filtering'
+        })
+
+    except Exception as e:
+        print(f"Error in item-based recommendations: {e}")
+        import traceback
+        traceback.print_exc()
+
+        return Response({
+            'status': 'error',
+            'message': str(e),
+            'recommendations': [],
+            'count': 0
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def matrix_factorization_recommendations(request):
+    """
+    Get matrix factorization recommendations
+    Scores the whole catalog against the user's latent factors
+    """
+    user = request.user
+    limit = min(int(request.GET.get('limit', 24)), 50)
+
+    try:
+        service = get_mf_service()
+        recommendations = service.get_recommendations(user, limit=limit)
+        model = service.get_model()
+
+        results = []
+        for rec in recommendations:
+            book_data = BookListSerializer(rec['book']).data
+            book_data['recommendation_score'] = round(rec['recommendation_score'], 4)
+            book_data['recommendation_type'] = rec['recommendation_type']
+            book_data['recommendation_reason'] = rec['reason']
+            results.append(book_data)
+
+        return Response({
+            'status': 'success',
+            'user': {
+                'id': user.id,
+                'username': user.username
+            },
+            'recommendations': results,
+            'count': len(results),
+            'method': 'matrix_factorization',
+            'model_version': model.version if model else None
+        })
+
+    except Exception as e:
+        print(f"Error in matrix factorization recommendations: {e}")
+        import traceback
+        traceback.print_exc()
+
+        return Response({
+            'status': 'error',
+            'message': str(e),
+            'recommendations': [],
+            'count': 0
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)